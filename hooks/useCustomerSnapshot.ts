@@ -35,30 +35,77 @@ export interface CustomerSnapshot {
     }[];
 }
 
+type SnapshotAccount = CustomerSnapshot["accounts"][number];
+
+type SnapshotEvent =
+    | { type: "customer"; customer_id: string; customer: any; account_count: number }
+    | { type: "account"; index: number; account_id: string | null; data: SnapshotAccount }
+    | { type: "done"; accounts: number }
+    | { type: "error"; error: string };
+
+/**
+ * Loads a customer snapshot from the streaming endpoint. `data.accounts`
+ * fills in, in account order, as each account finishes loading on the
+ * server, so the first ones can render while `loading` is still true.
+ */
 export function useCustomerSnapshot(customerId: string) {
     const [data, setData] = useState<CustomerSnapshot | null>(null);
     const [loading, setLoading] = useState(true);
     const [error, setError] = useState<string | null>(null);
 
-    const refresh = () => {
+    const refresh = async () => {
         setLoading(true);
         const API_BASE_URL = process.env.EXPO_PUBLIC_API_BASE_URL ?? "http://localhost:5001";
-        fetch(`${API_BASE_URL}/api/capitalone/customer/${customerId}/snapshot`)
-            .then((r) => {
-                if (!r.ok) throw new Error(`HTTP error! status: ${r.status}`);
-                return r.json();
-            })
-            .then((j) => {
-                setData(j);
-                setError(null);
-            })
-            .catch((e) => {
-                console.error("Snapshot error:", e);
-                setError(String(e));
-            })
-            .finally(() => {
-                setLoading(false);
-            });
+        const slots: (SnapshotAccount | undefined)[] = [];
+
+        const handleEvent = (event: SnapshotEvent) => {
+            if (event.type === "customer") {
+                slots.length = event.account_count;
+                setData({ customer_id: event.customer_id, accounts: [] });
+            } else if (event.type === "account") {
+                slots[event.index] = event.data;
+                const accounts = slots.filter((a): a is SnapshotAccount => a !== undefined);
+                setData((prev) => ({ customer_id: prev?.customer_id ?? customerId, accounts }));
+            } else if (event.type === "error") {
+                throw new Error(event.error);
+            }
+        };
+
+        const handleLines = (text: string) => {
+            for (const line of text.split("\n")) {
+                if (line.trim()) handleEvent(JSON.parse(line));
+            }
+        };
+
+        try {
+            const r = await fetch(`${API_BASE_URL}/api/capitalone/customer/${customerId}/snapshot/stream`);
+            if (!r.ok) throw new Error(`HTTP error! status: ${r.status}`);
+
+            const reader = r.body?.getReader();
+            if (!reader) {
+                // No streaming body on this platform: same events, all at once
+                handleLines(await r.text());
+            } else {
+                const decoder = new TextDecoder();
+                let buffer = "";
+                while (true) {
+                    const { done, value } = await reader.read();
+                    if (done) break;
+                    buffer += decoder.decode(value, { stream: true });
+                    const end = buffer.lastIndexOf("\n");
+                    if (end === -1) continue;
+                    handleLines(buffer.slice(0, end));
+                    buffer = buffer.slice(end + 1);
+                }
+                handleLines(buffer);
+            }
+            setError(null);
+        } catch (e) {
+            console.error("Snapshot error:", e);
+            setError(String(e));
+        } finally {
+            setLoading(false);
+        }
     };
 
     useEffect(() => {
@@ -0,0 +1,83 @@
+"""
+Adaptive concurrency limit for upstream calls
+
+AdaptiveLimiter works like a semaphore whose size follows the upstream's
+health (additive increase, multiplicative decrease). Each call that ends
+in an overload signal, such as a 429, a 503 or a timeout, halves the
+limit. Every `limit` calls that succeed raise it by one, back up to
+`max_limit`. A burst of overloaded replies counts as one decrease: only
+calls admitted since the last cut can cut again, so the limit does not
+collapse to the minimum on a single bad second.
+
+Waiters are futures on the running event loop, so a limiter belongs to
+one loop at a time. Give each client its own limiter rather than sharing
+one across threads. An idle limiter moves to whichever loop uses it next.
+"""
+
+import asyncio
+from collections import deque
+
+
+class AdaptiveLimiter:
+    def __init__(self, max_limit: int, min_limit: int = 1):
+        self.max_limit = max(1, max_limit)
+        self.min_limit = max(1, min(min_limit, self.max_limit))
+        self.limit = self.max_limit
+        self.in_flight = 0
+        self._waiters: deque[asyncio.Future] = deque()
+        self._successes = 0
+        self._epoch = 0
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self.stats = {"waited": 0, "decreases": 0, "increases": 0}
+
+    async def acquire(self) -> int:
+        """Wait for a slot. Returns a token to hand back to release()."""
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            if self.in_flight or self._waiters:
+                raise RuntimeError("AdaptiveLimiter is in use on another event loop")
+            self._loop = loop
+        if self.in_flight < self.limit and not self._waiters:
+            self.in_flight += 1
+            return self._epoch
+
+        waiter = loop.create_future()
+        self._waiters.append(waiter)
+        self.stats["waited"] += 1
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # Granted a slot just as we were cancelled: pass it on
+                self.in_flight -= 1
+                self._wake()
+            elif waiter in self._waiters:
+                self._waiters.remove(waiter)
+            raise
+        return self._epoch
+
+    def release(self, token: int, overloaded: bool = False):
+        self.in_flight -= 1
+        if overloaded:
+            if token == self._epoch and self.limit > self.min_limit:
+                self.limit = max(self.min_limit, self.limit // 2)
+                self.stats["decreases"] += 1
+                self._epoch += 1
+            self._successes = 0
+        else:
+            self._successes += 1
+            if self._successes >= self.limit and self.limit < self.max_limit:
+                self.limit += 1
+                self._successes = 0
+                self.stats["increases"] += 1
+        self._wake()
+
+    def _wake(self):
+        while self._waiters and self.in_flight < self.limit:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+    def snapshot(self) -> dict:
+        return {"limit": self.limit, "in_flight": self.in_flight, "queued": len(self._waiters), **self.stats}
@@ -0,0 +1,71 @@
+"""
+Signed user tokens
+
+The API partitions storage by user id, so the id has to come from a
+credential the caller cannot forge. issue_token() signs a user id and an
+expiry with HMAC-SHA256 under FINANCE_AUTH_SECRET; the app sends the token
+as `Authorization: Bearer <token>` and verify_token() gives the id back.
+
+Tokens come from POST /api/auth/token, which the service that signs users
+in calls with FINANCE_AUTH_ISSUER_KEY, or from the command line:
+    python auth.py <user_id> [--days 30]
+"""
+
+import argparse
+import base64
+import hashlib
+import hmac
+import os
+import time
+
+FINANCE_AUTH_SECRET = os.environ.get("FINANCE_AUTH_SECRET", "")
+TOKEN_TTL_SECONDS = int(os.environ.get("FINANCE_AUTH_TOKEN_TTL_SECONDS", str(30 * 24 * 3600)))
+# Held by the sign-in service that asks POST /api/auth/token for tokens
+FINANCE_AUTH_ISSUER_KEY = os.environ.get("FINANCE_AUTH_ISSUER_KEY", "")
+
+
+def _signature(payload: str, secret: str) -> str:
+    digest = hmac.new(secret.encode(), payload.encode(), hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest).rstrip(b"=").decode()
+
+
+def issue_token(user_id: str, secret: str = FINANCE_AUTH_SECRET, ttl: float = TOKEN_TTL_SECONDS) -> str:
+    """`<user_id>.<expiry>.<signature>`; user ids may contain dots"""
+    if not secret:
+        raise ValueError("FINANCE_AUTH_SECRET is not set")
+    payload = f"{user_id}.{int(time.time() + ttl)}"
+    return f"{payload}.{_signature(payload, secret)}"
+
+
+def verify_token(token: str, secret: str = FINANCE_AUTH_SECRET) -> str | None:
+    """The token's user id, or None if it is malformed, forged or expired"""
+    try:
+        user_id, expires, signature = token.rsplit(".", 2)
+        expires_at = int(expires)
+    except ValueError:
+        return None
+    if not secret or not user_id:
+        return None
+    if not hmac.compare_digest(signature, _signature(f"{user_id}.{expires}", secret)):
+        return None
+    if expires_at < time.time():
+        return None
+    return user_id
+
+
+def issuer_key_matches(key: str | None, issuer_key: str | None = None) -> bool:
+    """Whether `key` is the configured issuer key; never true while none is set"""
+    issuer_key = FINANCE_AUTH_ISSUER_KEY if issuer_key is None else issuer_key
+    return bool(issuer_key and key) and hmac.compare_digest(key.encode(), issuer_key.encode())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("user_id")
+    parser.add_argument("--days", type=float, default=TOKEN_TTL_SECONDS / 86400)
+    args = parser.parse_args()
+    print(issue_token(args.user_id, ttl=args.days * 86400))
+
+
+if __name__ == "__main__":
+    main()
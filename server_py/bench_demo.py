@@ -0,0 +1,100 @@
+"""
+Offline API load test on demo data
+
+Runs the app in process with EXPO_PUBLIC_DEMO_MODE=1, so Plaid is replaced
+by the seeded fixtures in demo_fixtures.py, and has every demo user page
+through their whole transaction history while also polling accounts and
+balances. Prints throughput and latency percentiles per endpoint. The same
+seed and sizes always produce the same data, so runs are comparable.
+
+Usage:
+    python bench_demo.py
+    python bench_demo.py --users 50 --days 1095 --daily 5 --page-size 200 --concurrency 32
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def run_load(app, fixtures, page_size: int, concurrency: int):
+    import httpx
+
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: dict[str, list[float]] = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+
+        async def call(endpoint, user_id, params=None):
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.get(endpoint, params=params, headers={"X-User-Id": user_id})
+                latencies.setdefault(endpoint, []).append(time.perf_counter() - start)
+            response.raise_for_status()
+            return response.json()
+
+        async def user_session(user_id):
+            await call("/api/plaid/accounts", user_id)
+            cursor, rows = None, 0
+            while True:
+                params = {"limit": page_size, **({"cursor": cursor} if cursor else {})}
+                page = await call("/api/plaid/transactions", user_id, params)
+                rows += len(page["transactions"])
+                cursor = page["next_cursor"]
+                if not cursor:
+                    break
+                if rows // page_size % 5 == 0:
+                    await call("/api/plaid/balance", user_id)
+            return rows
+
+        start = time.perf_counter()
+        rows = sum(await asyncio.gather(*(user_session(u) for u in fixtures.user_ids())))
+        elapsed = time.perf_counter() - start
+
+    print(f"{len(fixtures.user_ids())} users, {rows} transactions in {elapsed:.2f}s")
+    print(f"{'endpoint':<26} {'requests':>8} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8}")
+    for endpoint, samples in latencies.items():
+        print(
+            f"{endpoint:<26} {len(samples):>8} {len(samples) / elapsed:>8.1f} "
+            f"{statistics.median(samples) * 1000:>8.2f} {percentile(samples, 95) * 1000:>8.2f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--accounts", type=int, default=2)
+    parser.add_argument("--daily", type=float, default=3, help="Mean transactions per day")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=16, help="Requests in flight")
+    args = parser.parse_args()
+
+    os.environ["EXPO_PUBLIC_DEMO_MODE"] = "1"
+    # Demo users are picked by X-User-Id, which only the in-process app trusts
+    os.environ["FINANCE_TRUST_USER_HEADER"] = "1"
+    os.environ.setdefault("EXPO_PUBLIC_DEDALUS_API_KEY", "bench")
+    import main as app_main
+    from demo_fixtures import DemoFixtures
+
+    app_main.demo_fixtures = DemoFixtures(
+        seed=args.seed, users=args.users, accounts=args.accounts, days=args.days,
+        daily_transactions=args.daily,
+    )
+    asyncio.run(run_load(app_main.app, app_main.demo_fixtures, args.page_size, args.concurrency))
+
+
+if __name__ == "__main__":
+    main()
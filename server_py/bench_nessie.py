@@ -0,0 +1,99 @@
+"""
+Nessie client benchmark against the local stand-in
+
+Runs nessie_standin.py in process and has NessieClient fetch every stand-in
+customer's full snapshot (the account list, then seven requests per
+account) several times over. The first round is cold and the later ones
+are served from the read cache, so the output shows fan-out latency, cache
+hits and how many retries and hedges the profile's faults cost. The same
+profile and seed always serve the same data.
+
+Usage:
+    python bench_nessie.py
+    python bench_nessie.py --profile flaky --rounds 3 --no-cache
+"""
+
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+import httpx
+
+from adaptive_limiter import AdaptiveLimiter
+from nessie_client import NESSIE_MAX_CONCURRENCY, NESSIE_HOST_CONCURRENCY, NessieClient
+from nessie_standin import PROFILES, NessieStandIn, create_app
+
+ACCOUNT_SECTIONS = ["get_account", "get_account_bills", "get_account_deposits", "get_account_loans",
+                    "get_account_purchases", "get_account_transfers", "get_account_withdrawals"]
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def fetch_snapshot(client: NessieClient, customer_id: str) -> int:
+    accounts = await client.get_customer_accounts(customer_id)
+    results = await asyncio.gather(
+        client.get_customer(customer_id),
+        *(getattr(client, section)(a["_id"]) for a in accounts for section in ACCOUNT_SECTIONS),
+        return_exceptions=True,
+    )
+    return sum(isinstance(r, Exception) for r in results)
+
+
+async def run(standin: NessieStandIn, rounds: int, cache_enabled: bool):
+    client = NessieClient(
+        base_url="http://nessie.local", transport=httpx.ASGITransport(app=create_app(standin)),
+        cache_enabled=cache_enabled, limiter=AdaptiveLimiter(NESSIE_MAX_CONCURRENCY),
+        host_limiter=AdaptiveLimiter(NESSIE_HOST_CONCURRENCY),
+    )
+    customer_ids = list(standin.customers)
+    print(f"{'round':<6} {'snapshots':>9} {'failed':>6} {'p50 ms':>8} {'max ms':>8} {'upstream':>8} {'retries':>7} {'hedges':>6}")
+    try:
+        for round_number in range(1, rounds + 1):
+            before = dict(client.stats)
+            upstream_before = standin.stats["requests"]
+            latencies, failed = [], 0
+
+            async def timed(customer_id):
+                start = time.perf_counter()
+                errors = await fetch_snapshot(client, customer_id)
+                latencies.append(time.perf_counter() - start)
+                return errors
+
+            failed = sum(await asyncio.gather(*(timed(c) for c in customer_ids)))
+            print(
+                f"{round_number:<6} {len(latencies):>9} {failed:>6} "
+                f"{statistics.median(latencies) * 1000:>8.1f} {max(latencies) * 1000:>8.1f} "
+                f"{standin.stats['requests'] - upstream_before:>8} "
+                f"{client.stats['retries'] - before['retries']:>7} {client.stats['hedges'] - before['hedges']:>6}"
+            )
+        health = client.health()
+        print(f"stand-in: {standin.stats}")
+        print(f"cache: {health['cache']}")
+        print(f"breakers opened: {sum(b['opened'] for b in health['breakers'].values())}")
+    finally:
+        await client.aclose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profile", default="realistic", choices=list(PROFILES))
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--customers", type=int)
+    parser.add_argument("--no-cache", action="store_true", help="Disable the client's read cache")
+    args = parser.parse_args()
+
+    standin = NessieStandIn(profile=args.profile, seed=args.seed, customers=args.customers)
+    asyncio.run(run(standin, args.rounds, not args.no_cache))
+
+
+if __name__ == "__main__":
+    main()
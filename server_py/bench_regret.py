@@ -0,0 +1,138 @@
+"""
+Regret scoring benchmark
+
+Starts a fake OpenAI-compatible chat completions server on localhost, points
+ChatService at it via DEDALUS_BASE_URL and scores the same transactions at
+several batch sizes. The fake server charges a fixed latency per request
+plus a small amount per transaction, roughly how a hosted model behaves
+(round trip and prompt processing, then output tokens).
+
+Usage:
+    python bench_regret.py
+    python bench_regret.py --transactions 500 --batch-sizes 1,10,25,50 --latency 0.5
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import re
+import socket
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+import uvicorn
+from fastapi import FastAPI, Request
+
+TRANSACTION_ID = re.compile(r'"transaction_id": "([^"]+)"')
+
+
+def make_fake_server(latency: float, per_item: float, stats: dict) -> FastAPI:
+    fake = FastAPI()
+
+    @fake.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        transaction_ids = TRANSACTION_ID.findall(body["messages"][-1]["content"])
+        stats["requests"] += 1
+        await asyncio.sleep(latency + per_item * len(transaction_ids))
+        scores = [
+            {"transaction_id": tid, "score": hash(tid) % 101, "reason": "Benchmark score"}
+            for tid in transaction_ids
+        ]
+        return {
+            "id": f"chatcmpl-bench-{stats['requests']}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body["model"],
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": json.dumps({"scores": scores})},
+                "finish_reason": "stop",
+            }],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+        }
+
+    return fake
+
+
+def start_server(app: FastAPI) -> str:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{port}/v1"
+
+
+def make_transactions(count: int):
+    return [
+        {
+            "transaction_id": f"bench_txn_{i}",
+            "name": ["Starbucks", "Amazon", "Uber Eats", "Target"][i % 4],
+            "amount": round(5 + (i * 7.3) % 120, 2),
+            "date": f"2026-03-{i % 28 + 1:02d}",
+            "category": ["Food and Drink", "Restaurants"],
+            "payment_channel": "online",
+        }
+        for i in range(count)
+    ]
+
+
+async def score_all(service, transactions, batch_size: int, concurrency: int):
+    """Score in chunks of batch_size with at most `concurrency` calls in flight, like RegretQueue"""
+    semaphore = asyncio.Semaphore(concurrency)
+    profile = {"spending_regret": "Late-night delivery", "user_goals": "Save for a car", "top_categories": ["Food"]}
+
+    async def score_chunk(chunk):
+        async with semaphore:
+            return await service.analyze_transaction_regrets(chunk, profile)
+
+    chunks = [transactions[i:i + batch_size] for i in range(0, len(transactions), batch_size)]
+    results = {}
+    for part in await asyncio.gather(*(score_chunk(c) for c in chunks)):
+        results.update(part)
+    return results
+
+
+async def run_benchmark(chat, args, stats):
+    # One event loop for every run: the OpenAI client's connection pool is bound to it
+    service = chat.ChatService()
+    transactions = make_transactions(args.transactions)
+
+    print(f"{'batch':>6} {'requests':>9} {'seconds':>8} {'txn/s':>8}")
+    for batch_size in (int(b) for b in args.batch_sizes.split(",")):
+        chat.REGRET_BATCH_SIZE = batch_size
+        stats["requests"] = 0
+        start = time.perf_counter()
+        results = await score_all(service, transactions, batch_size, args.concurrency)
+        elapsed = time.perf_counter() - start
+        assert len(results) == len(transactions)
+        print(f"{batch_size:>6} {stats['requests']:>9} {elapsed:>8.2f} {len(transactions) / elapsed:>8.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--transactions", type=int, default=200)
+    parser.add_argument("--batch-sizes", default="1,5,20,50")
+    parser.add_argument("--concurrency", type=int, default=4, help="Calls in flight, as REGRET_WORKERS")
+    parser.add_argument("--latency", type=float, default=0.3, help="Fake server seconds per request")
+    parser.add_argument("--per-item", type=float, default=0.01, help="Fake server seconds per transaction")
+    args = parser.parse_args()
+
+    stats = {"requests": 0}
+    os.environ["DEDALUS_BASE_URL"] = start_server(make_fake_server(args.latency, args.per_item, stats))
+    os.environ.setdefault("EXPO_PUBLIC_DEDALUS_API_KEY", "bench")
+    import chat
+
+    asyncio.run(run_benchmark(chat, args, stats))
+
+
+if __name__ == "__main__":
+    main()
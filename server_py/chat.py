@@ -7,6 +7,11 @@ from openai import AsyncOpenAI
 # Load environment variables
 import dotenv; dotenv.load_dotenv()
 
+# OpenAI-compatible gateway; point at a local fake server for benchmarks
+DEDALUS_BASE_URL = os.environ.get("DEDALUS_BASE_URL", "https://api.dedaluslabs.ai/v1")
+# Transactions scored per LLM call by analyze_transaction_regrets()
+REGRET_BATCH_SIZE = int(os.environ.get("REGRET_BATCH_SIZE", "20"))
+
 class DedalusClient:
     def __init__(self):
         self.api_key = os.environ.get("EXPO_PUBLIC_DEDALUS_API_KEY")
@@ -14,7 +19,7 @@ class DedalusClient:
             print("Warning: EXPO_PUBLIC_DEDALUS_API_KEY not set")
             
         self.client = AsyncOpenAI(
-            base_url="https://api.dedaluslabs.ai/v1",
+            base_url=DEDALUS_BASE_URL,
             api_key=self.api_key
         )
 
@@ -248,6 +253,98 @@ Guidelines:
                 "top_categories": ["Food & Drink", "Shopping", "Travel", "Groceries", "Entertainment"]
             }
 
+    async def analyze_transaction_regret(self, transaction: Dict, user_profile: Dict = None) -> Dict:
+        """
+        Score how likely the user is to regret a purchase, 0-100. Unlike the
+        other analyses this raises on failure instead of returning a fallback,
+        so the regret queue can retry rather than store a made-up score.
+        """
+        results = await self.analyze_transaction_regrets([transaction], user_profile)
+        if transaction["transaction_id"] not in results:
+            raise ValueError(f"No regret score returned for {transaction['transaction_id']}")
+        return results[transaction["transaction_id"]]
+
+    async def analyze_transaction_regrets(self, transactions: List[Dict], user_profile: Dict = None) -> Dict[str, Dict]:
+        """
+        Score many transactions with one prompt per REGRET_BATCH_SIZE, sending
+        the profile once per batch. Returns {transaction_id: {score, reason}}.
+        A batch whose reply can't be parsed is split in half and retried;
+        transactions that still can't be scored are left out of the result.
+        API errors are raised.
+        """
+        results = {}
+        for start in range(0, len(transactions), REGRET_BATCH_SIZE):
+            results.update(await self._score_regret_batch(transactions[start:start + REGRET_BATCH_SIZE], user_profile))
+        return results
+
+    async def _score_regret_batch(self, transactions: List[Dict], user_profile: Dict) -> Dict[str, Dict]:
+        system_prompt = """You are a behavioral finance expert. Given a user's spending psychology, estimate how likely they are to regret each purchase.
+        
+        Output MUST be valid JSON with this structure, with one entry per transaction:
+        {
+            "scores": [
+                {
+                    "transaction_id": "string (copied from the input)",
+                    "score": integer (0-100, where 100 means almost certainly regretted),
+                    "reason": "string (one short sentence explaining the score)"
+                }
+            ]
+        }
+        """
+        
+        txn_lines = [
+            {
+                "transaction_id": t["transaction_id"],
+                "merchant": t.get("merchant_name") or t.get("name", "Unknown"),
+                "amount": t.get("amount", 0),
+                "date": t.get("date", "N/A"),
+                "category": " > ".join(t.get("category") or ["Uncategorized"]),
+                "channel": t.get("payment_channel", "unknown"),
+            }
+            for t in transactions
+        ]
+        user_prompt = f"""
+        Transactions:
+        {json.dumps(txn_lines, indent=2)}
+        
+        User Profile:
+        {json.dumps(user_profile if user_profile else {}, indent=2)}
+        """
+        
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ]
+        
+        response = await self.dedalus_client.chat_completion("openai/gpt-4o-mini", messages, stream=False)
+        content = response.choices[0].message.content or ""
+        # Strip potential markdown code blocks if present
+        content = content.replace("```json", "").replace("```", "").strip()
+        
+        wanted = {t["transaction_id"] for t in transactions}
+        results = {}
+        try:
+            for entry in json.loads(content)["scores"]:
+                transaction_id = str(entry["transaction_id"])
+                if transaction_id in wanted:
+                    results[transaction_id] = {
+                        "score": max(0, min(100, int(entry["score"]))),
+                        "reason": str(entry.get("reason", "")),
+                    }
+        except (ValueError, KeyError, TypeError) as e:
+            print(f"Could not parse regret scores for {len(transactions)} transactions: {e}")
+            results = {}
+        
+        missing = [t for t in transactions if t["transaction_id"] not in results]
+        if missing and len(transactions) > 1:
+            # Long replies are the ones that get truncated or malformed, so
+            # retry what is missing in two smaller prompts
+            half = (len(missing) + 1) // 2
+            for part in (missing[:half], missing[half:]):
+                if part:
+                    results.update(await self._score_regret_batch(part, user_profile))
+        return results
+
     async def generate_behavioral_summary(self, transactions: List[Dict], user_profile: Dict = None) -> str:
         if not transactions:
             return "No transaction data available for analysis."
@@ -0,0 +1,10 @@
+"""
+Shared pytest setup for server_py
+"""
+
+import os
+
+# The suites identify users with X-User-Id, or not at all for the default
+# user; production requires signed tokens
+os.environ.setdefault("FINANCE_TRUST_USER_HEADER", "1")
+os.environ.setdefault("FINANCE_ALLOW_ANONYMOUS", "1")
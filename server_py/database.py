@@ -1,44 +1,75 @@
 import sqlite3
 import json
 import os
-from datetime import datetime
+import time
+from datetime import datetime, timedelta
 
-DB_PATH = os.path.join(os.path.dirname(__file__), "finance.db")
+DEFAULT_DB_PATH = os.path.join(os.path.dirname(__file__), "finance.db")
+DB_PATH = DEFAULT_DB_PATH
+
+# Empty or sqlite:///path -> local SQLite file; postgres:// -> database_postgres
+FINANCE_DATABASE_URL = os.environ.get("FINANCE_DATABASE_URL", "")
+
+_backend = None  # PostgresBackend when configured for Postgres
+
+def configure(database_url: str = ""):
+    """Select the storage backend and make sure its schema exists"""
+    global DB_PATH, _backend
+    if _backend is not None:
+        _backend.close()
+        _backend = None
+    
+    if database_url.startswith(("postgres://", "postgresql://")):
+        from database_postgres import PostgresBackend
+        _backend = PostgresBackend(database_url)
+    elif database_url.startswith("sqlite:///"):
+        DB_PATH = database_url[len("sqlite:///"):]
+    else:
+        DB_PATH = DEFAULT_DB_PATH
+    
+    init_db()
+
+def is_postgres():
+    return _backend is not None
 
 def get_db_connection():
+    if _backend is not None:
+        return _backend.connect()
     conn = sqlite3.connect(DB_PATH)
     conn.row_factory = sqlite3.Row
     return conn
 
-def init_db():
-    conn = get_db_connection()
-    c = conn.cursor()
-    
+# Rows written before per-user partitioning belong to this user, as do
+# requests that don't identify one
+DEFAULT_USER_ID = "default"
+
+TABLES = {
     # Table for user personality/survey data
-    c.execute('''
+    "user_profile": '''
         CREATE TABLE IF NOT EXISTS user_profile (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT PRIMARY KEY,
             spending_regret TEXT,
             user_goals TEXT,
             top_categories TEXT, -- JSON list
             updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
-    ''')
-    
+    ''',
     # Table for transaction metadata (regret scores)
-    c.execute('''
+    "transaction_metadata": '''
         CREATE TABLE IF NOT EXISTS transaction_metadata (
-            transaction_id TEXT PRIMARY KEY,
+            user_id TEXT NOT NULL,
+            transaction_id TEXT NOT NULL,
             regret_score INTEGER, -- 0 to 100
             regret_reason TEXT,
-            analyzed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            analyzed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (user_id, transaction_id)
         )
-    ''')
-    
+    ''',
     # Table for Pigeon interventions (geo-behavioral nudges)
-    c.execute('''
+    "pigeon_interventions": f'''
         CREATE TABLE IF NOT EXISTS pigeon_interventions (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT NOT NULL DEFAULT '{DEFAULT_USER_ID}',
             danger_zone_id TEXT NOT NULL,
             latitude REAL NOT NULL,
             longitude REAL NOT NULL,
@@ -51,14 +82,14 @@ def init_db():
             notification_sent INTEGER DEFAULT 1, -- boolean
             notification_message TEXT,
             user_response TEXT, -- helpful/not_helpful/ignored
-            intervention_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            intervention_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            event_id TEXT -- client-supplied, so replayed uploads are not inserted twice
         )
-    ''')
-    
+    ''',
     # Table for Pigeon user settings
-    c.execute('''
+    "pigeon_user_settings": '''
         CREATE TABLE IF NOT EXISTS pigeon_user_settings (
-            id INTEGER PRIMARY KEY CHECK (id = 1), -- single user
+            user_id TEXT PRIMARY KEY,
             monitoring_enabled INTEGER DEFAULT 0, -- boolean
             notification_threshold REAL DEFAULT 0.70,
             proximity_radius_meters REAL DEFAULT 50.0,
@@ -66,41 +97,258 @@ def init_db():
             quiet_hours_end INTEGER DEFAULT 7, -- hour (0-23)
             updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
-    ''')
+    ''',
+    # Table for compacted Pigeon interventions (hourly/daily aggregates)
+    "pigeon_intervention_rollups": '''
+        CREATE TABLE IF NOT EXISTS pigeon_intervention_rollups (
+            user_id TEXT NOT NULL,
+            granularity TEXT NOT NULL, -- hour/day
+            bucket_start TIMESTAMP NOT NULL,
+            danger_zone_id TEXT NOT NULL,
+            merchant_category TEXT NOT NULL DEFAULT '', -- '' when unknown
+            user_response TEXT NOT NULL DEFAULT '', -- '' when no feedback was given
+            intervention_count INTEGER NOT NULL DEFAULT 0,
+            notification_count INTEGER NOT NULL DEFAULT 0,
+            probability_sum REAL NOT NULL DEFAULT 0,
+            score_sum INTEGER NOT NULL DEFAULT 0,
+            budget_utilization_sum REAL NOT NULL DEFAULT 0,
+            budget_utilization_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, granularity, bucket_start, danger_zone_id, merchant_category, user_response)
+        )
+    ''',
+    # Table for linked Plaid Items (one row per connected bank login)
+    "plaid_items": '''
+        CREATE TABLE IF NOT EXISTS plaid_items (
+            item_id TEXT PRIMARY KEY,
+            user_id TEXT NOT NULL,
+            access_token TEXT NOT NULL,
+            institution_id TEXT,
+            sync_cursor TEXT, -- /transactions/sync cursor; NULL until the first sync
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''',
+    # Table for bank transactions pulled incrementally from Plaid
+    "transactions": '''
+        CREATE TABLE IF NOT EXISTS transactions (
+            user_id TEXT NOT NULL,
+            transaction_id TEXT NOT NULL,
+            item_id TEXT NOT NULL,
+            account_id TEXT NOT NULL,
+            name TEXT,
+            amount REAL NOT NULL,
+            date TEXT NOT NULL, -- YYYY-MM-DD
+            category TEXT, -- JSON list
+            pending INTEGER DEFAULT 0, -- boolean
+            merchant_name TEXT,
+            payment_channel TEXT,
+            iso_currency_code TEXT,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (user_id, transaction_id)
+        )
+    ''',
+    # Table for queued regret-scoring work, one row per unscored transaction
+    "regret_jobs": '''
+        CREATE TABLE IF NOT EXISTS regret_jobs (
+            user_id TEXT NOT NULL,
+            transaction_id TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending', -- pending, running, failed
+            attempts INTEGER NOT NULL DEFAULT 0,
+            available_at REAL NOT NULL, -- epoch seconds; retries are pushed into the future
+            lease_expires_at REAL, -- epoch seconds; a running job past this is reclaimed
+            last_error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (user_id, transaction_id)
+        )
+    ''',
+    # Table for materialized Nessie customer snapshots, one row per section
+    "nessie_snapshot_sections": '''
+        CREATE TABLE IF NOT EXISTS nessie_snapshot_sections (
+            customer_id TEXT NOT NULL,
+            account_id TEXT NOT NULL, -- '' for the customer's own sections (customer, accounts)
+            section TEXT NOT NULL, -- customer, accounts, account, bills, deposits, loans, purchases, ...
+            data TEXT, -- JSON; NULL until a fetch succeeds
+            error TEXT, -- last fetch error; NULL after a success
+            fetched_at REAL, -- epoch seconds the data was fetched
+            stale_at REAL NOT NULL, -- epoch seconds after which the refresher fetches it again
+            PRIMARY KEY (customer_id, account_id, section)
+        )
+    ''',
+    # Table for tracked recurring-charge series, one row per merchant amount band
+    "recurring_charges": '''
+        CREATE TABLE IF NOT EXISTS recurring_charges (
+            user_id TEXT NOT NULL,
+            account_id TEXT NOT NULL,
+            series_id TEXT NOT NULL, -- lowercased merchant | first amount
+            merchant TEXT NOT NULL,
+            amount_low REAL NOT NULL,
+            amount_high REAL NOT NULL,
+            last_amount REAL NOT NULL,
+            previous_amount REAL, -- the amount before the last change
+            last_date TEXT NOT NULL, -- YYYY-MM-DD
+            period TEXT, -- weekly, biweekly, monthly, quarterly, annual; NULL until a gap fits one
+            charge_count INTEGER NOT NULL,
+            gap_count INTEGER NOT NULL, -- gaps since the period was set
+            fit_count INTEGER NOT NULL, -- of which fitted the period
+            changed_on TEXT, -- date of the last charge outside the amount band
+            PRIMARY KEY (user_id, account_id, series_id)
+        )
+    ''',
+    # Table for how far recurring-charge tracking has read each account's history
+    "recurring_sync": '''
+        CREATE TABLE IF NOT EXISTS recurring_sync (
+            user_id TEXT NOT NULL,
+            account_id TEXT NOT NULL,
+            last_date TEXT, -- newest charge date folded in; NULL if none yet
+            last_ids TEXT NOT NULL, -- JSON list of charge IDs seen on last_date
+            synced_at REAL NOT NULL, -- epoch seconds
+            PRIMARY KEY (user_id, account_id)
+        )
+    ''',
+    # Table recording which schema migrations have run
+    "schema_version": '''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            migrated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''',
+}
+
+INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_pigeon_interventions_at ON pigeon_interventions (intervention_at)",
+    "CREATE INDEX IF NOT EXISTS idx_pigeon_interventions_user_at ON pigeon_interventions (user_id, intervention_at)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS idx_pigeon_interventions_event ON pigeon_interventions (user_id, event_id)",
+    "CREATE INDEX IF NOT EXISTS idx_plaid_items_user ON plaid_items (user_id)",
+    "CREATE INDEX IF NOT EXISTS idx_transactions_user_date ON transactions (user_id, date, transaction_id)",
+    "CREATE INDEX IF NOT EXISTS idx_transactions_item ON transactions (item_id)",
+    "CREATE INDEX IF NOT EXISTS idx_regret_jobs_status ON regret_jobs (status, available_at)",
+    "CREATE INDEX IF NOT EXISTS idx_nessie_snapshot_sections_stale ON nessie_snapshot_sections (stale_at)",
+]
+
+# Bump when a migration is added to SINGLE_USER_COPIES or ADDED_COLUMNS, so
+# databases already at the previous version run it once
+SCHEMA_VERSION = 2
+# Held while one process creates and migrates the schema (Postgres advisory lock key)
+SCHEMA_LOCK_ID = 7319040
+# Columns added to existing tables after they first shipped
+ADDED_COLUMNS = [
+    ("plaid_items", "sync_cursor", "TEXT"),
+    ("pigeon_interventions", "event_id", "TEXT"),
+]
+
+# Single-user tables whose primary key changed; rebuilt by _migrate_single_user_tables
+SINGLE_USER_COPIES = {
+    "user_profile": '''
+        INSERT INTO user_profile (user_id, spending_regret, user_goals, top_categories, updated_at)
+        SELECT ?, spending_regret, user_goals, top_categories, updated_at
+        FROM user_profile_single_user WHERE id = 1
+    ''',
+    "transaction_metadata": '''
+        INSERT INTO transaction_metadata (user_id, transaction_id, regret_score, regret_reason, analyzed_at)
+        SELECT ?, transaction_id, regret_score, regret_reason, analyzed_at
+        FROM transaction_metadata_single_user
+    ''',
+    "pigeon_user_settings": '''
+        INSERT INTO pigeon_user_settings (
+            user_id, monitoring_enabled, notification_threshold,
+            proximity_radius_meters, quiet_hours_start, quiet_hours_end, updated_at
+        )
+        SELECT ?, monitoring_enabled, notification_threshold,
+               proximity_radius_meters, quiet_hours_start, quiet_hours_end, updated_at
+        FROM pigeon_user_settings_single_user WHERE id = 1
+    ''',
+    "pigeon_intervention_rollups": '''
+        INSERT INTO pigeon_intervention_rollups (
+            user_id, granularity, bucket_start, danger_zone_id, merchant_category, user_response,
+            intervention_count, notification_count, probability_sum, score_sum,
+            budget_utilization_sum, budget_utilization_count
+        )
+        SELECT ?, granularity, bucket_start, danger_zone_id, merchant_category, user_response,
+               intervention_count, notification_count, probability_sum, score_sum,
+               budget_utilization_sum, budget_utilization_count
+        FROM pigeon_intervention_rollups_single_user
+    ''',
+}
+
+def _table_columns(c, table):
+    if is_postgres():
+        c.execute("SELECT column_name AS name FROM information_schema.columns WHERE table_name = ?", (table,))
+    else:
+        c.execute(f"PRAGMA table_info({table})")
+    return {row["name"] for row in c.fetchall()}
+
+def _migrate_single_user_tables(c):
+    """Move rows from the pre-partitioning schema to DEFAULT_USER_ID"""
+    if "user_id" not in _table_columns(c, "pigeon_interventions"):
+        c.execute(f"ALTER TABLE pigeon_interventions ADD COLUMN user_id TEXT NOT NULL DEFAULT '{DEFAULT_USER_ID}'")
     
-    conn.commit()
-    conn.close()
+    for table, copy_sql in SINGLE_USER_COPIES.items():
+        if "user_id" in _table_columns(c, table):
+            continue
+        c.execute(f"ALTER TABLE {table} RENAME TO {table}_single_user")
+        c.execute(TABLES[table])
+        c.execute(copy_sql, (DEFAULT_USER_ID,))
+        c.execute(f"DROP TABLE {table}_single_user")
 
-def save_user_profile(spending_regret, user_goals, top_categories):
+def _migrate_added_columns(c):
+    for table, column, ddl in ADDED_COLUMNS:
+        if column not in _table_columns(c, table):
+            c.execute(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}")
+
+def init_db():
+    """
+    Create the schema and run pending migrations in one transaction. Workers
+    starting together take a write lock first, so only one migrates and the
+    rest see the recorded version.
+    """
+    conn = get_db_connection()
+    c = conn.cursor()
+    try:
+        if is_postgres():
+            c.execute("SELECT pg_advisory_xact_lock(?)", (SCHEMA_LOCK_ID,))
+        else:
+            c.execute("BEGIN IMMEDIATE")
+        
+        for ddl in TABLES.values():
+            c.execute(ddl)
+        c.execute("SELECT MAX(version) AS version FROM schema_version")
+        if (c.fetchone()["version"] or 0) < SCHEMA_VERSION:
+            _migrate_single_user_tables(c)
+            _migrate_added_columns(c)
+            c.execute("INSERT INTO schema_version (version) VALUES (?)", (SCHEMA_VERSION,))
+        for ddl in INDEXES:
+            c.execute(ddl)
+        
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+def save_user_profile(spending_regret, user_goals, top_categories, user_id=DEFAULT_USER_ID):
     conn = get_db_connection()
     c = conn.cursor()
-    
-    # For this single-user app, we'll just keep one profile row (ID 1)
-    # Check if exists
-    c.execute("SELECT id FROM user_profile WHERE id = 1")
-    exists = c.fetchone()
     
     cat_json = json.dumps(top_categories)
     
-    if exists:
-        c.execute('''
-            UPDATE user_profile 
-            SET spending_regret = ?, user_goals = ?, top_categories = ?, updated_at = CURRENT_TIMESTAMP
-            WHERE id = 1
-        ''', (spending_regret, user_goals, cat_json))
-    else:
-        c.execute('''
-            INSERT INTO user_profile (id, spending_regret, user_goals, top_categories)
-            VALUES (1, ?, ?, ?)
-        ''', (spending_regret, user_goals, cat_json))
+    # One profile row per user
+    c.execute('''
+        INSERT INTO user_profile (user_id, spending_regret, user_goals, top_categories, updated_at)
+        VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+        ON CONFLICT (user_id) DO UPDATE SET
+            spending_regret = excluded.spending_regret,
+            user_goals = excluded.user_goals,
+            top_categories = excluded.top_categories,
+            updated_at = excluded.updated_at
+    ''', (user_id, spending_regret, user_goals, cat_json))
         
     conn.commit()
     conn.close()
 
-def get_user_profile():
+def get_user_profile(user_id=DEFAULT_USER_ID):
     conn = get_db_connection()
     c = conn.cursor()
-    c.execute("SELECT * FROM user_profile WHERE id = 1")
+    c.execute("SELECT * FROM user_profile WHERE user_id = ?", (user_id,))
     row = c.fetchone()
     conn.close()
     
@@ -112,14 +360,33 @@ def get_user_profile():
         }
     return None
 
-def get_transaction_metadata(transaction_ids):
+# Above this many IDs, bind the list as one parameter (a JSON array read with
+# json_each on SQLite, an array on Postgres) instead of one placeholder per
+# ID (SQLite caps bound variables)
+METADATA_IN_LIST_LIMIT = 500
+
+def _in_list(column, values):
+    """(SQL condition, params) testing `column` against a list of values of any length"""
+    values = list(values)
+    if len(values) <= METADATA_IN_LIST_LIMIT:
+        return f"{column} IN ({','.join('?' for _ in values)})", values
+    if is_postgres():
+        return f"{column} = ANY(?)", [values]
+    # Each value still probes the index on `column`
+    return f"{column} IN (SELECT value FROM json_each(?))", [json.dumps(values)]
+
+def get_transaction_metadata(transaction_ids, user_id=DEFAULT_USER_ID):
+    transaction_ids = list(transaction_ids)
+    if not transaction_ids:
+        return {}
+    
     conn = get_db_connection()
     c = conn.cursor()
-    
-    placeholders = ','.join('?' for _ in transaction_ids)
-    query = f"SELECT * FROM transaction_metadata WHERE transaction_id IN ({placeholders})"
-    
-    c.execute(query, transaction_ids)
+    in_ids, id_params = _in_list("transaction_id", transaction_ids)
+    c.execute(
+        f"SELECT * FROM transaction_metadata WHERE user_id = ? AND {in_ids}",
+        (user_id, *id_params)
+    )
     rows = c.fetchall()
     conn.close()
     
@@ -131,21 +398,83 @@ def get_transaction_metadata(transaction_ids):
         }
     return results
 
-def save_transaction_regret(transaction_id, score, reason):
+TRANSACTION_REGRET_UPSERT_SQL = '''
+    INSERT INTO transaction_metadata (user_id, transaction_id, regret_score, regret_reason, analyzed_at)
+'''
+TRANSACTION_REGRET_CONFLICT_SQL = '''
+    ON CONFLICT (user_id, transaction_id) DO UPDATE SET
+        regret_score = excluded.regret_score,
+        regret_reason = excluded.regret_reason,
+        analyzed_at = excluded.analyzed_at
+'''
+
+def save_transaction_regret(transaction_id, score, reason, user_id=DEFAULT_USER_ID):
     conn = get_db_connection()
     c = conn.cursor()
     
-    c.execute('''
-        INSERT OR REPLACE INTO transaction_metadata (transaction_id, regret_score, regret_reason, analyzed_at)
-        VALUES (?, ?, ?, CURRENT_TIMESTAMP)
-    ''', (transaction_id, score, reason))
+    c.execute(TRANSACTION_REGRET_UPSERT_SQL + "VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)" + TRANSACTION_REGRET_CONFLICT_SQL,
+              (user_id, transaction_id, score, reason))
     
     conn.commit()
     conn.close()
 
+def save_transaction_regrets(scores, user_id=DEFAULT_USER_ID):
+    """
+    Bulk upsert regret scores from an iterable of (transaction_id, score, reason).
+    Postgres loads them with COPY into a staging table; SQLite uses executemany.
+    A transaction listed twice keeps its last score, since one upsert statement
+    cannot update the same row twice on Postgres. Returns the rows written.
+    """
+    rows = list({row[0]: (user_id, *row) for row in scores}.values())
+    if not rows:
+        return 0
+    
+    conn = get_db_connection()
+    c = conn.cursor()
+    try:
+        if is_postgres():
+            c.execute('''
+                CREATE TEMP TABLE transaction_regret_staging (
+                    user_id TEXT, transaction_id TEXT, regret_score INTEGER, regret_reason TEXT
+                ) ON COMMIT DROP
+            ''')
+            conn.copy_rows(
+                "transaction_regret_staging",
+                ("user_id", "transaction_id", "regret_score", "regret_reason"),
+                rows
+            )
+            c.execute(
+                TRANSACTION_REGRET_UPSERT_SQL
+                + "SELECT user_id, transaction_id, regret_score, regret_reason, CURRENT_TIMESTAMP"
+                + " FROM transaction_regret_staging"
+                + TRANSACTION_REGRET_CONFLICT_SQL
+            )
+        else:
+            c.executemany(
+                TRANSACTION_REGRET_UPSERT_SQL + "VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)" + TRANSACTION_REGRET_CONFLICT_SQL,
+                rows
+            )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return len(rows)
+
 # --- Pigeon Intervention Functions ---
 
-def save_pigeon_intervention(
+INTERVENTION_INSERT_SQL = '''
+    INSERT INTO pigeon_interventions (
+        user_id, danger_zone_id, latitude, longitude, predicted_probability,
+        predicted_score, risk_level, merchant_category, budget_utilization,
+        hour_of_day, notification_sent, notification_message, event_id
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (user_id, event_id) DO NOTHING
+    RETURNING id
+'''
+
+def _intervention_params(
     danger_zone_id: str,
     latitude: float,
     longitude: float,
@@ -156,29 +485,50 @@ def save_pigeon_intervention(
     budget_utilization: float = None,
     hour_of_day: int = None,
     notification_sent: bool = True,
-    notification_message: str = None
+    notification_message: str = None,
+    event_id: str = None
 ):
-    conn = get_db_connection()
-    c = conn.cursor()
-    
-    c.execute('''
-        INSERT INTO pigeon_interventions (
-            danger_zone_id, latitude, longitude, predicted_probability,
-            predicted_score, risk_level, merchant_category, budget_utilization,
-            hour_of_day, notification_sent, notification_message
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    ''', (
+    return (
         danger_zone_id, latitude, longitude, predicted_probability,
         predicted_score, risk_level, merchant_category, budget_utilization,
-        hour_of_day, 1 if notification_sent else 0, notification_message
-    ))
-    
-    conn.commit()
-    intervention_id = c.lastrowid
-    conn.close()
-    return intervention_id
+        hour_of_day, 1 if notification_sent else 0, notification_message, event_id
+    )
+
+def save_pigeon_intervention(user_id=DEFAULT_USER_ID, **intervention):
+    """Insert one intervention; accepts the keyword arguments of _intervention_params"""
+    return save_pigeon_interventions([intervention], user_id=user_id)[0]
 
-def update_pigeon_intervention_response(intervention_id: int, user_response: str):
+def save_pigeon_interventions(interventions, user_id=DEFAULT_USER_ID):
+    """
+    Insert many interventions in a single transaction.
+    Returns the intervention ids in input order; nothing is written if any row fails.
+    A row whose event_id was already saved is not inserted again and gets the
+    existing row's id, so a device can safely resend a batch it is unsure landed.
+    """
+    conn = get_db_connection()
+    c = conn.cursor()
+    ids = []
+    try:
+        for intervention in interventions:
+            params = _intervention_params(**intervention)
+            c.execute(INTERVENTION_INSERT_SQL, (user_id, *params))
+            row = c.fetchone()
+            if row is None:
+                c.execute(
+                    "SELECT id FROM pigeon_interventions WHERE user_id = ? AND event_id = ?",
+                    (user_id, params[-1])
+                )
+                row = c.fetchone()
+            ids.append(row["id"])
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return ids
+
+def update_pigeon_intervention_response(intervention_id: int, user_response: str, user_id=DEFAULT_USER_ID):
     """Update intervention with user feedback (helpful/not_helpful/ignored)"""
     conn = get_db_connection()
     c = conn.cursor()
@@ -186,17 +536,144 @@ def update_pigeon_intervention_response(intervention_id: int, user_response: str
     c.execute('''
         UPDATE pigeon_interventions
         SET user_response = ?
-        WHERE id = ?
-    ''', (user_response, intervention_id))
+        WHERE id = ? AND user_id = ?
+    ''', (user_response, intervention_id, user_id))
+    updated = c.rowcount
     
     conn.commit()
     conn.close()
+    return updated > 0
+
+# --- Pigeon Intervention Rollups ---
+
+ROLLUP_BUCKET_FORMATS = {
+    "hour": "%Y-%m-%d %H:00:00",
+    "day": "%Y-%m-%d 00:00:00",
+}
+
+def _rollup_bucket_sql(granularity: str) -> str:
+    if is_postgres():
+        return f"date_trunc('{granularity}', intervention_at)"
+    return f"strftime('{ROLLUP_BUCKET_FORMATS[granularity]}', intervention_at)"
 
-def get_pigeon_user_settings():
-    """Get Pigeon settings for the user (single-user app)"""
+def compact_pigeon_interventions(retention_days: int = 30, granularity: str = "day", feedback_grace_days: int = 7) -> int:
+    """
+    Roll raw interventions older than `retention_days` into
+    pigeon_intervention_rollups and delete them. Notifications still waiting
+    for feedback stay raw `feedback_grace_days` longer, so a late response
+    still finds its row. Returns the number of raw rows compacted.
+    """
+    if granularity not in ROLLUP_BUCKET_FORMATS:
+        raise ValueError(f"granularity must be one of {sorted(ROLLUP_BUCKET_FORMATS)}")
+    
+    # intervention_at holds UTC on both stores (Postgres sessions run in UTC),
+    # so compute the cutoff in UTC once and use it for both statements
+    cutoff = (datetime.utcnow() - timedelta(days=retention_days)).strftime("%Y-%m-%d %H:%M:%S")
+    feedback_cutoff = (datetime.utcnow() - timedelta(days=retention_days + feedback_grace_days)).strftime("%Y-%m-%d %H:%M:%S")
+    compactable = "intervention_at < ? AND (user_response IS NOT NULL OR notification_sent = 0 OR intervention_at < ?)"
+    bucket = _rollup_bucket_sql(granularity)
+    
     conn = get_db_connection()
     c = conn.cursor()
-    c.execute("SELECT * FROM pigeon_user_settings WHERE id = 1")
+    try:
+        c.execute(f'''
+            INSERT INTO pigeon_intervention_rollups (
+                user_id, granularity, bucket_start, danger_zone_id, merchant_category, user_response,
+                intervention_count, notification_count, probability_sum, score_sum,
+                budget_utilization_sum, budget_utilization_count
+            )
+            SELECT
+                user_id, ?, {bucket}, danger_zone_id, COALESCE(merchant_category, ''), COALESCE(user_response, ''),
+                COUNT(*), SUM(notification_sent), SUM(predicted_probability), SUM(predicted_score),
+                COALESCE(SUM(budget_utilization), 0), COUNT(budget_utilization)
+            FROM pigeon_interventions
+            WHERE {compactable}
+            GROUP BY 1, 3, 4, 5, 6
+            ON CONFLICT (user_id, granularity, bucket_start, danger_zone_id, merchant_category, user_response)
+            DO UPDATE SET
+                intervention_count = pigeon_intervention_rollups.intervention_count + excluded.intervention_count,
+                notification_count = pigeon_intervention_rollups.notification_count + excluded.notification_count,
+                probability_sum = pigeon_intervention_rollups.probability_sum + excluded.probability_sum,
+                score_sum = pigeon_intervention_rollups.score_sum + excluded.score_sum,
+                budget_utilization_sum = pigeon_intervention_rollups.budget_utilization_sum + excluded.budget_utilization_sum,
+                budget_utilization_count = pigeon_intervention_rollups.budget_utilization_count + excluded.budget_utilization_count
+        ''', (granularity, cutoff, feedback_cutoff))
+        
+        c.execute(f"DELETE FROM pigeon_interventions WHERE {compactable}", (cutoff, feedback_cutoff))
+        compacted = c.rowcount
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return compacted
+
+def get_pigeon_intervention_stats(days: int = None, user_id=DEFAULT_USER_ID):
+    """
+    Aggregate interventions per (zone, category, response), reading compacted
+    history from the rollups and only the recent, not-yet-compacted raw rows.
+    """
+    rollup_filter = raw_filter = ""
+    rollup_params = raw_params = (user_id,)
+    if days is not None:
+        since = (datetime.utcnow() - timedelta(days=days)).strftime("%Y-%m-%d %H:%M:%S")
+        rollup_filter = "AND bucket_start >= ?"
+        raw_filter = "AND intervention_at >= ?"
+        rollup_params = raw_params = (user_id, since)
+    
+    conn = get_db_connection()
+    c = conn.cursor()
+    c.execute(f'''
+        SELECT
+            danger_zone_id, merchant_category, user_response,
+            SUM(intervention_count) AS intervention_count,
+            SUM(notification_count) AS notification_count,
+            SUM(probability_sum) AS probability_sum,
+            SUM(score_sum) AS score_sum,
+            SUM(budget_utilization_sum) AS budget_utilization_sum,
+            SUM(budget_utilization_count) AS budget_utilization_count
+        FROM (
+            SELECT danger_zone_id, merchant_category, user_response,
+                   intervention_count, notification_count, probability_sum, score_sum,
+                   budget_utilization_sum, budget_utilization_count
+            FROM pigeon_intervention_rollups
+            WHERE user_id = ? {rollup_filter}
+            UNION ALL
+            SELECT danger_zone_id, COALESCE(merchant_category, ''), COALESCE(user_response, ''),
+                   1, notification_sent, predicted_probability, predicted_score,
+                   COALESCE(budget_utilization, 0),
+                   CASE WHEN budget_utilization IS NULL THEN 0 ELSE 1 END
+            FROM pigeon_interventions
+            WHERE user_id = ? {raw_filter}
+        ) AS combined
+        GROUP BY danger_zone_id, merchant_category, user_response
+        ORDER BY intervention_count DESC
+    ''', rollup_params + raw_params)
+    rows = c.fetchall()
+    conn.close()
+    
+    stats = []
+    for row in rows:
+        count = row["intervention_count"]
+        util_count = row["budget_utilization_count"]
+        stats.append({
+            "danger_zone_id": row["danger_zone_id"],
+            "merchant_category": row["merchant_category"] or None,
+            "user_response": row["user_response"] or None,
+            "intervention_count": count,
+            "notification_count": row["notification_count"],
+            "avg_predicted_probability": row["probability_sum"] / count if count else None,
+            "avg_predicted_score": row["score_sum"] / count if count else None,
+            "avg_budget_utilization": row["budget_utilization_sum"] / util_count if util_count else None,
+        })
+    return stats
+
+def get_pigeon_user_settings(user_id=DEFAULT_USER_ID):
+    """Get Pigeon settings for the user"""
+    conn = get_db_connection()
+    c = conn.cursor()
+    c.execute("SELECT * FROM pigeon_user_settings WHERE user_id = ?", (user_id,))
     row = c.fetchone()
     conn.close()
     
@@ -222,14 +699,15 @@ def update_pigeon_user_settings(
     notification_threshold: float = None,
     proximity_radius_meters: float = None,
     quiet_hours_start: int = None,
-    quiet_hours_end: int = None
+    quiet_hours_end: int = None,
+    user_id=DEFAULT_USER_ID
 ):
     """Update Pigeon user settings (creates if doesn't exist)"""
     conn = get_db_connection()
     c = conn.cursor()
     
     # Check if exists
-    c.execute("SELECT id FROM pigeon_user_settings WHERE id = 1")
+    c.execute("SELECT user_id FROM pigeon_user_settings WHERE user_id = ?", (user_id,))
     exists = c.fetchone()
     
     if exists:
@@ -254,17 +732,18 @@ def update_pigeon_user_settings(
         
         if updates:
             updates.append("updated_at = CURRENT_TIMESTAMP")
-            values.append(1)  # WHERE id = 1
-            query = f"UPDATE pigeon_user_settings SET {', '.join(updates)} WHERE id = ?"
+            values.append(user_id)
+            query = f"UPDATE pigeon_user_settings SET {', '.join(updates)} WHERE user_id = ?"
             c.execute(query, values)
     else:
         # Insert with defaults
         c.execute('''
             INSERT INTO pigeon_user_settings (
-                id, monitoring_enabled, notification_threshold,
+                user_id, monitoring_enabled, notification_threshold,
                 proximity_radius_meters, quiet_hours_start, quiet_hours_end
-            ) VALUES (1, ?, ?, ?, ?, ?)
+            ) VALUES (?, ?, ?, ?, ?, ?)
         ''', (
+            user_id,
             1 if monitoring_enabled else 0,
             notification_threshold or 0.70,
             proximity_radius_meters or 50.0,
@@ -275,5 +754,612 @@ def update_pigeon_user_settings(
     conn.commit()
     conn.close()
 
+# --- Plaid Items ---
+
+def save_plaid_item(item_id: str, access_token: str, institution_id: str = None, user_id=DEFAULT_USER_ID):
+    """Store (or re-link) a Plaid Item and its access token for the user"""
+    conn = get_db_connection()
+    c = conn.cursor()
+    
+    c.execute('''
+        INSERT INTO plaid_items (item_id, user_id, access_token, institution_id)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT (item_id) DO UPDATE SET
+            user_id = excluded.user_id,
+            access_token = excluded.access_token,
+            institution_id = COALESCE(excluded.institution_id, plaid_items.institution_id)
+    ''', (item_id, user_id, access_token, institution_id))
+    
+    conn.commit()
+    conn.close()
+
+def get_plaid_item(item_id: str):
+    """
+    Look up a linked Item by its Plaid item_id, whoever owns it. Plaid
+    webhooks only name the Item, so this is how they find their user.
+    """
+    conn = get_db_connection()
+    c = conn.cursor()
+    c.execute(
+        "SELECT item_id, user_id, access_token, institution_id, sync_cursor FROM plaid_items WHERE item_id = ?",
+        (item_id,)
+    )
+    row = c.fetchone()
+    conn.close()
+    
+    if row:
+        return {
+            "item_id": row["item_id"],
+            "user_id": row["user_id"],
+            "access_token": row["access_token"],
+            "institution_id": row["institution_id"],
+            "sync_cursor": row["sync_cursor"],
+        }
+    return None
+
+def get_plaid_items(user_id=DEFAULT_USER_ID):
+    conn = get_db_connection()
+    c = conn.cursor()
+    c.execute('''
+        SELECT item_id, access_token, institution_id, sync_cursor
+        FROM plaid_items WHERE user_id = ?
+        ORDER BY created_at, item_id
+    ''', (user_id,))
+    rows = c.fetchall()
+    conn.close()
+    
+    return [
+        {
+            "item_id": row["item_id"],
+            "access_token": row["access_token"],
+            "institution_id": row["institution_id"],
+            "sync_cursor": row["sync_cursor"],
+        }
+        for row in rows
+    ]
+
+def delete_plaid_items(user_id=DEFAULT_USER_ID):
+    """Unlink all of the user's Items and drop their synced transactions and queued scoring"""
+    conn = get_db_connection()
+    c = conn.cursor()
+    c.execute("DELETE FROM regret_jobs WHERE user_id = ?", (user_id,))
+    c.execute("DELETE FROM transactions WHERE user_id = ?", (user_id,))
+    c.execute("DELETE FROM plaid_items WHERE user_id = ?", (user_id,))
+    conn.commit()
+    conn.close()
+
+def delete_plaid_item(item_id: str, user_id=DEFAULT_USER_ID):
+    """Unlink one Item and drop its synced transactions and their queued scoring"""
+    conn = get_db_connection()
+    c = conn.cursor()
+    c.execute('''
+        DELETE FROM regret_jobs
+        WHERE user_id = ? AND transaction_id IN (
+            SELECT transaction_id FROM transactions WHERE user_id = ? AND item_id = ?
+        )
+    ''', (user_id, user_id, item_id))
+    c.execute("DELETE FROM transactions WHERE user_id = ? AND item_id = ?", (user_id, item_id))
+    c.execute("DELETE FROM plaid_items WHERE user_id = ? AND item_id = ?", (user_id, item_id))
+    conn.commit()
+    conn.close()
+
+# --- Synced Transactions ---
+
+TRANSACTION_COLUMNS = (
+    "transaction_id", "account_id", "name", "amount", "date", "category",
+    "pending", "merchant_name", "payment_channel", "iso_currency_code",
+)
+
+def apply_transaction_sync(item_id: str, added, modified, removed, next_cursor: str, user_id=DEFAULT_USER_ID):
+    """
+    Apply one /transactions/sync delta for an Item and advance its cursor,
+    all in a single transaction so the cursor never runs ahead of the data.
+    `added`/`modified` are transaction dicts, `removed` is a list of IDs.
+    """
+    rows = [
+        (
+            user_id, item_id, t["transaction_id"], t["account_id"], t.get("name"), t["amount"],
+            t["date"], json.dumps(t.get("category") or []), 1 if t.get("pending") else 0,
+            t.get("merchant_name"), t.get("payment_channel"), t.get("iso_currency_code"),
+        )
+        for t in list(added) + list(modified)
+    ]
+    
+    conn = get_db_connection()
+    c = conn.cursor()
+    try:
+        if rows:
+            c.executemany('''
+                INSERT INTO transactions (
+                    user_id, item_id, transaction_id, account_id, name, amount,
+                    date, category, pending, merchant_name, payment_channel, iso_currency_code
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (user_id, transaction_id) DO UPDATE SET
+                    item_id = excluded.item_id,
+                    account_id = excluded.account_id,
+                    name = excluded.name,
+                    amount = excluded.amount,
+                    date = excluded.date,
+                    category = excluded.category,
+                    pending = excluded.pending,
+                    merchant_name = excluded.merchant_name,
+                    payment_channel = excluded.payment_channel,
+                    iso_currency_code = excluded.iso_currency_code,
+                    updated_at = CURRENT_TIMESTAMP
+            ''', rows)
+            # A transaction Plaid sent again gets another chance at scoring
+            _retry_failed_regret_jobs(c, user_id, [row[2] for row in rows])
+        if removed:
+            c.executemany(
+                "DELETE FROM transactions WHERE user_id = ? AND transaction_id = ?",
+                [(user_id, transaction_id) for transaction_id in removed]
+            )
+        c.execute(
+            "UPDATE plaid_items SET sync_cursor = ? WHERE item_id = ? AND user_id = ?",
+            (next_cursor, item_id, user_id)
+        )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+def _transaction_from_row(row):
+    return {
+        "transaction_id": row["transaction_id"],
+        "account_id": row["account_id"],
+        "name": row["name"],
+        "amount": row["amount"],
+        "date": row["date"],
+        "category": json.loads(row["category"]) if row["category"] else [],
+        "pending": bool(row["pending"]),
+        "merchant_name": row["merchant_name"],
+        "payment_channel": row["payment_channel"],
+        "iso_currency_code": row["iso_currency_code"],
+        "regretScore": row["regret_score"],
+        "regretReason": row["regret_reason"],
+    }
+
+def get_transactions(
+    limit: int = 100,
+    before=None,
+    start_date: str | None = None,
+    end_date: str | None = None,
+    category: str | None = None,
+    min_regret: int | None = None,
+    user_id=DEFAULT_USER_ID,
+):
+    """
+    A page of the user's synced transactions, newest first, with any regret
+    scores joined in. Pages are keyset-paginated: pass the (date,
+    transaction_id) of the last row seen as `before` to get the next page,
+    which the (user_id, date, transaction_id) index answers without
+    scanning earlier pages. Filters: inclusive YYYY-MM-DD date range, a
+    category at any level of the Plaid hierarchy, and a minimum regret
+    score (which leaves out unscored rows).
+    """
+    conditions = ["t.user_id = ?"]
+    params = [user_id]
+    if before is not None:
+        conditions.append("(t.date, t.transaction_id) < (?, ?)")
+        params.extend(before)
+    if start_date is not None:
+        conditions.append("t.date >= ?")
+        params.append(start_date)
+    if end_date is not None:
+        conditions.append("t.date <= ?")
+        params.append(end_date)
+    if category is not None:
+        if is_postgres():
+            conditions.append("t.category::jsonb @> jsonb_build_array(?::text)")
+        else:
+            conditions.append("EXISTS (SELECT 1 FROM json_each(t.category) WHERE value = ?)")
+        params.append(category)
+    if min_regret is not None:
+        conditions.append("m.regret_score >= ?")
+        params.append(min_regret)
+    
+    conn = get_db_connection()
+    c = conn.cursor()
+    c.execute(f'''
+        SELECT t.*, m.regret_score, m.regret_reason
+        FROM transactions AS t
+        LEFT JOIN transaction_metadata AS m
+            ON m.user_id = t.user_id AND m.transaction_id = t.transaction_id
+        WHERE {" AND ".join(conditions)}
+        ORDER BY t.date DESC, t.transaction_id DESC
+        LIMIT ?
+    ''', (*params, limit))
+    rows = c.fetchall()
+    conn.close()
+    
+    return [_transaction_from_row(row) for row in rows]
+
+def get_transaction(transaction_id: str, user_id=DEFAULT_USER_ID):
+    conn = get_db_connection()
+    c = conn.cursor()
+    c.execute('''
+        SELECT t.*, m.regret_score, m.regret_reason
+        FROM transactions AS t
+        LEFT JOIN transaction_metadata AS m
+            ON m.user_id = t.user_id AND m.transaction_id = t.transaction_id
+        WHERE t.user_id = ? AND t.transaction_id = ?
+    ''', (user_id, transaction_id))
+    row = c.fetchone()
+    conn.close()
+    
+    return _transaction_from_row(row) if row else None
+
+def get_transactions_by_id(transaction_ids, user_id=DEFAULT_USER_ID):
+    """{transaction_id: transaction} for the given IDs that the user has"""
+    if not transaction_ids:
+        return {}
+    
+    conn = get_db_connection()
+    c = conn.cursor()
+    in_ids, id_params = _in_list("t.transaction_id", transaction_ids)
+    c.execute(f'''
+        SELECT t.*, m.regret_score, m.regret_reason
+        FROM transactions AS t
+        LEFT JOIN transaction_metadata AS m
+            ON m.user_id = t.user_id AND m.transaction_id = t.transaction_id
+        WHERE t.user_id = ? AND {in_ids}
+    ''', (user_id, *id_params))
+    rows = c.fetchall()
+    conn.close()
+    
+    return {row["transaction_id"]: _transaction_from_row(row) for row in rows}
+
+# --- Regret Scoring Jobs ---
+
+def enqueue_unscored_regret_jobs(user_id=DEFAULT_USER_ID) -> int:
+    """
+    Queue a regret job for each of the user's synced transactions that has
+    no score yet. Transactions that already have a job are skipped, so this
+    is safe to call on every read. Returns the number of new jobs.
+    """
+    conn = get_db_connection()
+    c = conn.cursor()
+    c.execute('''
+        INSERT INTO regret_jobs (user_id, transaction_id, available_at)
+        SELECT t.user_id, t.transaction_id, ?
+        FROM transactions AS t
+        LEFT JOIN transaction_metadata AS m
+            ON m.user_id = t.user_id AND m.transaction_id = t.transaction_id
+        WHERE t.user_id = ? AND m.transaction_id IS NULL
+        ON CONFLICT (user_id, transaction_id) DO NOTHING
+    ''', (time.time(), user_id))
+    enqueued = c.rowcount
+    conn.commit()
+    conn.close()
+    return enqueued
+
+def claim_regret_jobs(limit: int = 1, lease_seconds: float = 120):
+    """
+    Atomically take up to `limit` due jobs, across all users, and lease them
+    to the caller. Pending jobs whose retry time has come and running jobs
+    whose lease ran out (their worker died) are both eligible. Returns dicts
+    with user_id, transaction_id and attempts (including this one).
+    """
+    now = time.time()
+    skip_locked = "FOR UPDATE SKIP LOCKED" if is_postgres() else ""
+    conn = get_db_connection()
+    c = conn.cursor()
+    c.execute(f'''
+        UPDATE regret_jobs
+        SET status = 'running', attempts = attempts + 1, lease_expires_at = ?
+        WHERE (user_id, transaction_id) IN (
+            SELECT user_id, transaction_id FROM regret_jobs
+            WHERE (status = 'pending' AND available_at <= ?)
+               OR (status = 'running' AND lease_expires_at < ?)
+            ORDER BY available_at
+            LIMIT ?
+            {skip_locked}
+        )
+        RETURNING user_id, transaction_id, attempts
+    ''', (now + lease_seconds, now, now, limit))
+    jobs = [
+        {"user_id": row["user_id"], "transaction_id": row["transaction_id"], "attempts": row["attempts"]}
+        for row in c.fetchall()
+    ]
+    conn.commit()
+    conn.close()
+    return jobs
+
+def complete_regret_jobs(transaction_ids, user_id=DEFAULT_USER_ID):
+    conn = get_db_connection()
+    c = conn.cursor()
+    c.executemany(
+        "DELETE FROM regret_jobs WHERE user_id = ? AND transaction_id = ?",
+        [(user_id, transaction_id) for transaction_id in transaction_ids]
+    )
+    conn.commit()
+    conn.close()
+
+def fail_regret_job(transaction_id: str, error: str, retry_at: float | None = None, user_id=DEFAULT_USER_ID):
+    """Put a job back for another attempt at `retry_at`, or park it as failed when None"""
+    conn = get_db_connection()
+    c = conn.cursor()
+    c.execute('''
+        UPDATE regret_jobs
+        SET status = ?, available_at = COALESCE(?, available_at), lease_expires_at = NULL, last_error = ?
+        WHERE user_id = ? AND transaction_id = ?
+    ''', ("failed" if retry_at is None else "pending", retry_at, error, user_id, transaction_id))
+    conn.commit()
+    conn.close()
+
+def _retry_failed_regret_jobs(c, user_id, transaction_ids=None) -> int:
+    reset = "SET status = 'pending', attempts = 0, available_at = ?, last_error = NULL"
+    if transaction_ids is None:
+        c.execute(f"UPDATE regret_jobs {reset} WHERE user_id = ? AND status = 'failed'", (time.time(), user_id))
+        return c.rowcount
+    retried = 0
+    for transaction_id in transaction_ids:
+        c.execute(
+            f"UPDATE regret_jobs {reset} WHERE user_id = ? AND transaction_id = ? AND status = 'failed'",
+            (time.time(), user_id, transaction_id)
+        )
+        retried += c.rowcount
+    return retried
+
+def retry_failed_regret_jobs(transaction_ids=None, user_id=DEFAULT_USER_ID) -> int:
+    """Queue the user's failed jobs (or those for `transaction_ids`) again with fresh attempts"""
+    conn = get_db_connection()
+    c = conn.cursor()
+    retried = _retry_failed_regret_jobs(c, user_id, transaction_ids)
+    conn.commit()
+    conn.close()
+    return retried
+
+def get_failed_regret_jobs(limit: int = 100, user_id=DEFAULT_USER_ID):
+    """The user's parked jobs with the error that parked them"""
+    conn = get_db_connection()
+    c = conn.cursor()
+    c.execute('''
+        SELECT transaction_id, attempts, last_error FROM regret_jobs
+        WHERE user_id = ? AND status = 'failed'
+        ORDER BY transaction_id
+        LIMIT ?
+    ''', (user_id, limit))
+    jobs = [
+        {"transaction_id": row["transaction_id"], "attempts": row["attempts"], "last_error": row["last_error"]}
+        for row in c.fetchall()
+    ]
+    conn.close()
+    return jobs
+
+def get_regret_job_counts(user_id=DEFAULT_USER_ID):
+    """Number of the user's regret jobs in each status"""
+    conn = get_db_connection()
+    c = conn.cursor()
+    c.execute(
+        "SELECT status, COUNT(*) AS count FROM regret_jobs WHERE user_id = ? GROUP BY status",
+        (user_id,)
+    )
+    counts = {"pending": 0, "running": 0, "failed": 0}
+    for row in c.fetchall():
+        counts[row["status"]] = row["count"]
+    conn.close()
+    return counts
+
+def save_snapshot_sections(customer_id: str, sections, account_ids=None):
+    """
+    Upsert fetched snapshot sections for a Nessie customer in one transaction.
+    `sections` are dicts with account_id, section, data, error, fetched_at and
+    stale_at. A failed fetch (data and fetched_at None) keeps the section's
+    previous data. When `account_ids` is given, sections of accounts no
+    longer in it are dropped.
+    """
+    rows = [
+        (
+            customer_id, s["account_id"], s["section"],
+            json.dumps(s["data"]) if s["fetched_at"] is not None else None,
+            s.get("error"), s["fetched_at"], s["stale_at"],
+        )
+        for s in sections
+    ]
+    conn = get_db_connection()
+    c = conn.cursor()
+    try:
+        if rows:
+            c.executemany('''
+                INSERT INTO nessie_snapshot_sections (
+                    customer_id, account_id, section, data, error, fetched_at, stale_at
+                ) VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (customer_id, account_id, section) DO UPDATE SET
+                    data = COALESCE(excluded.data, nessie_snapshot_sections.data),
+                    error = excluded.error,
+                    fetched_at = COALESCE(excluded.fetched_at, nessie_snapshot_sections.fetched_at),
+                    stale_at = excluded.stale_at
+            ''', rows)
+        if account_ids is not None:
+            c.execute(
+                "SELECT DISTINCT account_id FROM nessie_snapshot_sections WHERE customer_id = ? AND account_id <> ''",
+                (customer_id,)
+            )
+            dropped = [row["account_id"] for row in c.fetchall() if row["account_id"] not in set(account_ids)]
+            c.executemany(
+                "DELETE FROM nessie_snapshot_sections WHERE customer_id = ? AND account_id = ?",
+                [(customer_id, account_id) for account_id in dropped]
+            )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+def get_snapshot_sections(customer_id: str):
+    """Every materialized section of the customer's snapshot, data decoded"""
+    conn = get_db_connection()
+    c = conn.cursor()
+    c.execute('''
+        SELECT account_id, section, data, error, fetched_at, stale_at
+        FROM nessie_snapshot_sections WHERE customer_id = ?
+    ''', (customer_id,))
+    sections = [
+        {
+            "account_id": row["account_id"],
+            "section": row["section"],
+            "data": json.loads(row["data"]) if row["data"] is not None else None,
+            "error": row["error"],
+            "fetched_at": row["fetched_at"],
+            "stale_at": row["stale_at"],
+        }
+        for row in c.fetchall()
+    ]
+    conn.close()
+    return sections
+
+def get_stale_snapshot_customers(now: float):
+    """Customers with at least one snapshot section due for a refresh"""
+    conn = get_db_connection()
+    c = conn.cursor()
+    c.execute(
+        "SELECT DISTINCT customer_id FROM nessie_snapshot_sections WHERE stale_at <= ?",
+        (now,)
+    )
+    customer_ids = [row["customer_id"] for row in c.fetchall()]
+    conn.close()
+    return customer_ids
+
+def mark_snapshot_account_stale(account_id: str):
+    """
+    Make every stored section of the account due, whatever its TTL or a
+    reader's max_age, keeping the data to serve until it is refetched.
+    Returns the customers whose snapshots include the account.
+    """
+    conn = get_db_connection()
+    c = conn.cursor()
+    try:
+        c.execute(
+            "SELECT DISTINCT customer_id FROM nessie_snapshot_sections WHERE account_id = ?",
+            (account_id,)
+        )
+        customer_ids = [row["customer_id"] for row in c.fetchall()]
+        c.execute(
+            "UPDATE nessie_snapshot_sections SET fetched_at = NULL, stale_at = 0 WHERE account_id = ?",
+            (account_id,)
+        )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return customer_ids
+
+RECURRING_CHARGE_COLUMNS = (
+    "series_id", "merchant", "amount_low", "amount_high", "last_amount", "previous_amount",
+    "last_date", "period", "charge_count", "gap_count", "fit_count", "changed_on",
+)
+
+def get_recurring_state(account_id: str, user_id=DEFAULT_USER_ID):
+    """(sync watermark or None, tracked series) for one account's recurring charges"""
+    conn = get_db_connection()
+    c = conn.cursor()
+    c.execute(
+        "SELECT last_date, last_ids, synced_at FROM recurring_sync WHERE user_id = ? AND account_id = ?",
+        (user_id, account_id)
+    )
+    row = c.fetchone()
+    sync = None
+    if row:
+        sync = {"last_date": row["last_date"], "last_ids": json.loads(row["last_ids"]), "synced_at": row["synced_at"]}
+    c.execute(
+        f"SELECT {', '.join(RECURRING_CHARGE_COLUMNS)} FROM recurring_charges WHERE user_id = ? AND account_id = ?",
+        (user_id, account_id)
+    )
+    series = [{column: row[column] for column in RECURRING_CHARGE_COLUMNS} for row in c.fetchall()]
+    conn.close()
+    return sync, series
+
+def save_recurring_state(account_id: str, series, last_date, last_ids, synced_at: float, user_id=DEFAULT_USER_ID):
+    """
+    Upsert changed recurring-charge series and move the account's sync
+    watermark, in one transaction so the watermark never runs ahead of them.
+    """
+    rows = [(user_id, account_id, *(s[column] for column in RECURRING_CHARGE_COLUMNS)) for s in series]
+    conn = get_db_connection()
+    c = conn.cursor()
+    try:
+        if rows:
+            updates = ", ".join(f"{column} = excluded.{column}" for column in RECURRING_CHARGE_COLUMNS[1:])
+            c.executemany(f'''
+                INSERT INTO recurring_charges (user_id, account_id, {', '.join(RECURRING_CHARGE_COLUMNS)})
+                VALUES ({', '.join('?' * (len(RECURRING_CHARGE_COLUMNS) + 2))})
+                ON CONFLICT (user_id, account_id, series_id) DO UPDATE SET {updates}
+            ''', rows)
+        c.execute('''
+            INSERT INTO recurring_sync (user_id, account_id, last_date, last_ids, synced_at)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (user_id, account_id) DO UPDATE SET
+                last_date = excluded.last_date,
+                last_ids = excluded.last_ids,
+                synced_at = excluded.synced_at
+        ''', (user_id, account_id, last_date, json.dumps(last_ids), synced_at))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+# --- User-scoped access ---
+
+USER_SCOPED_FUNCTIONS = {
+    "save_user_profile",
+    "get_user_profile",
+    "get_transaction_metadata",
+    "save_transaction_regret",
+    "save_transaction_regrets",
+    "save_pigeon_intervention",
+    "save_pigeon_interventions",
+    "update_pigeon_intervention_response",
+    "get_pigeon_intervention_stats",
+    "get_pigeon_user_settings",
+    "update_pigeon_user_settings",
+    "save_plaid_item",
+    "get_plaid_items",
+    "delete_plaid_items",
+    "delete_plaid_item",
+    "apply_transaction_sync",
+    "get_transactions",
+    "get_transaction",
+    "enqueue_unscored_regret_jobs",
+    "get_transactions_by_id",
+    "complete_regret_jobs",
+    "fail_regret_job",
+    "get_regret_job_counts",
+    "get_failed_regret_jobs",
+    "retry_failed_regret_jobs",
+    "get_recurring_state",
+    "save_recurring_state",
+}
+
+class UserStore:
+    """
+    The per-user database API: for_user("u1").get_user_profile() is
+    get_user_profile(user_id="u1"). Callers cannot override the bound user.
+    """
+    
+    def __init__(self, user_id: str):
+        self.user_id = user_id
+    
+    def __getattr__(self, name):
+        if name not in USER_SCOPED_FUNCTIONS:
+            raise AttributeError(name)
+        fn = globals()[name]
+        
+        def scoped(*args, **kwargs):
+            if "user_id" in kwargs:
+                raise TypeError(f"{name}() user_id is bound by the store")
+            return fn(*args, user_id=self.user_id, **kwargs)
+        return scoped
+
+def for_user(user_id: str) -> UserStore:
+    return UserStore(user_id)
+
 # Initialize on module load
-init_db()
+configure(FINANCE_DATABASE_URL)
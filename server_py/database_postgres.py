@@ -0,0 +1,152 @@
+"""
+PostgreSQL storage backend for database.py
+
+Selected by pointing FINANCE_DATABASE_URL at a postgres:// URL. The
+connection wrapper exposes the same cursor/execute/commit/close surface
+as sqlite3, so the SQL in database.py runs unchanged against either store:
+'?' placeholders are rewritten to psycopg's '%s', and the SQLite-flavoured
+DDL is translated to Postgres types. Quoted strings, quoted identifiers and
+comments are left alone, so a '?' inside them is not a placeholder. Every
+'?' outside them is one: use jsonb_exists() rather than the jsonb '?'
+operator.
+
+Connections come from a shared psycopg pool. Every statement is prepared
+server-side on first use (prepare_threshold=0), and bulk loads go through
+COPY. Each connection's session time zone is UTC, so CURRENT_TIMESTAMP
+fills TIMESTAMP columns with UTC wall time as it does in SQLite, and cutoffs
+computed with datetime.utcnow() compare the same way on both stores.
+"""
+
+import os
+import re
+from typing import Iterable, Sequence
+
+from psycopg.pq import TransactionStatus
+from psycopg.rows import dict_row
+from psycopg_pool import ConnectionPool
+
+POOL_MIN_SIZE = int(os.environ.get("FINANCE_DB_POOL_MIN", "1"))
+POOL_MAX_SIZE = int(os.environ.get("FINANCE_DB_POOL_MAX", "10"))
+
+# SQLite DDL -> Postgres DDL
+_DDL_REWRITES = [
+    (re.compile(r"INTEGER PRIMARY KEY AUTOINCREMENT", re.I), "BIGSERIAL PRIMARY KEY"),
+    (re.compile(r"\bREAL\b"), "DOUBLE PRECISION"),
+]
+
+# Spans whose text is not SQL: string literals (plain, E'' and dollar-quoted),
+# quoted identifiers and comments
+_QUOTED = re.compile(
+    r"""(?<!\w)[eE]'(?:[^'\\]|\\.|'')*'"""
+    r"""|'(?:[^']|'')*'"""
+    r'''|"(?:[^"]|"")*"'''
+    r"""|\$(?P<tag>[A-Za-z_]*)\$.*?\$(?P=tag)\$"""
+    r"""|--[^\n]*"""
+    r"""|/\*.*?\*/""",
+    re.S,
+)
+
+_sql_cache = {}
+
+
+def _translate_code(code: str) -> str:
+    for pattern, replacement in _DDL_REWRITES:
+        code = pattern.sub(replacement, code)
+    return code.replace("?", "%s")
+
+
+def translate_sql(sql: str) -> str:
+    """Rewrite SQLite-style SQL (qmark params, SQLite DDL) for psycopg."""
+    translated = _sql_cache.get(sql)
+    if translated is None:
+        # psycopg reads '%' anywhere in the query, quoted or not
+        escaped = sql.replace("%", "%%")
+        parts, start = [], 0
+        for quoted in _QUOTED.finditer(escaped):
+            parts += [_translate_code(escaped[start:quoted.start()]), quoted.group()]
+            start = quoted.end()
+        parts.append(_translate_code(escaped[start:]))
+        translated = _sql_cache[sql] = "".join(parts)
+    return translated
+
+
+class PostgresCursor:
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, sql: str, params: Sequence = ()):
+        self._cursor.execute(translate_sql(sql), tuple(params))
+        return self
+
+    def executemany(self, sql: str, seq_of_params: Iterable[Sequence]):
+        self._cursor.executemany(translate_sql(sql), [tuple(p) for p in seq_of_params])
+        return self
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    @property
+    def rowcount(self) -> int:
+        return self._cursor.rowcount
+
+
+class PostgresConnection:
+    """A pooled connection that is handed back to the pool on close()."""
+
+    def __init__(self, pool: ConnectionPool):
+        self._pool = pool
+        self._conn = pool.getconn()
+
+    def cursor(self) -> PostgresCursor:
+        return PostgresCursor(self._conn.cursor())
+
+    def execute(self, sql: str, params: Sequence = ()) -> PostgresCursor:
+        return self.cursor().execute(sql, params)
+
+    def copy_rows(self, table: str, columns: Sequence[str], rows: Iterable[Sequence]):
+        """Bulk-load rows with COPY ... FROM STDIN."""
+        with self._conn.cursor() as cur:
+            with cur.copy(f"COPY {table} ({', '.join(columns)}) FROM STDIN") as copy:
+                for row in rows:
+                    copy.write_row(row)
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def close(self):
+        if self._conn is not None:
+            # Like sqlite3, closing discards anything not committed (read-only
+            # helpers never commit, so this also ends their implicit transaction)
+            if self._conn.info.transaction_status != TransactionStatus.IDLE:
+                self._conn.rollback()
+            self._pool.putconn(self._conn)
+            self._conn = None
+
+
+def _configure_session(conn):
+    conn.execute("SET TIME ZONE 'UTC'")
+    conn.commit()
+
+
+class PostgresBackend:
+    def __init__(self, url: str, min_size: int = POOL_MIN_SIZE, max_size: int = POOL_MAX_SIZE):
+        self.pool = ConnectionPool(
+            url,
+            min_size=min_size,
+            max_size=max_size,
+            kwargs={"row_factory": dict_row, "prepare_threshold": 0},
+            configure=_configure_session,
+            open=True,
+        )
+
+    def connect(self) -> PostgresConnection:
+        return PostgresConnection(self.pool)
+
+    def close(self):
+        self.pool.close()
@@ -0,0 +1,220 @@
+"""
+Deterministic demo data
+
+DemoFixtures stands in for Plaid when EXPO_PUBLIC_DEMO_MODE=1. Every user id
+gets its own accounts and transaction history, derived only from the seed,
+the user id and the date, so the same configuration always serves the same
+data and benchmarks are reproducible. Transactions are generated one day at
+a time as a page needs them, newest first, which keeps years of history for
+many users cheap: nothing is stored and a page only builds the days it
+returns.
+
+The history mixes day-to-day spending with recurring charges (rent,
+payroll, utilities and subscriptions on fixed days) and carries regret
+scores, so every endpoint sees realistic shapes without a Plaid or LLM call.
+
+Usage:
+    fixtures = DemoFixtures(seed=7, days=365 * 3)
+    fixtures.accounts("demo_user_0")
+    fixtures.transactions("demo_user_0", limit=100)
+"""
+
+import os
+import random
+from datetime import date, timedelta
+from typing import Iterator
+
+DEMO_SEED = int(os.environ.get("DEMO_SEED", "42"))
+DEMO_USERS = int(os.environ.get("DEMO_USERS", "1"))
+DEMO_ACCOUNTS = int(os.environ.get("DEMO_ACCOUNTS", "2"))
+DEMO_DAYS = int(os.environ.get("DEMO_DAYS", "90"))
+DEMO_DAILY_TRANSACTIONS = float(os.environ.get("DEMO_DAILY_TRANSACTIONS", "3"))
+# Pin the last day of history (YYYY-MM-DD) so runs on different days match
+DEMO_END_DATE = os.environ.get("DEMO_END_DATE", "")
+
+# (type, subtype, name, mask)
+ACCOUNT_KINDS = [
+    ("depository", "checking", "Plaid Checking", "0000"),
+    ("credit", "credit card", "Plaid Credit Card", "1111"),
+    ("depository", "savings", "Plaid Saving", "2222"),
+    ("credit", "credit card", "Plaid Rewards Card", "3333"),
+]
+
+# Day-to-day spending: (merchant, category, low, high, channel, regret, reason)
+MERCHANTS = [
+    ("Starbucks", ["Food and Drink", "Coffee Shop"], 4.0, 9.0, "in store", 35, "Daily coffee adds up"),
+    ("Whole Foods", ["Food and Drink", "Groceries"], 25.0, 140.0, "in store", 10, "Groceries are a necessity"),
+    ("Trader Joe's", ["Food and Drink", "Groceries"], 20.0, 90.0, "in store", 8, "Groceries are a necessity"),
+    ("Uber Eats", ["Food and Drink", "Restaurants"], 18.0, 55.0, "online", 70, "Late night delivery instead of cooking"),
+    ("McDonald's", ["Food and Drink", "Fast Food"], 6.0, 15.0, "in store", 60, "Unhealthy late night snack"),
+    ("Chipotle", ["Food and Drink", "Restaurants"], 10.0, 18.0, "in store", 30, "Lunch out"),
+    ("Amazon", ["Shops", "Digital Purchase"], 8.0, 180.0, "online", 55, "Impulse online order"),
+    ("Target", ["Shops", "Supermarkets and Groceries"], 15.0, 120.0, "in store", 30, "Household run with extras"),
+    ("Apple Store", ["Shops", "Electronics"], 29.0, 1500.0, "online", 85, "Expensive gadget upgrade"),
+    ("Uber", ["Travel", "Taxi"], 9.0, 45.0, "online", 40, "Ride instead of transit"),
+    ("Shell", ["Travel", "Gas Stations"], 30.0, 70.0, "in store", 5, "Fuel for commuting"),
+    ("Delta Airlines", ["Travel", "Airlines and Aviation Services"], 180.0, 650.0, "online", 45, "Travel splurge"),
+    ("CVS Pharmacy", ["Shops", "Pharmacies"], 6.0, 60.0, "in store", 10, "Health essentials"),
+    ("Steam", ["Shops", "Digital Purchase"], 5.0, 70.0, "online", 75, "Game bought on sale"),
+]
+
+# Recurring charges: (merchant, category, amount, day_of_month, regret, reason)
+MONTHLY = [
+    ("Netflix", ["Service", "Subscription"], 15.49, 15, 40, "Streaming subscription"),
+    ("Spotify", ["Service", "Subscription"], 11.99, 3, 25, "Music subscription"),
+    ("Planet Fitness", ["Recreation", "Gyms and Fitness Centers"], 24.99, 8, 50, "Gym membership"),
+    ("Electric Company", ["Service", "Utilities"], None, 21, 5, "Utility bill"),
+]
+
+
+class DemoFixtures:
+    def __init__(
+        self,
+        seed: int = DEMO_SEED,
+        users: int = DEMO_USERS,
+        accounts: int = DEMO_ACCOUNTS,
+        days: int = DEMO_DAYS,
+        daily_transactions: float = DEMO_DAILY_TRANSACTIONS,
+        end_date: date | None = None,
+    ):
+        self.seed = seed
+        self.users = users
+        self.account_count = max(1, min(accounts, len(ACCOUNT_KINDS)))
+        self.days = days
+        self.daily_transactions = daily_transactions
+        self.end_date = end_date or (date.fromisoformat(DEMO_END_DATE) if DEMO_END_DATE else date.today())
+        self.start_date = self.end_date - timedelta(days=days - 1)
+
+    def user_ids(self) -> list[str]:
+        """Ids of the configured demo users, for load tests that spread over several"""
+        return [f"demo_user_{i}" for i in range(self.users)]
+
+    def _rng(self, user_id: str, *parts) -> random.Random:
+        # String seeds hash deterministically (unlike hash()), across processes too
+        return random.Random(":".join(map(str, (self.seed, user_id, *parts))))
+
+    def accounts(self, user_id: str) -> list[dict]:
+        rng = self._rng(user_id, "accounts")
+        accounts = []
+        for account_type, subtype, name, mask in ACCOUNT_KINDS[:self.account_count]:
+            if account_type == "credit":
+                limit = float(rng.choice([2500, 5000, 7500, 12000]))
+                current = round(rng.uniform(0.05, 0.6) * limit, 2)
+                balances = {"available": round(limit - current, 2), "current": current, "limit": limit}
+            else:
+                current = round(rng.uniform(800, 9000), 2)
+                balances = {"available": round(current - rng.uniform(0, 50), 2), "current": current, "limit": None}
+            accounts.append({
+                "account_id": f"demo_{subtype.split()[0]}_{mask}",
+                "item_id": "demo_item",
+                "institution_id": "demo",
+                "name": name,
+                "official_name": f"{name} Account",
+                "type": account_type,
+                "subtype": subtype,
+                "mask": mask,
+                "balances": {**balances, "iso_currency_code": "USD"},
+            })
+        return accounts
+
+    def _profile(self, user_id: str) -> dict:
+        """Per-user amounts that stay fixed across the history, so recurring charges recur"""
+        rng = self._rng(user_id, "profile")
+        return {
+            "rent": float(rng.choice([1200, 1450, 1800, 2250])),
+            "payroll": round(rng.uniform(1800, 4200), 2),
+            # Payday is every other Friday, offset per user
+            "payroll_week": rng.randint(0, 1),
+            "subscriptions": [m for m in MONTHLY if rng.random() < 0.75],
+            "spend_weights": [rng.uniform(0.2, 3.0) for _ in MERCHANTS],
+        }
+
+    def _day(self, user_id: str, day: date, profile: dict, accounts: list[dict]) -> list[dict]:
+        """One day's transactions, newest (highest id) first"""
+        rng = self._rng(user_id, day.isoformat())
+        checking = accounts[0]["account_id"]
+        cards = [a["account_id"] for a in accounts if a["type"] == "credit"] or [checking]
+        rows = []
+
+        def add(account_id, merchant, category, amount, channel, regret, reason):
+            rows.append({
+                "transaction_id": f"demo_{day:%Y%m%d}_{len(rows):03d}",
+                "account_id": account_id,
+                "name": merchant,
+                "amount": amount,
+                "date": day.isoformat(),
+                "category": category,
+                "pending": day == self.end_date,
+                "merchant_name": merchant,
+                "payment_channel": channel,
+                "iso_currency_code": "USD",
+                "regretScore": max(0, min(100, regret + rng.randint(-10, 10))),
+                "regretReason": reason,
+            })
+
+        if day.day == 1:
+            add(checking, "Rent Payment", ["Payment", "Rent"], profile["rent"], "other", 0, "Rent is a fixed cost")
+        if day.weekday() == 4 and (day.toordinal() // 7) % 2 == profile["payroll_week"]:
+            add(checking, "Payroll Deposit", ["Transfer", "Payroll"], -profile["payroll"], "other", 0, "Income")
+        for merchant, category, amount, day_of_month, regret, reason in profile["subscriptions"]:
+            if day.day == day_of_month:
+                if amount is None:
+                    # Utility bills vary month to month
+                    amount = round(rng.uniform(60, 140), 2)
+                add(cards[0], merchant, category, amount, "online", regret, reason)
+
+        # Spending is Poisson-ish around the configured daily mean, busier at weekends
+        mean = self.daily_transactions * (1.3 if day.weekday() >= 5 else 0.9)
+        count = sum(1 for _ in range(int(mean * 2)) if rng.random() < 0.5)
+        for _ in range(count):
+            merchant, category, low, high, channel, regret, reason = rng.choices(
+                MERCHANTS, weights=profile["spend_weights"],
+            )[0]
+            add(rng.choice(cards), merchant, category, round(rng.uniform(low, high), 2), channel, regret, reason)
+
+        rows.reverse()
+        return rows
+
+    def iter_transactions(
+        self,
+        user_id: str,
+        before: tuple[str, str] | None = None,
+        start_date: str | None = None,
+        end_date: str | None = None,
+        category: str | None = None,
+        min_regret: int | None = None,
+    ) -> Iterator[dict]:
+        """
+        Transactions ordered like database.get_transactions (date then id,
+        newest first), generated a day at a time from the newest day the
+        filters allow. `before` is the (date, transaction_id) keyset cursor.
+        """
+        day = self.end_date
+        if end_date:
+            day = min(day, date.fromisoformat(end_date))
+        if before:
+            day = min(day, date.fromisoformat(before[0]))
+        first = self.start_date
+        if start_date:
+            first = max(first, date.fromisoformat(start_date))
+
+        profile = self._profile(user_id)
+        accounts = self.accounts(user_id)
+        while day >= first:
+            for txn in self._day(user_id, day, profile, accounts):
+                if before and (txn["date"], txn["transaction_id"]) >= before:
+                    continue
+                if category and category not in txn["category"]:
+                    continue
+                if min_regret is not None and txn["regretScore"] < min_regret:
+                    continue
+                yield txn
+            day -= timedelta(days=1)
+
+    def transactions(self, user_id: str, limit: int = 100, **filters) -> list[dict]:
+        transactions = []
+        for txn in self.iter_transactions(user_id, **filters):
+            transactions.append(txn)
+            if len(transactions) == limit:
+                break
+        return transactions
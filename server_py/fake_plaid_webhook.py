@@ -0,0 +1,62 @@
+"""
+Post fake Plaid webhooks to a local server
+
+Stands in for Plaid when developing against /api/plaid/webhook: sends
+TRANSACTIONS payloads shaped like the real ones, for one Item or for
+every Item linked in the local database.
+
+    python server_py/fake_plaid_webhook.py --item-id <item_id>
+    python server_py/fake_plaid_webhook.py --all --code DEFAULT_UPDATE
+
+The server only accepts webhooks it can verify, so these carry the shared
+secret (--secret, by default PLAID_WEBHOOK_SECRET) in the URL.
+"""
+
+import argparse
+import os
+
+import httpx
+
+import database
+
+
+def build_payload(item_id: str, code: str) -> dict:
+    payload = {
+        "webhook_type": "TRANSACTIONS",
+        "webhook_code": code,
+        "item_id": item_id,
+        "environment": "sandbox",
+    }
+    if code == "SYNC_UPDATES_AVAILABLE":
+        payload["initial_update_complete"] = True
+        payload["historical_update_complete"] = True
+    else:
+        payload["new_transactions"] = 1
+    return payload
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Send fake Plaid TRANSACTIONS webhooks")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--item-id", help="Item to send the webhook for")
+    target.add_argument("--all", action="store_true", help="Send one webhook per Item in the local database")
+    parser.add_argument("--url", default="http://localhost:5000/api/plaid/webhook")
+    parser.add_argument("--code", default="SYNC_UPDATES_AVAILABLE")
+    parser.add_argument("--secret", default=os.environ.get("PLAID_WEBHOOK_SECRET", ""))
+    args = parser.parse_args()
+
+    if args.all:
+        conn = database.get_db_connection()
+        item_ids = [row["item_id"] for row in conn.execute("SELECT item_id FROM plaid_items").fetchall()]
+        conn.close()
+    else:
+        item_ids = [args.item_id]
+
+    with httpx.Client(timeout=10) as client:
+        for item_id in item_ids:
+            response = client.post(args.url, json=build_payload(item_id, args.code), params={"secret": args.secret})
+            print(f"{item_id}: {response.status_code} {response.text}")
+
+
+if __name__ == "__main__":
+    main()
@@ -9,6 +9,7 @@ from datetime import datetime, timedelta
 sys.path.append(str(Path(__file__).parent.parent))
 
 from nessie_client import NessieClient
+from recurring import detect_recurring, monthly_total
 from dedalus_mcp import MCPServer
 
 # Initialize server
@@ -18,37 +19,6 @@ server = MCPServer("Nessie Finance Server")
 nessie_api_key = os.environ.get("NESSIE_API_KEY", "")
 nessie_client = NessieClient(api_key=nessie_api_key)
 
-# --- Smart Diagnostic Helpers ---
-
-def analyze_recurring_payments(transactions: List[Dict]) -> List[Dict]:
-    """
-    Identifies potential subscriptions/recurring payments.
-    Logic: Same amount + same merchant + regular intervals (approx 30 days).
-    """
-    history = {}
-    subscriptions = []
-    
-    for txn in transactions:
-        key = (txn.get('merchant_name') or txn.get('name'), txn.get('amount'))
-        if key not in history:
-            history[key] = []
-        history[key].append(txn)
-        
-    for (name, amount), txns in history.items():
-        if len(txns) >= 2:
-            # Check interval
-            dates = sorted([txn['date'] for txn in txns])
-            # Simple check: just flag anything with >1 occurrence for now as a "potential"
-            subscriptions.append({
-                "merchant": name,
-                "amount": amount,
-                "frequency_count": len(txns),
-                "last_date": dates[-1],
-                "confidence": "high" if len(txns) > 2 else "medium"
-            })
-            
-    return subscriptions
-
 # --- Tools ---
 
 @server.tool()
@@ -58,12 +28,13 @@ async def detect_subscription_traps(account_id: str) -> Dict[str, Any]:
     Returns a list of suspects with confidence scores.
     """
     try:
-        # Fetch last 90 days of transactions (simulated by fetching all for now)
-        purchases = await nessie_client.get_account_purchases(account_id)
+        # Two years of purchases, enough to see annual renewals twice
+        since = (datetime.now() - timedelta(days=730)).date()
+        purchases = list(await nessie_client.filter_account_history(account_id, "purchases", since))
         
-        subscriptions = analyze_recurring_payments(purchases)
+        subscriptions = await asyncio.to_thread(detect_recurring, purchases)
         
-        total_monthly = sum(s['amount'] for s in subscriptions)
+        total_monthly = monthly_total(subscriptions)
         
         return {
             "suspected_subscriptions": subscriptions,
@@ -120,34 +91,43 @@ async def get_financial_health_report(account_id: str) -> Dict[str, Any]:
     spending velocity, and savings rate.
     """
     try:
-        # Gather data
-        results = await asyncio.gather(
-            nessie_client.get_account(account_id),
-            nessie_client.get_account_purchases(account_id),
-            nessie_client.get_account_deposits(account_id),
-            return_exceptions=True
+        # Totals over the last 30 days. Each part is fetched on its own, so
+        # one that fails is reported and left out instead of failing the report
+        since = (datetime.now() - timedelta(days=30)).date()
+        errors = {}
+
+        async def window_total(kind: str) -> float:
+            try:
+                history = await nessie_client.filter_account_history(account_id, kind, since)
+                return sum(item.get('amount', 0) for item in history)
+            except Exception as e:
+                errors[kind] = str(e)
+                return 0.0
+
+        async def load_account() -> Dict[str, Any]:
+            try:
+                return await nessie_client.get_account(account_id)
+            except Exception as e:
+                errors["account"] = str(e)
+                return {}
+
+        account, total_spent, total_income = await asyncio.gather(
+            load_account(), window_total("purchases"), window_total("deposits"),
         )
         
-        account = results[0]
-        purchases = results[1] if isinstance(results[1], list) else []
-        deposits = results[2] if isinstance(results[2], list) else []
-        
-        # Calculate basic metrics
-        total_spent = sum(p.get('amount', 0) for p in purchases)
-        total_income = sum(d.get('amount', 0) for d in deposits)
-        
         savings_rate = 0
         if total_income > 0:
             savings_rate = (total_income - total_spent) / total_income
             
         return {
             "account_name": account.get('nickname', 'Account'),
-            "liquidity": account.get('balance', 0),
+            "liquidity": account.get('balance', 0) if account else None,
             "spending_velocity_30d": total_spent,
             "income_velocity_30d": total_income,
             "savings_rate_percent": round(savings_rate * 100, 1),
             "burn_rate_status": "Sustainable" if savings_rate > 0 else "Unsustainable",
-            "last_updated": datetime.now().isoformat()
+            "last_updated": datetime.now().isoformat(),
+            **({"degraded": True, "errors": errors} if errors else {}),
         }
         
     except Exception as e:
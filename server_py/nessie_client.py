@@ -1,17 +1,380 @@
 import os
+import time
 import httpx
+import random
 import asyncio
-from typing import Any, Dict, List, Optional
+from datetime import date
+from typing import Any, Dict, Iterator, List, Optional, Union
+
+from adaptive_limiter import AdaptiveLimiter
+from resilience import CircuitBreaker, LatencyWindow
+from response_cache import ResponseCache
 
 NESSIE_BASE_URL = os.getenv("NESSIE_BASE_URL", "https://api.reimaginebanking.com")
 NESSIE_API_KEY = os.getenv("NESSIE_API_KEY", "")
+NESSIE_MAX_CONNECTIONS = int(os.getenv("NESSIE_MAX_CONNECTIONS", "20"))
+NESSIE_MAX_KEEPALIVE = int(os.getenv("NESSIE_MAX_KEEPALIVE", "10"))
+# HTTP/2 multiplexes a snapshot's fan-out over one connection; needs the h2 package
+NESSIE_HTTP2 = os.getenv("NESSIE_HTTP2", "0") == "1"
+NESSIE_TIMEOUT_SECONDS = float(os.getenv("NESSIE_TIMEOUT_SECONDS", "20"))
+# Requests in flight per Nessie client, and to its upstream host. Both
+# shrink when Nessie answers 429/503 or times out and grow back as it recovers.
+NESSIE_MAX_CONCURRENCY = int(os.getenv("NESSIE_MAX_CONCURRENCY", "16"))
+NESSIE_HOST_CONCURRENCY = int(os.getenv("NESSIE_HOST_CONCURRENCY", "8"))
+# Each logical GET gets up to NESSIE_RETRIES retries on timeouts, connection
+# errors, 429 and 5xx, but never runs past NESSIE_DEADLINE_SECONDS in total
+# from its first attempt upstream. Waiting here for a limiter slot is bounded
+# separately, so a fan-out that only queues locally does not use up the deadline.
+NESSIE_RETRIES = int(os.getenv("NESSIE_RETRIES", "2"))
+NESSIE_RETRY_BASE_SECONDS = float(os.getenv("NESSIE_RETRY_BASE_SECONDS", "0.2"))
+NESSIE_ATTEMPT_TIMEOUT_SECONDS = float(os.getenv("NESSIE_ATTEMPT_TIMEOUT_SECONDS", "4"))
+NESSIE_DEADLINE_SECONDS = float(os.getenv("NESSIE_DEADLINE_SECONDS", "8"))
+NESSIE_QUEUE_TIMEOUT_SECONDS = float(os.getenv("NESSIE_QUEUE_TIMEOUT_SECONDS", "60"))
+# A duplicate request is sent when the first one is slower than this
+# percentile of the endpoint's recent latency; 0 turns hedging off
+NESSIE_HEDGE_PERCENTILE = float(os.getenv("NESSIE_HEDGE_PERCENTILE", "95"))
+NESSIE_BREAKER_FAILURES = int(os.getenv("NESSIE_BREAKER_FAILURES", "5"))
+NESSIE_BREAKER_RESET_SECONDS = float(os.getenv("NESSIE_BREAKER_RESET_SECONDS", "30"))
+NESSIE_CACHE_ENABLED = os.getenv("NESSIE_CACHE_ENABLED", "1") == "1"
+NESSIE_CACHE_STALE_SECONDS = float(os.getenv("NESSIE_CACHE_STALE_SECONDS", "600"))
+NESSIE_CACHE_MAX_ENTRIES = int(os.getenv("NESSIE_CACHE_MAX_ENTRIES", "2048"))
+
+# The date each kind of account history is windowed by
+HISTORY_DATE_FIELDS = {
+    "purchases": "purchase_date",
+    "deposits": "transaction_date",
+    "transfers": "transaction_date",
+    "withdrawals": "transaction_date",
+    "bills": "payment_date",
+}
+
+# Seconds each kind of read stays fresh. Balances move with every purchase;
+# customers and loans hardly ever change.
+NESSIE_CACHE_TTLS = {
+    "customers": 300,
+    "customer": 600,
+    "customer_accounts": 60,
+    "account": 30,
+    "account_customer": 600,
+    "bills": 120,
+    "deposits": 60,
+    "loans": 600,
+    "purchases": 60,
+    "transfers": 60,
+    "withdrawals": 60,
+}
+
+OVERLOAD_STATUSES = {429, 503}
+
+
+class QueueTimeout(asyncio.TimeoutError):
+    """No limiter slot came free within the queue timeout; Nessie was never asked"""
+
+
+class _Budget:
+    """Time limits of one logical GET: until when it may queue, and its deadline once upstream"""
+
+    __slots__ = ("queue_until", "deadline")
+
+    def __init__(self, queue_until: float):
+        self.queue_until = queue_until
+        self.deadline: Optional[float] = None
+
+
+def is_retryable(error: Exception) -> bool:
+    """Whether the failure says Nessie is struggling, rather than the request being wrong"""
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code == 429 or error.response.status_code >= 500
+    if isinstance(error, QueueTimeout):
+        return False
+    return isinstance(error, (httpx.TransportError, asyncio.TimeoutError))
+
 
 class NessieClient:
-    def __init__(self, base_url: str = NESSIE_BASE_URL, api_key: str = NESSIE_API_KEY):
+    """
+    Async Nessie API client. One instance owns one pooled httpx client, so
+    concurrent and successive requests reuse kept-alive connections instead
+    of paying a TCP+TLS handshake each. Call start() and aclose() from the
+    app's lifecycle hooks; the pool is also opened on first use, for callers
+    without hooks such as the MCP server.
+
+    Reads are cached per path with a TTL per kind of data (NESSIE_CACHE_TTLS)
+    and then served stale for up to NESSIE_CACHE_STALE_SECONDS while they
+    refresh in the background. Results are shared between callers, so treat
+    them as read-only. invalidate_account() drops what is cached for one
+    account after it changes.
+
+    Concurrent identical GETs share one request, and every request takes a
+    slot from the client's overall and per-host AdaptiveLimiters first, so
+    a large fan-out queues here instead of tripping Nessie's rate limits.
+    The limiters belong to the instance, like the pool, so use each client
+    from one event loop at a time.
+
+    Failures Nessie may recover from are retried with jittered exponential
+    backoff. A request slower than the endpoint's recent p95 gets a hedged
+    duplicate, and whichever answers first wins. Each endpoint has a
+    CircuitBreaker that fails calls at once while Nessie keeps failing
+    them. health() reports all of it.
+    """
+
+    def __init__(
+        self,
+        base_url: str = NESSIE_BASE_URL,
+        api_key: str = NESSIE_API_KEY,
+        max_connections: int = NESSIE_MAX_CONNECTIONS,
+        max_keepalive: int = NESSIE_MAX_KEEPALIVE,
+        http2: bool = NESSIE_HTTP2,
+        timeout: float = NESSIE_TIMEOUT_SECONDS,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+        cache_enabled: bool = NESSIE_CACHE_ENABLED,
+        cache_ttls: Optional[Dict[str, float]] = None,
+        cache_stale_seconds: float = NESSIE_CACHE_STALE_SECONDS,
+        cache: Optional[ResponseCache] = None,
+        limiter: Optional[AdaptiveLimiter] = None,
+        host_limiter: Optional[AdaptiveLimiter] = None,
+        retries: int = NESSIE_RETRIES,
+        retry_base_seconds: float = NESSIE_RETRY_BASE_SECONDS,
+        attempt_timeout: float = NESSIE_ATTEMPT_TIMEOUT_SECONDS,
+        deadline: float = NESSIE_DEADLINE_SECONDS,
+        queue_timeout: float = NESSIE_QUEUE_TIMEOUT_SECONDS,
+        hedge_percentile: float = NESSIE_HEDGE_PERCENTILE,
+        breaker_failures: int = NESSIE_BREAKER_FAILURES,
+        breaker_reset_seconds: float = NESSIE_BREAKER_RESET_SECONDS,
+    ):
         self.base_url = base_url.rstrip("/")
         self.api_key = api_key
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive)
+        self.http2 = http2
+        self.timeout = timeout
+        self.transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+        self.limiter = limiter or AdaptiveLimiter(NESSIE_MAX_CONCURRENCY)
+        self.host_limiter = host_limiter or AdaptiveLimiter(NESSIE_HOST_CONCURRENCY)
+        self._inflight: Dict[Any, asyncio.Task] = {}
+        self.retries = retries
+        self.retry_base_seconds = retry_base_seconds
+        self.attempt_timeout = attempt_timeout
+        self.deadline = deadline
+        self.queue_timeout = queue_timeout
+        self.hedge_percentile = hedge_percentile
+        self.breaker_failures = breaker_failures
+        self.breaker_reset_seconds = breaker_reset_seconds
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self.latencies: Dict[str, LatencyWindow] = {}
+        self.stats = {"requests": 0, "coalesced": 0, "retries": 0, "hedges": 0, "hedge_wins": 0}
+        self.cache_ttls = {**NESSIE_CACHE_TTLS, **(cache_ttls or {})}
+        self.cache_stale_seconds = cache_stale_seconds
+        self.cache = None
+        if cache_enabled:
+            self.cache = cache or ResponseCache(ttl=0, max_entries=NESSIE_CACHE_MAX_ENTRIES)
 
-    async def _get(self, path: str, params: Optional[Dict[str, Any]] = None) -> Any:
+    async def start(self):
+        self._open()
+
+    async def aclose(self):
+        if self._client is not None:
+            client, self._client = self._client, None
+            await client.aclose()
+
+    def _open(self) -> httpx.AsyncClient:
+        if self._client is None:
+            http2 = self.http2
+            if http2:
+                try:
+                    import h2  # noqa: F401
+                except ImportError:
+                    print("NESSIE_HTTP2 is set but the h2 package is not installed; using HTTP/1.1")
+                    http2 = False
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=self.timeout,
+                limits=self.limits,
+                http2=http2,
+                transport=self.transport,
+            )
+        return self._client
+
+    def invalidate_account(self, account_id: str):
+        """Forget everything cached for the account, and the customer account lists its balance appears in"""
+        prefix = f"/accounts/{account_id}"
+        self._invalidate(lambda path: path == prefix or path.startswith(prefix + "/") or path.endswith("/accounts"))
+
+    def invalidate_customer(self, customer_id: str):
+        prefix = f"/customers/{customer_id}"
+        self._invalidate(lambda path: path == prefix or path.startswith(prefix + "/"))
+
+    def _invalidate(self, matches):
+        if self.cache is not None:
+            self.cache.invalidate_where(lambda key: matches(key[0]))
+
+    async def _get(
+        self, path: str, params: Optional[Dict[str, Any]] = None, kind: Optional[str] = None, fresh: bool = False,
+    ) -> Any:
+        """
+        GET `path`, through the cache when `kind` names one of
+        NESSIE_CACHE_TTLS. `fresh` skips the cache for callers that keep
+        their own copy and need Nessie's current answer.
+        """
+        ttl = self.cache_ttls.get(kind, 0) if kind else 0
+        if self.cache is None or ttl <= 0 or fresh:
+            return await self._fetch(path, params, kind)
+        key = (path, tuple(sorted((params or {}).items())))
+        return await self.cache.get(
+            key,
+            lambda: self._fetch(path, params, kind),
+            ttl=ttl,
+            stale_ttl=ttl + self.cache_stale_seconds,
+        )
+
+    async def _fetch(self, path: str, params: Optional[Dict[str, Any]] = None, kind: Optional[str] = None) -> Any:
+        """One upstream GET, shared with any identical GET already in flight"""
+        key = (path, tuple(sorted((params or {}).items())))
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._resilient_fetch(path, params, kind or "other"))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.stats["coalesced"] += 1
+        # Shielded so one caller giving up doesn't cancel the request for the others
+        return await asyncio.shield(task)
+
+    def health(self) -> dict:
+        """Circuit breaker states, concurrency limits and counters"""
+        return {
+            "breakers": {name: b.snapshot() for name, b in self.breakers.items()},
+            "limiter": self.limiter.snapshot(),
+            "host_limiter": self.host_limiter.snapshot(),
+            "cache": dict(self.cache.stats) if self.cache is not None else None,
+            **self.stats,
+        }
+
+    def _breaker(self, kind: str) -> CircuitBreaker:
+        if kind not in self.breakers:
+            self.breakers[kind] = CircuitBreaker(
+                f"nessie:{kind}", failure_threshold=self.breaker_failures, reset_seconds=self.breaker_reset_seconds,
+            )
+        return self.breakers[kind]
+
+    async def _resilient_fetch(self, path: str, params: Optional[Dict[str, Any]], kind: str) -> Any:
+        breaker = self._breaker(kind)
+        loop = asyncio.get_running_loop()
+        budget = _Budget(loop.time() + self.queue_timeout)
+        attempt = 0
+        while True:
+            breaker.before_call()
+            try:
+                result = await self._hedged_fetch(path, params, kind, budget)
+            except (asyncio.CancelledError, QueueTimeout):
+                # Never reached Nessie, so it says nothing about the endpoint
+                breaker.record_abandoned()
+                raise
+            except Exception as e:
+                if not is_retryable(e):
+                    # Nessie answered (a 404, say); the endpoint itself is fine
+                    breaker.record_success()
+                    raise
+                breaker.record_failure()
+                delay = self.retry_base_seconds * 2 ** attempt * random.uniform(0.5, 1.5)
+                if attempt >= self.retries or loop.time() + delay >= budget.deadline:
+                    raise
+                attempt += 1
+                self.stats["retries"] += 1
+                print(f"Nessie {kind} request failed ({e!r}); retry {attempt} in {delay:.2f}s")
+                await asyncio.sleep(delay)
+                continue
+            breaker.record_success()
+            return result
+
+    async def _hedged_fetch(self, path: str, params: Optional[Dict[str, Any]], kind: str, budget: _Budget) -> Any:
+        """Send the request, and a duplicate if the first is unusually slow. First success wins."""
+        window = self.latencies.setdefault(kind, LatencyWindow())
+        hedge_after = window.percentile(self.hedge_percentile) if self.hedge_percentile else None
+        started = asyncio.Event()
+        primary = asyncio.create_task(self._timed_fetch(path, params, window, budget, started))
+        if hedge_after is None:
+            return await primary
+
+        tasks = {primary}
+        try:
+            # Only time spent upstream counts towards hedging, not the wait for a slot
+            slot = asyncio.create_task(started.wait())
+            try:
+                await asyncio.wait({primary, slot}, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                slot.cancel()
+            done, _ = await asyncio.wait(tasks, timeout=hedge_after)
+            if not done:
+                self.stats["hedges"] += 1
+                tasks.add(asyncio.create_task(self._timed_fetch(path, params, window, budget)))
+            error = None
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                failures = {task: task.exception() for task in done}
+                for task, failure in failures.items():
+                    if failure is None:
+                        if task is not primary:
+                            self.stats["hedge_wins"] += 1
+                        return task.result()
+                    error = error or failure
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _timed_fetch(
+        self,
+        path: str,
+        params: Optional[Dict[str, Any]],
+        window: LatencyWindow,
+        budget: _Budget,
+        started: Optional[asyncio.Event] = None,
+    ) -> Any:
+        """
+        One attempt. Waiting for limiter slots is bounded by the queue
+        timeout and raises QueueTimeout; the attempt timeout, and with the
+        first attempt the deadline, start once the request goes upstream.
+        """
+        loop = asyncio.get_running_loop()
+        try:
+            global_token, host_token = await asyncio.wait_for(self._acquire(), budget.queue_until - loop.time())
+        except asyncio.TimeoutError:
+            raise QueueTimeout(f"No Nessie request slot came free in time ({self.limiter.snapshot()})") from None
+        if started is not None:
+            started.set()
+        if budget.deadline is None:
+            budget.deadline = loop.time() + self.deadline
+        overloaded = False
+        try:
+            timeout = min(self.attempt_timeout, budget.deadline - loop.time())
+            if timeout <= 0:
+                raise asyncio.TimeoutError()
+            start = time.perf_counter()
+            result = await asyncio.wait_for(self._send(path, params, timeout), timeout)
+            window.record(time.perf_counter() - start)
+            return result
+        except httpx.HTTPStatusError as e:
+            overloaded = e.response.status_code in OVERLOAD_STATUSES
+            raise
+        except (httpx.TimeoutException, asyncio.TimeoutError):
+            overloaded = True
+            raise
+        finally:
+            self.host_limiter.release(host_token, overloaded)
+            self.limiter.release(global_token, overloaded)
+
+    async def _acquire(self) -> tuple[int, int]:
+        """Slots from the overall and the per-host limiter, in that order"""
+        global_token = await self.limiter.acquire()
+        try:
+            host_token = await self.host_limiter.acquire()
+        except BaseException:
+            self.limiter.release(global_token)
+            raise
+        return global_token, host_token
+
+    async def _send(self, path: str, params: Optional[Dict[str, Any]], timeout: Optional[float] = None) -> Any:
+        self.stats["requests"] += 1
         if params is None:
             params = {}
 
@@ -20,38 +383,60 @@ class NessieClient:
         if self.api_key:
             params_with_key["key"] = self.api_key
 
-        url = f"{self.base_url}{path}"
-        async with httpx.AsyncClient(timeout=20) as client:
-            r = await client.get(url, params=params_with_key)
-            r.raise_for_status()
-            return r.json()
+        r = await self._open().get(path, params=params_with_key, timeout=timeout or self.timeout)
+        r.raise_for_status()
+        return r.json()
+
+    async def get_customers(self, fresh: bool = False) -> List[Dict[str, Any]]:
+        return await self._get("/customers", kind="customers", fresh=fresh)
+
+    async def get_customer(self, customer_id: str, fresh: bool = False) -> Dict[str, Any]:
+        return await self._get(f"/customers/{customer_id}", kind="customer", fresh=fresh)
 
-    async def get_customers(self) -> List[Dict[str, Any]]:
-        return await self._get("/customers")
+    async def get_customer_accounts(self, customer_id: str, fresh: bool = False) -> List[Dict[str, Any]]:
+        return await self._get(f"/customers/{customer_id}/accounts", kind="customer_accounts", fresh=fresh)
 
-    async def get_customer_accounts(self, customer_id: str) -> List[Dict[str, Any]]:
-        return await self._get(f"/customers/{customer_id}/accounts")
+    async def get_account(self, account_id: str, fresh: bool = False) -> Dict[str, Any]:
+        return await self._get(f"/accounts/{account_id}", kind="account", fresh=fresh)
 
-    async def get_account(self, account_id: str) -> Dict[str, Any]:
-        return await self._get(f"/accounts/{account_id}")
+    async def get_account_customer(self, account_id: str, fresh: bool = False) -> Dict[str, Any]:
+        return await self._get(f"/accounts/{account_id}/customer", kind="account_customer", fresh=fresh)
 
-    async def get_account_customer(self, account_id: str) -> Dict[str, Any]:
-        return await self._get(f"/accounts/{account_id}/customer")
+    async def get_account_bills(self, account_id: str, fresh: bool = False) -> List[Dict[str, Any]]:
+        return await self._get(f"/accounts/{account_id}/bills", kind="bills", fresh=fresh)
 
-    async def get_account_bills(self, account_id: str) -> List[Dict[str, Any]]:
-        return await self._get(f"/accounts/{account_id}/bills")
+    async def get_account_deposits(self, account_id: str, fresh: bool = False) -> List[Dict[str, Any]]:
+        return await self._get(f"/accounts/{account_id}/deposits", kind="deposits", fresh=fresh)
 
-    async def get_account_deposits(self, account_id: str) -> List[Dict[str, Any]]:
-        return await self._get(f"/accounts/{account_id}/deposits")
+    async def get_account_loans(self, account_id: str, fresh: bool = False) -> List[Dict[str, Any]]:
+        return await self._get(f"/accounts/{account_id}/loans", kind="loans", fresh=fresh)
 
-    async def get_account_loans(self, account_id: str) -> List[Dict[str, Any]]:
-        return await self._get(f"/accounts/{account_id}/loans")
+    async def get_account_purchases(self, account_id: str, fresh: bool = False) -> List[Dict[str, Any]]:
+        return await self._get(f"/accounts/{account_id}/purchases", kind="purchases", fresh=fresh)
 
-    async def get_account_purchases(self, account_id: str) -> List[Dict[str, Any]]:
-        return await self._get(f"/accounts/{account_id}/purchases")
+    async def get_account_transfers(self, account_id: str, fresh: bool = False) -> List[Dict[str, Any]]:
+        return await self._get(f"/accounts/{account_id}/transfers", kind="transfers", fresh=fresh)
 
-    async def get_account_transfers(self, account_id: str) -> List[Dict[str, Any]]:
-        return await self._get(f"/accounts/{account_id}/transfers")
+    async def get_account_withdrawals(self, account_id: str, fresh: bool = False) -> List[Dict[str, Any]]:
+        return await self._get(f"/accounts/{account_id}/withdrawals", kind="withdrawals", fresh=fresh)
 
-    async def get_account_withdrawals(self, account_id: str) -> List[Dict[str, Any]]:
-        return await self._get(f"/accounts/{account_id}/withdrawals")
+    async def filter_account_history(
+        self,
+        account_id: str,
+        kind: str,
+        start_date: Union[date, str, None] = None,
+        end_date: Union[date, str, None] = None,
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        An account's purchases, deposits, transfers, withdrawals or bills dated
+        from start_date to end_date (inclusive, either may be open), in the
+        order Nessie lists them. Nessie has no date filter, so this fetches
+        (or reuses the cached) full history and filters it as it is iterated:
+        latency and memory are those of the whole history, however narrow the
+        window.
+        """
+        records = await self._get(f"/accounts/{account_id}/{kind}", kind=kind)
+        field = HISTORY_DATE_FIELDS[kind]
+        start = str(start_date) if start_date else ""
+        end = str(end_date) if end_date else "9999-12-31"
+        return (r for r in records if start <= (r.get(field) or "")[:10] <= end)
@@ -0,0 +1,222 @@
+"""
+Materialized Nessie customer snapshots
+
+A snapshot is kept in the nessie_snapshot_sections table, one row per
+section: the customer, their account list, and each account's details,
+bills, deposits, loans, purchases, transfers and withdrawals. Each row
+records when it was fetched and when it goes stale (the section's TTL
+from NESSIE_CACHE_TTLS), so refreshing only touches the sections that are
+due and reading a snapshot is one local query.
+
+SnapshotRefresher keeps the snapshots of recently viewed customers up to
+date in the background, and refreshes on demand when a reader needs
+fresher data than is stored.
+"""
+
+import asyncio
+import os
+import time
+from typing import Awaitable, Callable
+
+import database
+from nessie_client import NESSIE_CACHE_TTLS, NessieClient
+
+NESSIE_SNAPSHOT_REFRESH_SECONDS = float(os.environ.get("NESSIE_SNAPSHOT_REFRESH_SECONDS", "60"))
+# Customers nobody has viewed for this long are left to go stale
+NESSIE_SNAPSHOT_KEEP_WARM_SECONDS = float(os.environ.get("NESSIE_SNAPSHOT_KEEP_WARM_SECONDS", "3600"))
+# A section whose fetch failed is retried after at most this long
+ERROR_RETRY_SECONDS = 30.0
+
+Fetch = Callable[[NessieClient, str], Awaitable]
+
+# Section -> (NessieClient getter, NESSIE_CACHE_TTLS kind giving its TTL)
+CUSTOMER_SECTIONS: dict[str, tuple[Fetch, str]] = {
+    "customer": (lambda client, cid: client.get_customer(cid, fresh=True), "customer"),
+    "accounts": (lambda client, cid: client.get_customer_accounts(cid, fresh=True), "customer_accounts"),
+}
+ACCOUNT_SECTIONS: dict[str, tuple[Fetch, str]] = {
+    "account": (lambda client, aid: client.get_account(aid, fresh=True), "account"),
+    "bills": (lambda client, aid: client.get_account_bills(aid, fresh=True), "bills"),
+    "deposits": (lambda client, aid: client.get_account_deposits(aid, fresh=True), "deposits"),
+    "loans": (lambda client, aid: client.get_account_loans(aid, fresh=True), "loans"),
+    "purchases": (lambda client, aid: client.get_account_purchases(aid, fresh=True), "purchases"),
+    "transfers": (lambda client, aid: client.get_account_transfers(aid, fresh=True), "transfers"),
+    "withdrawals": (lambda client, aid: client.get_account_withdrawals(aid, fresh=True), "withdrawals"),
+}
+
+
+def nessie_account_id(a: dict) -> str | None:
+    return a.get("_id") or a.get("id") or a.get("account_id")
+
+
+def _section_value(row: dict | None):
+    """What a snapshot shows for a section: its data, or the error if it never loaded"""
+    if row is None:
+        return {"error": "not_loaded"}
+    if row["data"] is None:
+        return {"error": row["error"] or "not_loaded"}
+    return row["data"]
+
+
+def assemble_snapshot(customer_id: str, sections: list[dict], now: float | None = None) -> dict | None:
+    """
+    Build the snapshot response from materialized rows, in the shape the live
+    snapshot had, plus per-section fetched_at, the oldest fetch (`as_of`)
+    and whether anything is stale. None when no account list is stored.
+    """
+    now = time.time() if now is None else now
+    rows = {(s["account_id"], s["section"]): s for s in sections}
+    account_list = rows.get(("", "accounts"))
+    if account_list is None or account_list["data"] is None:
+        return None
+
+    customer = _section_value(rows.get(("", "customer")))
+    accounts = []
+    for a in account_list["data"]:
+        aid = nessie_account_id(a)
+        if not aid:
+            accounts.append({"raw": a, "error": "missing_account_id"})
+            continue
+        hydrated = {"account": _section_value(rows.get((aid, "account"))), "customer": customer}
+        for section in ACCOUNT_SECTIONS:
+            if section != "account":
+                hydrated[section] = _section_value(rows.get((aid, section)))
+        hydrated["fetched_at"] = {
+            section: rows[(aid, section)]["fetched_at"] for section in ACCOUNT_SECTIONS if (aid, section) in rows
+        }
+        accounts.append(hydrated)
+
+    fetched = [s["fetched_at"] for s in sections if s["fetched_at"] is not None]
+    return {
+        "customer_id": customer_id,
+        "accounts": accounts,
+        "as_of": min(fetched) if fetched else None,
+        "stale": any(s["stale_at"] <= now for s in sections),
+    }
+
+
+def snapshot_age(sections: list[dict], now: float) -> float:
+    """Seconds since the oldest section was fetched; infinite if one never was"""
+    if not sections or any(s["fetched_at"] is None for s in sections):
+        return float("inf")
+    return now - min(s["fetched_at"] for s in sections)
+
+
+async def refresh_snapshot(client: NessieClient, customer_id: str, max_age: float | None = None) -> int:
+    """
+    Fetch the customer's sections that are missing, past their TTL or, with
+    `max_age`, older than that many seconds, and store them. Sections that
+    are still fresh are not requested. Returns how many were fetched.
+    """
+    now = time.time()
+    stored = {
+        (s["account_id"], s["section"]): s
+        for s in await asyncio.to_thread(database.get_snapshot_sections, customer_id)
+    }
+
+    def due(account_id: str, section: str) -> bool:
+        row = stored.get((account_id, section))
+        if row is None or row["stale_at"] <= now:
+            return True
+        return max_age is not None and (row["fetched_at"] is None or now - row["fetched_at"] > max_age)
+
+    async def fetch(account_id: str, section: str, key: str, fetcher: Fetch, kind: str) -> dict:
+        ttl = NESSIE_CACHE_TTLS[kind]
+        try:
+            data = await fetcher(client, key)
+        except Exception as e:
+            print(f"Snapshot refresh of {customer_id}/{account_id or '-'}/{section} failed: {e}")
+            return {
+                "account_id": account_id, "section": section, "data": None, "error": str(e) or type(e).__name__,
+                "fetched_at": None, "stale_at": time.time() + min(ttl, ERROR_RETRY_SECONDS),
+            }
+        fetched_at = time.time()
+        return {
+            "account_id": account_id, "section": section, "data": data, "error": None,
+            "fetched_at": fetched_at, "stale_at": fetched_at + ttl,
+        }
+
+    # The account list decides which accounts there are, so it goes first
+    results = await asyncio.gather(*(
+        fetch("", section, customer_id, fetcher, kind)
+        for section, (fetcher, kind) in CUSTOMER_SECTIONS.items() if due("", section)
+    ))
+    refreshed_list = next((r for r in results if r["section"] == "accounts" and r["data"] is not None), None)
+    account_list = refreshed_list or stored.get(("", "accounts"))
+    account_ids = []
+    if account_list is not None and account_list["data"] is not None:
+        account_ids = [aid for aid in map(nessie_account_id, account_list["data"]) if aid]
+
+    results += await asyncio.gather(*(
+        fetch(aid, section, aid, fetcher, kind)
+        for aid in account_ids
+        for section, (fetcher, kind) in ACCOUNT_SECTIONS.items() if due(aid, section)
+    ))
+    # Only a freshly fetched account list may drop the rows of closed accounts
+    keep = account_ids if refreshed_list is not None else None
+    await asyncio.to_thread(database.save_snapshot_sections, customer_id, results, keep)
+    return len(results)
+
+
+class SnapshotRefresher:
+    def __init__(
+        self,
+        client: NessieClient,
+        interval: float = NESSIE_SNAPSHOT_REFRESH_SECONDS,
+        keep_warm: float = NESSIE_SNAPSHOT_KEEP_WARM_SECONDS,
+    ):
+        self.client = client
+        self.interval = interval
+        self.keep_warm = keep_warm
+        self._locks: dict[str, asyncio.Lock] = {}
+        self._viewed: dict[str, float] = {}
+        self._scheduled: dict[str, asyncio.Task] = {}
+        self._loop_task: asyncio.Task | None = None
+
+    def start(self):
+        self._loop_task = asyncio.create_task(self._run())
+
+    async def close(self):
+        tasks = [t for t in [self._loop_task, *self._scheduled.values()] if t]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._loop_task = None
+        self._scheduled.clear()
+
+    def touch(self, customer_id: str):
+        """Note a view, which keeps the customer's snapshot refreshed for keep_warm seconds"""
+        self._viewed[customer_id] = time.monotonic()
+
+    async def refresh(self, customer_id: str, max_age: float | None = None) -> int:
+        """Refresh the due sections now. One refresh per customer at a time."""
+        lock = self._locks.setdefault(customer_id, asyncio.Lock())
+        async with lock:
+            return await refresh_snapshot(self.client, customer_id, max_age)
+
+    def schedule(self, customer_id: str):
+        """Refresh the customer's stale sections in the background, unless that is already queued"""
+        if customer_id in self._scheduled:
+            return
+        task = asyncio.create_task(self._refresh_logged(customer_id))
+        self._scheduled[customer_id] = task
+        task.add_done_callback(lambda _: self._scheduled.pop(customer_id, None))
+
+    async def _refresh_logged(self, customer_id: str):
+        try:
+            await self.refresh(customer_id)
+        except Exception as e:
+            print(f"Snapshot refresh error for {customer_id}: {e}")
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                stale = await asyncio.to_thread(database.get_stale_snapshot_customers, time.time())
+            except Exception as e:
+                print(f"Snapshot refresher error: {e}")
+                continue
+            now = time.monotonic()
+            for customer_id in stale:
+                if now - self._viewed.get(customer_id, float("-inf")) <= self.keep_warm:
+                    await self._refresh_logged(customer_id)
@@ -0,0 +1,318 @@
+"""
+Local stand-in for the Capital One Nessie API
+
+Serves the read routes NessieClient uses (customers, accounts and each
+account's bills, deposits, loans, purchases, transfers and withdrawals) in
+Nessie's JSON shapes, over data generated by DemoFixtures. Each demo user
+becomes a Nessie customer, so the same seed and sizes always serve the same
+data. A profile sets the latency, error rate and payload size, which makes
+the client's fan-out, caching and retries measurable offline.
+
+Usage:
+    python nessie_standin.py --profile realistic --port 8090
+    NESSIE_BASE_URL=http://127.0.0.1:8090 python main.py
+
+In process, without a socket:
+    transport = httpx.ASGITransport(app=create_app(NessieStandIn(profile="flaky")))
+    NessieClient(base_url="http://nessie.local", transport=transport)
+"""
+
+import argparse
+import asyncio
+import hashlib
+import os
+import random
+import sys
+from datetime import date, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+
+from demo_fixtures import MONTHLY, DemoFixtures
+
+NESSIE_STANDIN_PROFILE = os.environ.get("NESSIE_STANDIN_PROFILE", "realistic")
+
+# latency_ms: typical response time, tail_ms / tail_rate: how slow and how
+# often a slow response is, error_rate: share of requests answered with a
+# 500, 503 or 429. customers, accounts, days and daily_transactions size
+# the data, as in DemoFixtures.
+PROFILES = {
+    "instant": {
+        "latency_ms": 0, "tail_ms": 0, "tail_rate": 0.0, "error_rate": 0.0,
+        "customers": 3, "accounts": 2, "days": 90, "daily_transactions": 3,
+    },
+    "realistic": {
+        "latency_ms": 80, "tail_ms": 600, "tail_rate": 0.02, "error_rate": 0.01,
+        "customers": 3, "accounts": 3, "days": 180, "daily_transactions": 3,
+    },
+    "flaky": {
+        "latency_ms": 120, "tail_ms": 2500, "tail_rate": 0.1, "error_rate": 0.15,
+        "customers": 3, "accounts": 3, "days": 180, "daily_transactions": 3,
+    },
+    "heavy": {
+        "latency_ms": 150, "tail_ms": 1000, "tail_rate": 0.05, "error_rate": 0.01,
+        "customers": 10, "accounts": 4, "days": 730, "daily_transactions": 8,
+    },
+}
+
+ACCOUNT_TYPES = {"checking": "Checking", "savings": "Savings", "credit card": "Credit Card"}
+ERROR_STATUSES = [500, 503, 503, 429]
+
+
+def object_id(*parts) -> str:
+    """A stable 24-hex id like Nessie's Mongo ObjectIds"""
+    return hashlib.sha1(":".join(map(str, parts)).encode()).hexdigest()[:24]
+
+
+class NessieStandIn:
+    def __init__(self, profile: str = NESSIE_STANDIN_PROFILE, seed: int = 42, end_date: date | None = None, **overrides):
+        if profile not in PROFILES:
+            raise ValueError(f"Unknown Nessie stand-in profile {profile!r}; choose from {', '.join(PROFILES)}")
+        self.profile = {**PROFILES[profile], **{k: v for k, v in overrides.items() if v is not None}}
+        self.seed = seed
+        self.fixtures = DemoFixtures(
+            seed=seed, users=self.profile["customers"], accounts=self.profile["accounts"],
+            days=self.profile["days"], daily_transactions=self.profile["daily_transactions"], end_date=end_date,
+        )
+        self._rng = random.Random(f"{seed}:faults")
+        self.stats = {"requests": 0, "errors": 0, "slow": 0}
+
+        # Customer and account documents are small, so they are built up
+        # front; per-account history is built on first request and kept
+        self.customers: dict[str, dict] = {}
+        self.accounts: dict[str, dict] = {}
+        self._plaid_ids: dict[str, tuple[str, str]] = {}
+        for user_id in self.fixtures.user_ids():
+            self._add_customer(user_id)
+        self._history: dict[str, dict[str, list]] = {}
+
+    def _add_customer(self, user_id: str):
+        rng = random.Random(f"{self.seed}:{user_id}:customer")
+        customer_id = object_id(self.seed, user_id)
+        self.customers[customer_id] = {
+            "_id": customer_id,
+            "first_name": rng.choice(["Ada", "Grace", "Alan", "Katherine", "Linus", "Margaret", "Dennis"]),
+            "last_name": rng.choice(["Lovelace", "Hopper", "Turing", "Johnson", "Torvalds", "Hamilton"]),
+            "address": {
+                "street_number": str(rng.randint(1, 9999)),
+                "street_name": rng.choice(["Forbes Ave", "Murray Ave", "Liberty Ave", "Penn Ave"]),
+                "city": "Pittsburgh",
+                "state": "PA",
+                "zip": "152" + str(rng.randint(10, 40)),
+            },
+        }
+        for a in self.fixtures.accounts(user_id):
+            account_id = object_id(customer_id, a["account_id"])
+            balance = a["balances"]["current"]
+            self.accounts[account_id] = {
+                "_id": account_id,
+                "type": ACCOUNT_TYPES[a["subtype"]],
+                "nickname": a["name"],
+                "rewards": rng.randint(0, 5000) if a["type"] == "credit" else 0,
+                # Nessie reports card debt as a negative balance
+                "balance": -balance if a["type"] == "credit" else balance,
+                "account_number": str(rng.randint(10**15, 10**16 - 1)),
+                "customer_id": customer_id,
+            }
+            self._plaid_ids[account_id] = (user_id, a["account_id"])
+
+    def customer_accounts(self, customer_id: str) -> list[dict]:
+        return [a for a in self.accounts.values() if a["customer_id"] == customer_id]
+
+    def history(self, account_id: str) -> dict[str, list]:
+        """The account's purchases, deposits, bills, loans, transfers and withdrawals, newest first"""
+        if account_id not in self._history:
+            self._history[account_id] = self._build_history(account_id)
+        return self._history[account_id]
+
+    def _build_history(self, account_id: str) -> dict[str, list]:
+        user_id, plaid_account_id = self._plaid_ids[account_id]
+        account = self.accounts[account_id]
+        rng = random.Random(f"{self.seed}:{account_id}:history")
+        history = {name: [] for name in ["purchases", "deposits", "bills", "loans", "transfers", "withdrawals"]}
+        recurring = {"Rent Payment"} | {m[0] for m in MONTHLY}
+        last_charge: dict[str, dict] = {}
+
+        for txn in self.fixtures.iter_transactions(user_id):
+            if txn["account_id"] != plaid_account_id:
+                continue
+            status = "pending" if txn["pending"] else "executed"
+            if txn["amount"] < 0:
+                history["deposits"].append({
+                    "_id": object_id(account_id, txn["transaction_id"]),
+                    "type": "deposit",
+                    "transaction_date": txn["date"],
+                    "status": status,
+                    "medium": "balance",
+                    "payee_id": account_id,
+                    "amount": -txn["amount"],
+                    "description": txn["name"],
+                })
+                continue
+            history["purchases"].append({
+                "_id": object_id(account_id, txn["transaction_id"]),
+                "type": "merchant",
+                "merchant_id": object_id("merchant", txn["name"]),
+                "payer_id": account_id,
+                "purchase_date": txn["date"],
+                "amount": txn["amount"],
+                "status": status,
+                "medium": "balance",
+                "description": txn["name"],
+            })
+            if txn["name"] in recurring:
+                last_charge.setdefault(txn["name"], txn)
+
+        # Recurring charges become bills: the last one paid, the next one pending
+        for name, txn in last_charge.items():
+            paid = date.fromisoformat(txn["date"])
+            upcoming = (paid.replace(day=1) + timedelta(days=32)).replace(day=min(paid.day, 28))
+            for status, payment_date in [("completed", paid), ("pending", upcoming)]:
+                history["bills"].append({
+                    "_id": object_id(account_id, name, payment_date),
+                    "status": status,
+                    "payee": name,
+                    "nickname": name,
+                    "creation_date": (paid - timedelta(days=30)).isoformat(),
+                    "payment_date": payment_date.isoformat(),
+                    "recurring_date": paid.day,
+                    "upcoming_payment_date": upcoming.isoformat(),
+                    "payment_amount": txn["amount"],
+                    "account_id": account_id,
+                })
+
+        if account["type"] == "Checking" and rng.random() < 0.5:
+            amount = float(rng.choice([8000, 15000, 24000]))
+            history["loans"].append({
+                "_id": object_id(account_id, "loan"),
+                "type": rng.choice(["auto", "small business"]),
+                "status": "approved",
+                "credit_score": rng.randint(580, 820),
+                "monthly_payment": round(amount / 48, 2),
+                "amount": amount,
+                "description": "Loan",
+                "account_id": account_id,
+            })
+
+        others = [a for a in self.customer_accounts(account["customer_id"]) if a["_id"] != account_id]
+        day = self.fixtures.end_date
+        while day >= self.fixtures.start_date:
+            day_rng = random.Random(f"{self.seed}:{account_id}:{day}")
+            if others and day.day == 15:
+                history["transfers"].append({
+                    "_id": object_id(account_id, "transfer", day),
+                    "type": "p2p",
+                    "transaction_date": day.isoformat(),
+                    "status": "executed",
+                    "medium": "balance",
+                    "payer_id": account_id,
+                    "payee_id": day_rng.choice(others)["_id"],
+                    "amount": float(day_rng.choice([50, 100, 250, 500])),
+                    "description": "Transfer between accounts",
+                })
+            if account["type"] == "Checking" and day_rng.random() < 0.1:
+                history["withdrawals"].append({
+                    "_id": object_id(account_id, "withdrawal", day),
+                    "type": "withdrawal",
+                    "transaction_date": day.isoformat(),
+                    "status": "executed",
+                    "medium": "balance",
+                    "payer_id": account_id,
+                    "amount": float(day_rng.choice([20, 40, 60, 100, 200])),
+                    "description": "ATM withdrawal",
+                })
+            day -= timedelta(days=1)
+        return history
+
+    async def respond(self, body):
+        """Apply the profile's latency and faults, then answer with body"""
+        self.stats["requests"] += 1
+        delay = self.profile["latency_ms"] * self._rng.uniform(0.5, 1.5)
+        if self._rng.random() < self.profile["tail_rate"]:
+            self.stats["slow"] += 1
+            delay = self.profile["tail_ms"] * self._rng.uniform(0.8, 1.2)
+        if delay:
+            await asyncio.sleep(delay / 1000)
+        if self._rng.random() < self.profile["error_rate"]:
+            self.stats["errors"] += 1
+            status = self._rng.choice(ERROR_STATUSES)
+            return JSONResponse({"code": status, "message": "Stand-in fault injected"}, status_code=status)
+        if body is None:
+            return JSONResponse({"code": 404, "message": "Invalid ID"}, status_code=404)
+        return body
+
+
+def create_app(standin: NessieStandIn | None = None) -> FastAPI:
+    standin = standin or NessieStandIn()
+    app = FastAPI(title="Nessie stand-in")
+    app.state.standin = standin
+
+    @app.get("/customers")
+    async def list_customers():
+        return await standin.respond(list(standin.customers.values()))
+
+    @app.get("/customers/{customer_id}")
+    async def get_customer(customer_id: str):
+        return await standin.respond(standin.customers.get(customer_id))
+
+    @app.get("/customers/{customer_id}/accounts")
+    async def get_customer_accounts(customer_id: str):
+        if customer_id not in standin.customers:
+            return await standin.respond(None)
+        return await standin.respond(standin.customer_accounts(customer_id))
+
+    @app.get("/accounts")
+    async def list_accounts():
+        return await standin.respond(list(standin.accounts.values()))
+
+    @app.get("/accounts/{account_id}")
+    async def get_account(account_id: str):
+        return await standin.respond(standin.accounts.get(account_id))
+
+    @app.get("/accounts/{account_id}/customer")
+    async def get_account_customer(account_id: str):
+        account = standin.accounts.get(account_id)
+        return await standin.respond(standin.customers[account["customer_id"]] if account else None)
+
+    @app.get("/accounts/{account_id}/{collection}")
+    async def get_account_collection(account_id: str, collection: str):
+        if account_id not in standin.accounts:
+            return await standin.respond(None)
+        history = standin.history(account_id)
+        return await standin.respond(history.get(collection))
+
+    @app.get("/stats")
+    async def stats():
+        return standin.stats
+
+    return app
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profile", default=NESSIE_STANDIN_PROFILE, choices=list(PROFILES))
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--latency-ms", type=float)
+    parser.add_argument("--error-rate", type=float)
+    parser.add_argument("--customers", type=int)
+    parser.add_argument("--days", type=int)
+    args = parser.parse_args()
+
+    standin = NessieStandIn(
+        profile=args.profile, seed=args.seed, latency_ms=args.latency_ms, error_rate=args.error_rate,
+        customers=args.customers, days=args.days,
+    )
+    print(f"Nessie stand-in ({args.profile}) at http://127.0.0.1:{args.port}; customers:")
+    for customer_id, customer in standin.customers.items():
+        print(f"  {customer_id}  {customer['first_name']} {customer['last_name']}")
+    uvicorn.run(create_app(standin), host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
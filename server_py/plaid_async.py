@@ -0,0 +1,92 @@
+"""
+Async adapter for the synchronous plaid-python client
+
+plaid-python is built on urllib3 and blocks the calling thread for the
+whole upstream round trip. AsyncPlaidClient runs each call on a bounded
+thread pool, so handlers can await Plaid without stalling the event loop.
+The thread count matches the client's urllib3 pool size, so every
+in-flight call can reuse a keep-alive connection.
+
+gather_items fans one call out across a user's linked Items, capping how
+many run against the same institution at once so one user with several
+accounts at a bank doesn't hammer it.
+"""
+
+import asyncio
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable
+
+import plaid
+from plaid.api import plaid_api
+
+PLAID_MAX_CONCURRENCY = int(os.environ.get("PLAID_MAX_CONCURRENCY", "8"))
+PLAID_INSTITUTION_CONCURRENCY = int(os.environ.get("PLAID_INSTITUTION_CONCURRENCY", "2"))
+
+
+def item_error(item: dict, e: Exception) -> dict:
+    """Client-safe report of a failed call for one Item, for partial-failure responses"""
+    error = type(e).__name__
+    if isinstance(e, plaid.ApiException):
+        try:
+            body = json.loads(e.body) if e.body else {}
+        except ValueError:
+            body = {}
+        error = body.get("error_code") or f"HTTP {e.status}"
+    return {"item_id": item["item_id"], "institution_id": item.get("institution_id"), "error": error}
+
+
+class AsyncPlaidClient:
+    def __init__(
+        self,
+        client: plaid_api.PlaidApi,
+        max_workers: int = PLAID_MAX_CONCURRENCY,
+        per_institution: int = PLAID_INSTITUTION_CONCURRENCY,
+    ):
+        self.client = client
+        self.per_institution = per_institution
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="plaid")
+        self._institution_limits: dict[str, asyncio.Semaphore] = {}
+
+    async def _call(self, method: str, request: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, getattr(self.client, method), request)
+
+    async def gather_items(self, items: list[dict], fetch: Callable[[dict], Awaitable[Any]]) -> list:
+        """
+        Run fetch(item) for every Item concurrently, at most per_institution
+        at a time per institution. Results line up with `items`; a failed
+        fetch is returned as its exception, as with gather(return_exceptions=True).
+        """
+        async def limited(item):
+            institution = item.get("institution_id") or item["item_id"]
+            limit = self._institution_limits.setdefault(institution, asyncio.Semaphore(self.per_institution))
+            async with limit:
+                return await fetch(item)
+
+        return await asyncio.gather(*(limited(item) for item in items), return_exceptions=True)
+
+    async def link_token_create(self, request):
+        return await self._call("link_token_create", request)
+
+    async def item_public_token_exchange(self, request):
+        return await self._call("item_public_token_exchange", request)
+
+    async def item_get(self, request):
+        return await self._call("item_get", request)
+
+    async def accounts_get(self, request):
+        return await self._call("accounts_get", request)
+
+    async def accounts_balance_get(self, request):
+        return await self._call("accounts_balance_get", request)
+
+    async def transactions_sync(self, request):
+        return await self._call("transactions_sync", request)
+
+    async def webhook_verification_key_get(self, request):
+        return await self._call("webhook_verification_key_get", request)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,179 @@
+"""
+Incremental Plaid transaction sync
+
+Each linked Item keeps a /transactions/sync cursor in plaid_items. A sync
+pages through everything added, modified or removed since that cursor and
+applies the whole delta to the local transactions table in one database
+transaction, together with the new cursor. Reads are then served from the
+local store, so Plaid only ever ships what changed.
+
+SyncScheduler runs syncs in the background when Plaid reports new data
+through a webhook, so client reads find the store already up to date.
+"""
+
+import asyncio
+import json
+from typing import Awaitable, Callable
+
+import plaid
+from plaid.model.transactions_sync_request import TransactionsSyncRequest
+
+import database
+from plaid_async import AsyncPlaidClient, item_error
+
+SYNC_PAGE_SIZE = 500  # Plaid's maximum for /transactions/sync
+MAX_PAGINATION_RESTARTS = 3
+
+# One sync at a time per Item; concurrent callers wait and then find no delta
+_item_locks: dict[str, asyncio.Lock] = {}
+
+
+def serialize_transaction(txn) -> dict:
+    """Plaid Transaction model -> the dict shape served by the API"""
+    return {
+        "transaction_id": txn.transaction_id,
+        "account_id": txn.account_id,
+        "name": txn.name,
+        "amount": txn.amount,
+        "date": str(txn.date),
+        "category": list(txn.category) if txn.category else [],
+        "pending": txn.pending,
+        "merchant_name": txn.merchant_name,
+        "payment_channel": str(txn.payment_channel),
+        "iso_currency_code": txn.iso_currency_code,
+    }
+
+
+def _is_mutation_during_pagination(e: plaid.ApiException) -> bool:
+    try:
+        body = json.loads(e.body) if e.body else {}
+    except ValueError:
+        return False
+    return body.get("error_code") == "TRANSACTIONS_SYNC_MUTATION_DURING_PAGINATION"
+
+
+async def _fetch_delta(plaid_client: AsyncPlaidClient, access_token: str, cursor: str | None):
+    added, modified, removed = [], [], []
+    has_more = True
+    while has_more:
+        request_args = {
+            "access_token": access_token,
+            "count": SYNC_PAGE_SIZE,
+        }
+        if cursor:
+            request_args["cursor"] = cursor
+        response = await plaid_client.transactions_sync(TransactionsSyncRequest(**request_args))
+        added.extend(serialize_transaction(t) for t in response.added)
+        modified.extend(serialize_transaction(t) for t in response.modified)
+        removed.extend(r.transaction_id for r in response.removed)
+        cursor = response.next_cursor
+        has_more = response.has_more
+    return added, modified, removed, cursor
+
+
+async def sync_item(plaid_client: AsyncPlaidClient, item: dict, user_id: str) -> dict:
+    """
+    Pull and store everything that changed on one Item since its last sync.
+    Returns counts of added/modified/removed transactions.
+    """
+    item_id = item["item_id"]
+    lock = _item_locks.setdefault(item_id, asyncio.Lock())
+    async with lock:
+        # Re-read the cursor: another sync may have advanced it while we waited
+        current = next(
+            (i for i in database.get_plaid_items(user_id=user_id) if i["item_id"] == item_id),
+            None,
+        )
+        if current is None:
+            return {"added": 0, "modified": 0, "removed": 0}
+        start_cursor = current["sync_cursor"]
+
+        for attempt in range(MAX_PAGINATION_RESTARTS + 1):
+            try:
+                added, modified, removed, next_cursor = await _fetch_delta(
+                    plaid_client, current["access_token"], start_cursor
+                )
+                break
+            except plaid.ApiException as e:
+                # Data changed mid-pagination: Plaid asks us to restart from the original cursor
+                if attempt < MAX_PAGINATION_RESTARTS and _is_mutation_during_pagination(e):
+                    continue
+                raise
+
+        await asyncio.to_thread(
+            database.apply_transaction_sync, item_id, added, modified, removed, next_cursor, user_id=user_id
+        )
+        return {"added": len(added), "modified": len(modified), "removed": len(removed)}
+
+
+async def sync_user(plaid_client: AsyncPlaidClient, user_id: str, initial_only: bool = False) -> dict:
+    """
+    Sync all of the user's linked Items concurrently. With initial_only,
+    skip Items that have synced before (webhooks keep those current).
+    Returns combined counts plus an `errors` list naming any Item that
+    failed; the others are still synced.
+    """
+    items = [
+        item for item in database.get_plaid_items(user_id=user_id)
+        if not (initial_only and item["sync_cursor"])
+    ]
+    results = await plaid_client.gather_items(items, lambda item: sync_item(plaid_client, item, user_id))
+
+    totals = {"added": 0, "modified": 0, "removed": 0, "errors": []}
+    for item, result in zip(items, results):
+        if isinstance(result, Exception):
+            print(f"Transaction sync error for item {item['item_id']}: {result}")
+            totals["errors"].append(item_error(item, result))
+            continue
+        for key in ("added", "modified", "removed"):
+            totals[key] += result[key]
+    return totals
+
+
+class SyncScheduler:
+    """
+    Background syncs, at most one running per Item. A request that arrives
+    while its Item is already syncing marks it dirty, so the Item is synced
+    once more afterwards instead of once per webhook.
+    """
+
+    def __init__(
+        self,
+        plaid_client: AsyncPlaidClient,
+        on_synced: Callable[[str, dict], Awaitable[None]] | None = None,
+    ):
+        self.plaid_client = plaid_client
+        self.on_synced = on_synced
+        self._running: dict[str, asyncio.Task] = {}
+        self._dirty: set[str] = set()
+
+    def schedule(self, item_id: str, user_id: str):
+        if item_id in self._running:
+            self._dirty.add(item_id)
+            return
+        self._running[item_id] = asyncio.create_task(self._run(item_id, user_id))
+
+    async def _run(self, item_id: str, user_id: str):
+        try:
+            while True:
+                self._dirty.discard(item_id)
+                try:
+                    counts = await sync_item(self.plaid_client, {"item_id": item_id}, user_id)
+                    if self.on_synced:
+                        await self.on_synced(user_id, counts)
+                except Exception as e:
+                    print(f"Background sync error for item {item_id}: {e}")
+                if item_id not in self._dirty:
+                    break
+        finally:
+            self._running.pop(item_id, None)
+
+    async def drain(self):
+        """Wait for every scheduled sync to finish"""
+        while self._running:
+            await asyncio.gather(*self._running.values(), return_exceptions=True)
+
+    async def close(self):
+        for task in self._running.values():
+            task.cancel()
+        await asyncio.gather(*self._running.values(), return_exceptions=True)
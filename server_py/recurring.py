@@ -0,0 +1,383 @@
+"""
+Recurring payment detection
+
+detect_recurring() finds subscriptions and other recurring charges in a
+list of transactions, Plaid-shaped (name / merchant_name, date) or Nessie
+purchases (description, purchase_date). A merchant's charges are split
+into series of similar amounts, so a price rise or a varying utility bill
+stays one series while a one-off purchase at the same merchant does not
+join it. Each series' period is the median gap between its charges,
+matched to weekly, biweekly, monthly, quarterly or annual. Confidence
+comes from how many of the gaps fit that period.
+
+All the grouping and gap statistics are NumPy array operations over a
+few sorts, so years of history cost O(n log n) with no per-transaction
+Python loop.
+
+tracked_subscriptions() keeps that result as per-series state in the
+database (last charge, period, amount band, gap counts) and afterwards
+only folds in charges newer than the last one it saw. Each merchant's
+recent charges outside those series are seeded as candidate series too,
+so a merchant that only becomes recurring later is still recognised. Answering costs one
+read of the state, and a series whose expected charge did not come, or
+came at a new amount, is flagged as missed or changed.
+
+Usage:
+    subscriptions = detect_recurring(purchases)
+    total = monthly_total(subscriptions)
+    subscriptions = await tracked_subscriptions(store, account_id, load_charges)
+"""
+
+import asyncio
+import os
+import time
+from datetime import date, timedelta
+from typing import Awaitable, Callable
+
+import numpy as np
+
+# name, length in days, gap tolerance in days
+PERIODS = [
+    ("weekly", 7.0, 1.5),
+    ("biweekly", 14.0, 2.5),
+    ("monthly", 30.44, 4.0),
+    ("quarterly", 91.31, 10.0),
+    ("annual", 365.25, 20.0),
+]
+PERIOD_NAMES = [p[0] for p in PERIODS]
+PERIOD_DAYS = np.array([p[1] for p in PERIODS])
+PERIOD_TOLERANCE = np.array([p[2] for p in PERIODS])
+
+# Sorted amounts further apart than this (relative) start a new series
+AMOUNT_TOLERANCE = 0.25
+# Share of gaps that must fit the period for a series to be reported
+MIN_REGULARITY = 0.6
+DAYS_PER_MONTH = 30.44
+# Tracked state is brought up to date at most this often per account
+RECURRING_SYNC_SECONDS = float(os.environ.get("RECURRING_SYNC_SECONDS", "60"))
+# Charges outside the detected series that seeding keeps per merchant, and
+# how far back; long enough to pair up an annual charge
+RECURRING_CANDIDATE_CHARGES = int(os.environ.get("RECURRING_CANDIDATE_CHARGES", "6"))
+RECURRING_CANDIDATE_DAYS = int(os.environ.get("RECURRING_CANDIDATE_DAYS", "400"))
+
+
+def _merchant(txn: dict) -> str:
+    return txn.get("merchant_name") or txn.get("name") or txn.get("description") or ""
+
+
+def _date(txn: dict) -> str:
+    return (txn.get("date") or txn.get("purchase_date") or txn.get("transaction_date") or "")[:10]
+
+
+def _charge_id(txn: dict) -> str:
+    return txn.get("_id") or txn.get("transaction_id") or f"{_date(txn)}:{_merchant(txn)}:{txn.get('amount')}"
+
+
+def _confidence(charge_count: int, regularity: float) -> str:
+    if charge_count >= 3:
+        return "high" if regularity >= 0.8 else "medium"
+    return "low"
+
+
+def detect_recurring(transactions: list[dict], today: date | None = None) -> list[dict]:
+    """
+    Recurring charges in `transactions`, most expensive per month first.
+    Each has merchant, amount (latest charge), average_amount, the
+    amount_low / amount_high band, frequency_count, period, interval_days,
+    last_date, next_date, monthly_cost, regularity, confidence (high /
+    medium / low) and active (charged within about one period of `today`).
+    """
+    today = today or date.today()
+    rows = [
+        (_merchant(t), _date(t), float(t.get("amount") or 0))
+        for t in transactions
+    ]
+    rows = [r for r in rows if r[0] and r[1] and r[2] > 0]
+    if len(rows) < 2:
+        return []
+
+    names = np.array([r[0] for r in rows], dtype=object)
+    _, merchant_codes = np.unique(
+        np.array([r[0].strip().lower() for r in rows]), return_inverse=True,
+    )
+    days = np.array([r[1] for r in rows], dtype="datetime64[D]").astype(np.int64)
+    amounts = np.array([r[2] for r in rows])
+
+    # Series: within a merchant, runs of sorted amounts with no jump above the tolerance
+    by_amount = np.lexsort((amounts, merchant_codes))
+    sorted_amounts = amounts[by_amount]
+    new_series = np.ones(len(rows), dtype=bool)
+    new_series[1:] = (merchant_codes[by_amount][1:] != merchant_codes[by_amount][:-1]) | (
+        sorted_amounts[1:] > sorted_amounts[:-1] * (1 + AMOUNT_TOLERANCE)
+    )
+    series = np.empty(len(rows), dtype=np.int64)
+    series[by_amount] = np.cumsum(new_series) - 1
+    series_count = series.max() + 1
+
+    # Each series' charges in date order, series after series
+    order = np.lexsort((days, series))
+    series, days, amounts, names = series[order], days[order], amounts[order], names[order]
+    counts = np.bincount(series, minlength=series_count)
+    ends = np.cumsum(counts)
+
+    # Gaps between consecutive charges of the same series, and their median per series
+    same = series[1:] == series[:-1]
+    gap_series = series[1:][same]
+    gaps = np.diff(days)[same].astype(float)
+    gap_counts = counts - 1
+    by_gap = np.lexsort((gaps, gap_series))
+    sorted_gaps = gaps[by_gap]
+    gap_starts = np.cumsum(gap_counts) - gap_counts
+    has_gaps = gap_counts > 0
+    lower = gap_starts + np.maximum(gap_counts - 1, 0) // 2
+    upper = gap_starts + gap_counts // 2
+    median = np.full(series_count, np.nan)
+    median[has_gaps] = (sorted_gaps[lower[has_gaps]] + sorted_gaps[upper[has_gaps]]) / 2
+
+    # Closest period (relative to its length) within tolerance of the median gap
+    distance = np.abs(median[:, None] - PERIOD_DAYS[None, :])
+    fits = distance <= PERIOD_TOLERANCE[None, :]
+    period = np.where(fits, distance / PERIOD_DAYS[None, :], np.inf).argmin(axis=1)
+    matched = fits.any(axis=1)
+
+    # Regularity: the share of a series' gaps that fit its period
+    fitting = np.abs(gaps - PERIOD_DAYS[period[gap_series]]) <= PERIOD_TOLERANCE[period[gap_series]]
+    regularity = np.zeros(series_count)
+    regularity[has_gaps] = (
+        np.bincount(gap_series, weights=fitting, minlength=series_count)[has_gaps] / gap_counts[has_gaps]
+    )
+    amount_sums = np.bincount(series, weights=amounts, minlength=series_count)
+    starts = ends - counts
+    amount_low = np.minimum.reduceat(amounts, starts)
+    amount_high = np.maximum.reduceat(amounts, starts)
+
+    today_day = np.datetime64(today, "D").astype(np.int64)
+    subscriptions = []
+    for s in np.flatnonzero(matched & (regularity >= MIN_REGULARITY)):
+        last = ends[s] - 1
+        period_days = float(PERIOD_DAYS[period[s]])
+        amount = float(amounts[last])
+        subscriptions.append({
+            "merchant": names[last],
+            "amount": round(amount, 2),
+            "average_amount": round(float(amount_sums[s] / counts[s]), 2),
+            "amount_low": float(amount_low[s]),
+            "amount_high": float(amount_high[s]),
+            "frequency_count": int(counts[s]),
+            "period": PERIOD_NAMES[period[s]],
+            "interval_days": float(median[s]),
+            "last_date": str(np.datetime64(int(days[last]), "D")),
+            "next_date": str(np.datetime64(int(days[last] + round(period_days)), "D")),
+            "monthly_cost": round(amount * DAYS_PER_MONTH / period_days, 2),
+            "regularity": round(float(regularity[s]), 3),
+            "confidence": _confidence(counts[s], regularity[s]),
+            "active": bool(today_day - days[last] <= period_days + PERIOD_TOLERANCE[period[s]]),
+        })
+    subscriptions.sort(key=lambda s: s["monthly_cost"], reverse=True)
+    return subscriptions
+
+
+def monthly_total(subscriptions: list[dict]) -> float:
+    """What the still-active recurring charges cost per month"""
+    return round(sum(s["monthly_cost"] for s in subscriptions if s["active"]), 2)
+
+
+# --- Incremental tracking ---
+
+def _period_for_gap(gap: float) -> str | None:
+    fits = np.abs(gap - PERIOD_DAYS) <= PERIOD_TOLERANCE
+    if not fits.any():
+        return None
+    return PERIOD_NAMES[int(np.where(fits, np.abs(gap - PERIOD_DAYS) / PERIOD_DAYS, np.inf).argmin())]
+
+
+def seed_series(
+    detected: list[dict],
+    transactions: list[dict] = (),
+    today: date | None = None,
+    candidate_charges: int = RECURRING_CANDIDATE_CHARGES,
+    candidate_days: int = RECURRING_CANDIDATE_DAYS,
+) -> dict[str, dict]:
+    """
+    Tracking state for the series detect_recurring found, keyed by
+    series_id. The rest of `transactions`, each merchant's last
+    `candidate_charges` within `candidate_days` of `today`, are kept as
+    candidate series alongside, so a merchant that turns recurring later
+    is counted from its earlier charges.
+    """
+    series = {}
+    bands: dict[str, list[tuple[float, float]]] = {}
+    for d in detected:
+        gap_count = d["frequency_count"] - 1
+        key = d["merchant"].strip().lower()
+        series_id = f"{key}|{d['amount_low']:.2f}"
+        series[series_id] = {
+            "series_id": series_id,
+            "merchant": d["merchant"],
+            "amount_low": d["amount_low"],
+            "amount_high": d["amount_high"],
+            "last_amount": d["amount"],
+            "previous_amount": None,
+            "last_date": d["last_date"],
+            "period": d["period"],
+            "charge_count": d["frequency_count"],
+            "gap_count": gap_count,
+            "fit_count": round(d["regularity"] * gap_count),
+            "changed_on": None,
+        }
+        bands.setdefault(key, []).append((d["amount_low"], d["amount_high"]))
+
+    # A detected series' band is the exact range of its charges, so whatever
+    # falls outside every band belongs to no series yet
+    since = ((today or date.today()) - timedelta(days=candidate_days)).isoformat()
+    others: dict[str, list[dict]] = {}
+    for txn in sorted(transactions, key=_date):
+        merchant, day, amount = _merchant(txn), _date(txn), float(txn.get("amount") or 0)
+        if not merchant or day < since or amount <= 0:
+            continue
+        key = merchant.strip().lower()
+        if not any(low <= amount <= high for low, high in bands.get(key, ())):
+            others.setdefault(key, []).append(txn)
+
+    candidates: dict[str, dict] = {}
+    if candidate_charges > 0:
+        fold_charges(candidates, [txn for charges in others.values() for txn in charges[-candidate_charges:]])
+    # detect_recurring already found these charges irregular, so only their
+    # count, amount band and last charge carry over; the next gap sets the period
+    for c in candidates.values():
+        c["period"], c["gap_count"], c["fit_count"] = None, 0, 0
+    return {**candidates, **series}
+
+
+def fold_charges(series: dict[str, dict], charges: list[dict]) -> set[str]:
+    """
+    Add charges newer than every tracked one, oldest first, to the series
+    state in place. A charge joins the same merchant's series whose amount
+    band it falls in (with AMOUNT_TOLERANCE either side), otherwise it
+    starts a new one. Returns the ids of the series that changed.
+    """
+    by_merchant: dict[str, list[dict]] = {}
+    for s in series.values():
+        by_merchant.setdefault(s["merchant"].strip().lower(), []).append(s)
+
+    changed = set()
+    for txn in charges:
+        merchant, day, amount = _merchant(txn), _date(txn), float(txn.get("amount") or 0)
+        if not merchant or not day or amount <= 0:
+            continue
+        key = merchant.strip().lower()
+        candidates = [
+            s for s in by_merchant.get(key, [])
+            if s["amount_low"] / (1 + AMOUNT_TOLERANCE) <= amount <= s["amount_high"] * (1 + AMOUNT_TOLERANCE)
+        ]
+        if not candidates:
+            s = {
+                "series_id": f"{key}|{amount:.2f}", "merchant": merchant,
+                "amount_low": amount, "amount_high": amount, "last_amount": amount, "previous_amount": None,
+                "last_date": day, "period": None, "charge_count": 1, "gap_count": 0, "fit_count": 0,
+                "changed_on": None,
+            }
+            series[s["series_id"]] = s
+            by_merchant.setdefault(key, []).append(s)
+            changed.add(s["series_id"])
+            continue
+
+        s = min(candidates, key=lambda c: abs(c["last_amount"] - amount))
+        gap = (date.fromisoformat(day) - date.fromisoformat(s["last_date"])).days
+        if s["period"] is None:
+            # The first gap that looks like a period sets it
+            s["period"] = _period_for_gap(gap)
+            if s["period"]:
+                s["gap_count"], s["fit_count"] = 1, 1
+        else:
+            index = PERIOD_NAMES.index(s["period"])
+            s["gap_count"] += 1
+            s["fit_count"] += int(abs(gap - PERIOD_DAYS[index]) <= PERIOD_TOLERANCE[index])
+        if not s["amount_low"] <= amount <= s["amount_high"]:
+            if s["charge_count"] >= 2:
+                s["previous_amount"], s["changed_on"] = s["last_amount"], day
+            s["amount_low"], s["amount_high"] = min(s["amount_low"], amount), max(s["amount_high"], amount)
+        s["merchant"], s["last_amount"], s["last_date"] = merchant, amount, day
+        s["charge_count"] += 1
+        changed.add(s["series_id"])
+    return changed
+
+
+def describe_series(s: dict, today: date) -> dict | None:
+    """A tracked series in detect_recurring's shape plus its status, or None if it is not recurring"""
+    if s["period"] is None or s["gap_count"] == 0:
+        return None
+    regularity = s["fit_count"] / s["gap_count"]
+    if regularity < MIN_REGULARITY:
+        return None
+    index = PERIOD_NAMES.index(s["period"])
+    period_days, tolerance = float(PERIOD_DAYS[index]), float(PERIOD_TOLERANCE[index])
+    last = date.fromisoformat(s["last_date"])
+    since_last = (today - last).days
+    active = since_last <= period_days + tolerance
+    # The expected charge is late, but the series has not been gone for longer than another period
+    missed = not active and since_last <= 2 * period_days + tolerance
+    changed = s["changed_on"] == s["last_date"]
+    return {
+        "merchant": s["merchant"],
+        "amount": round(s["last_amount"], 2),
+        "amount_low": s["amount_low"],
+        "amount_high": s["amount_high"],
+        "frequency_count": s["charge_count"],
+        "period": s["period"],
+        "last_date": s["last_date"],
+        "next_date": (last + timedelta(days=round(period_days))).isoformat(),
+        "monthly_cost": round(s["last_amount"] * DAYS_PER_MONTH / period_days, 2),
+        "regularity": round(regularity, 3),
+        "confidence": _confidence(s["charge_count"], regularity),
+        "active": active,
+        "missed": missed,
+        "changed": changed,
+        "previous_amount": s["previous_amount"] if changed else None,
+        "status": "changed" if changed else "missed" if missed else "active" if active else "inactive",
+    }
+
+
+async def tracked_subscriptions(
+    store,
+    account_id: str,
+    load_charges: Callable[[str | None], Awaitable[list[dict]]],
+    today: date | None = None,
+    max_age: float = RECURRING_SYNC_SECONDS,
+) -> list[dict]:
+    """
+    The account's recurring charges from tracked state in the user's store.
+    The first call runs detect_recurring over everything load_charges(None)
+    returns; later ones, at most every `max_age` seconds, ask
+    load_charges(last_date) for charges on or after the last one seen and
+    fold in only the new ones.
+    """
+    today = today or date.today()
+    sync, series = await asyncio.to_thread(store.get_recurring_state, account_id)
+    series = {s["series_id"]: s for s in series}
+
+    if sync is None or time.time() - sync["synced_at"] >= max_age:
+        charges = await load_charges(sync["last_date"] if sync else None)
+        if sync is None:
+            detected = await asyncio.to_thread(detect_recurring, charges, today)
+            series = await asyncio.to_thread(seed_series, detected, charges, today)
+            changed = set(series)
+        else:
+            seen = set(sync["last_ids"])
+            new = [
+                t for t in charges
+                if _date(t) > sync["last_date"] or (_date(t) == sync["last_date"] and _charge_id(t) not in seen)
+            ]
+            changed = fold_charges(series, sorted(new, key=_date))
+        dated = [t for t in charges if _date(t)]
+        last_date = max([_date(t) for t in dated] + ([sync["last_date"]] if sync else []), default=None)
+        last_ids = [_charge_id(t) for t in dated if _date(t) == last_date]
+        if sync and last_date == sync["last_date"]:
+            last_ids = sorted(set(last_ids) | set(sync["last_ids"]))
+        await asyncio.to_thread(
+            store.save_recurring_state, account_id, [series[i] for i in changed], last_date, last_ids, time.time(),
+        )
+
+    subscriptions = [d for d in (describe_series(s, today) for s in series.values()) if d]
+    subscriptions.sort(key=lambda s: s["monthly_cost"], reverse=True)
+    return subscriptions
@@ -0,0 +1,145 @@
+"""
+Background regret scoring
+
+Unscored transactions are queued as rows in the regret_jobs table (one per
+transaction, so re-queueing is a no-op) and scored by a fixed pool of async
+workers, which bounds how many LLM calls are in flight. Each worker claims
+a batch of jobs and scores each user's share of it with one analyzer call.
+Jobs are leased while they run, so a job held by a worker that died is
+picked up again once its lease expires, and failed jobs are retried with
+exponential backoff before being parked as failed. A parked job is queued
+again when Plaid next sends its transaction, or on request through
+retry_failed(). Because the queue lives in the database, every server
+process can run workers against it.
+"""
+
+import asyncio
+import os
+import random
+import time
+from typing import Awaitable, Callable
+
+import database
+
+REGRET_WORKERS = int(os.environ.get("REGRET_WORKERS", "4"))
+REGRET_MAX_ATTEMPTS = int(os.environ.get("REGRET_MAX_ATTEMPTS", "3"))
+RETRY_BASE_SECONDS = 5.0
+LEASE_SECONDS = 120.0
+POLL_INTERVAL_SECONDS = 5.0
+
+# (transactions, user_profile) -> {transaction_id: {"score", "reason"}}
+Analyzer = Callable[[list[dict], dict], Awaitable[dict[str, dict]]]
+
+
+class RegretQueue:
+    def __init__(
+        self,
+        analyze: Analyzer,
+        workers: int = REGRET_WORKERS,
+        batch_size: int = 1,
+        max_attempts: int = REGRET_MAX_ATTEMPTS,
+        retry_base_seconds: float = RETRY_BASE_SECONDS,
+        poll_interval: float = POLL_INTERVAL_SECONDS,
+    ):
+        self.analyze = analyze
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.retry_base_seconds = retry_base_seconds
+        self.poll_interval = poll_interval
+        self._tasks: list[asyncio.Task] = []
+        self._wake: asyncio.Event | None = None
+
+    def start(self):
+        self._wake = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def enqueue_unscored(self, user_id: str) -> int:
+        """Queue every unscored transaction the user has and wake the workers"""
+        enqueued = await asyncio.to_thread(database.enqueue_unscored_regret_jobs, user_id=user_id)
+        if enqueued and self._wake:
+            self._wake.set()
+        return enqueued
+
+    async def retry_failed(self, user_id: str, transaction_ids: list[str] | None = None) -> int:
+        """Give the user's parked jobs a fresh set of attempts and wake the workers"""
+        retried = await asyncio.to_thread(database.retry_failed_regret_jobs, transaction_ids, user_id=user_id)
+        if retried and self._wake:
+            self._wake.set()
+        return retried
+
+    async def run_once(self) -> int:
+        """Claim and score one batch of jobs. Returns how many jobs were processed."""
+        jobs = await asyncio.to_thread(database.claim_regret_jobs, self.batch_size, LEASE_SECONDS)
+        jobs_by_user: dict[str, list[dict]] = {}
+        for job in jobs:
+            jobs_by_user.setdefault(job["user_id"], []).append(job)
+        for user_id, user_jobs in jobs_by_user.items():
+            await self._process(user_id, user_jobs)
+        return len(jobs)
+
+    async def drain(self):
+        """Score jobs on the calling task until none are due"""
+        while await self.run_once():
+            pass
+
+    async def _worker(self):
+        while True:
+            try:
+                if await self.run_once():
+                    continue
+            except Exception as e:
+                print(f"Regret worker error: {e}")
+            # Nothing due: sleep until new work is queued or it is time to
+            # look for retries and expired leases again
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _process(self, user_id: str, jobs: list[dict]):
+        store = database.for_user(user_id)
+        transactions = await asyncio.to_thread(store.get_transactions_by_id, [j["transaction_id"] for j in jobs])
+
+        # Removed by a sync, or scored some other way since they were queued
+        done = [
+            j["transaction_id"] for j in jobs
+            if j["transaction_id"] not in transactions or transactions[j["transaction_id"]]["regretScore"] is not None
+        ]
+        pending = [j for j in jobs if j["transaction_id"] not in done]
+
+        results, error = {}, "No score returned"
+        if pending:
+            try:
+                user_profile = await asyncio.to_thread(store.get_user_profile)
+                results = await self.analyze([transactions[j["transaction_id"]] for j in pending], user_profile or {})
+            except Exception as e:
+                error = str(e)
+                print(f"Regret scoring failed for {len(pending)} transactions: {e}")
+
+        scored = [j for j in pending if j["transaction_id"] in results]
+        if scored:
+            await asyncio.to_thread(store.save_transaction_regrets, [
+                (j["transaction_id"], results[j["transaction_id"]]["score"], results[j["transaction_id"]]["reason"])
+                for j in scored
+            ])
+        done += [j["transaction_id"] for j in scored]
+        if done:
+            await asyncio.to_thread(store.complete_regret_jobs, done)
+
+        for job in pending:
+            if job["transaction_id"] in results:
+                continue
+            if job["attempts"] >= self.max_attempts:
+                retry_at = None
+            else:
+                delay = self.retry_base_seconds * 2 ** (job["attempts"] - 1)
+                retry_at = time.time() + delay * random.uniform(0.5, 1.5)
+            await asyncio.to_thread(store.fail_regret_job, job["transaction_id"], error, retry_at)
@@ -0,0 +1,96 @@
+"""
+Failure handling building blocks for upstream API clients
+
+CircuitBreaker stops calling an endpoint that keeps failing. After
+`failure_threshold` consecutive failures it opens and rejects calls at once
+with CircuitOpenError, for `reset_seconds`. Then it lets a single probe
+call through (half-open): success closes it again, failure re-opens it.
+
+LatencyWindow keeps recent call durations so a client can tell what "slow"
+means for an endpoint, e.g. when to send a hedged duplicate request.
+"""
+
+import math
+import time
+from collections import deque
+from typing import Callable
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"Circuit open for {name}; retry in {retry_after:.1f}s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 5,
+        reset_seconds: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.clock = clock
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self.stats = {"successes": 0, "failures": 0, "rejected": 0, "opened": 0}
+
+    def before_call(self):
+        """Raise CircuitOpenError if the call should not be made"""
+        if self.state == "open":
+            waited = self.clock() - self.opened_at
+            if waited < self.reset_seconds:
+                self.stats["rejected"] += 1
+                raise CircuitOpenError(self.name, self.reset_seconds - waited)
+            self.state = "half_open"
+            self._probing = False
+        if self.state == "half_open":
+            if self._probing:
+                self.stats["rejected"] += 1
+                raise CircuitOpenError(self.name, 0.0)
+            self._probing = True
+
+    def record_success(self):
+        self.stats["successes"] += 1
+        self.consecutive_failures = 0
+        self.state = "closed"
+        self._probing = False
+
+    def record_failure(self):
+        self.stats["failures"] += 1
+        self.consecutive_failures += 1
+        if self.state == "half_open" or self.consecutive_failures >= self.failure_threshold:
+            if self.state != "open":
+                self.stats["opened"] += 1
+            self.state = "open"
+            self.opened_at = self.clock()
+            self._probing = False
+
+    def record_abandoned(self):
+        """The call was cancelled before it finished; let another probe through"""
+        self._probing = False
+
+    def snapshot(self) -> dict:
+        return {"state": self.state, "consecutive_failures": self.consecutive_failures, **self.stats}
+
+
+class LatencyWindow:
+    def __init__(self, size: int = 200, min_samples: int = 20):
+        self.min_samples = min_samples
+        self._samples: deque[float] = deque(maxlen=size)
+
+    def record(self, seconds: float):
+        self._samples.append(seconds)
+
+    def percentile(self, pct: float) -> float | None:
+        """The pct-th percentile of recent samples, or None until there are enough"""
+        if len(self._samples) < self.min_samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, math.ceil(len(ordered) * pct / 100) - 1)]
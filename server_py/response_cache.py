@@ -0,0 +1,120 @@
+"""
+In-process cache for upstream API responses
+
+ResponseCache keeps recent results in an LRU map with two deadlines per
+entry. Until `ttl` runs out the entry is served as is. After that, until
+`stale_ttl`, it is still served immediately while one background task
+refreshes it (stale-while-revalidate). Past that, callers wait for a fresh
+load. Either deadline can be overridden per call, so one cache can hold
+data that goes stale at different rates. Loads are single-flight:
+concurrent misses for the same key share one upstream call. Failed loads
+are never cached; a failed background refresh leaves the stale entry in
+place.
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Hashable
+
+Loader = Callable[[], Awaitable[Any]]
+
+
+@dataclass
+class _Entry:
+    value: Any
+    fresh_until: float
+    stale_until: float
+
+
+class ResponseCache:
+    def __init__(
+        self,
+        ttl: float,
+        stale_ttl: float = 0.0,
+        max_entries: int = 1024,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.ttl = ttl
+        self.stale_ttl = max(stale_ttl, ttl)
+        self.max_entries = max_entries
+        self.clock = clock
+        self._entries: OrderedDict[Hashable, _Entry] = OrderedDict()
+        self._inflight: dict[Hashable, asyncio.Task] = {}
+        self.stats = {"hits": 0, "stale_hits": 0, "misses": 0, "coalesced": 0, "refresh_errors": 0}
+
+    async def get(
+        self,
+        key: Hashable,
+        load: Loader,
+        ttl: float | None = None,
+        stale_ttl: float | None = None,
+    ) -> Any:
+        """
+        Cached value for `key`, calling `load()` to fetch it when needed.
+        `ttl` and `stale_ttl` override the cache's own for this key's entry.
+        """
+        ttl = self.ttl if ttl is None else ttl
+        stale_ttl = max(self.stale_ttl if stale_ttl is None else stale_ttl, ttl)
+        entry = self._entries.get(key)
+        now = self.clock()
+        if entry is not None and now < entry.stale_until:
+            self._entries.move_to_end(key)
+            if now < entry.fresh_until:
+                self.stats["hits"] += 1
+            else:
+                self.stats["stale_hits"] += 1
+                if key not in self._inflight:
+                    self._start_load(key, load, ttl, stale_ttl).add_done_callback(self._log_refresh_error)
+            return entry.value
+
+        if key in self._inflight:
+            self.stats["coalesced"] += 1
+            task = self._inflight[key]
+        else:
+            self.stats["misses"] += 1
+            task = self._start_load(key, load, ttl, stale_ttl)
+        # Shielded so one caller giving up doesn't cancel the load for the others
+        return await asyncio.shield(task)
+
+    def invalidate(self, key: Hashable):
+        """
+        Drop `key`. A load already in flight still answers its callers but
+        is not cached, since it may have read the data from before the change.
+        """
+        self._entries.pop(key, None)
+        self._inflight.pop(key, None)
+
+    def invalidate_where(self, predicate: Callable[[Hashable], bool]):
+        for key in [k for k in [*self._entries, *self._inflight] if predicate(k)]:
+            self.invalidate(key)
+
+    def clear(self):
+        self._entries.clear()
+        self._inflight.clear()
+
+    def _start_load(self, key: Hashable, load: Loader, ttl: float, stale_ttl: float) -> asyncio.Task:
+        task = asyncio.create_task(self._load(key, load, ttl, stale_ttl))
+        self._inflight[key] = task
+        return task
+
+    async def _load(self, key: Hashable, load: Loader, ttl: float, stale_ttl: float) -> Any:
+        this_load = asyncio.current_task()
+        try:
+            value = await load()
+            if self._inflight.get(key) is this_load:
+                now = self.clock()
+                self._entries[key] = _Entry(value, now + ttl, now + stale_ttl)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            return value
+        finally:
+            if self._inflight.get(key) is this_load:
+                del self._inflight[key]
+
+    def _log_refresh_error(self, task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            self.stats["refresh_errors"] += 1
+            print(f"Background cache refresh failed: {task.exception()}")
@@ -0,0 +1,109 @@
+"""
+Test suite for caller identification
+"""
+
+import pytest
+import sys
+import time
+from pathlib import Path
+
+# Add server_py to path
+sys.path.insert(0, str(Path(__file__).parent))
+
+import auth
+
+SECRET = "test-secret"
+
+
+class TestTokens:
+    def test_round_trip(self):
+        assert auth.verify_token(auth.issue_token("alice", SECRET), SECRET) == "alice"
+        assert auth.verify_token(auth.issue_token("user.with.dots", SECRET), SECRET) == "user.with.dots"
+
+    def test_rejects_forged_and_expired(self):
+        token = auth.issue_token("alice", SECRET)
+        user_id, expires, signature = token.rsplit(".", 2)
+        assert auth.verify_token(f"bob.{expires}.{signature}", SECRET) is None
+        assert auth.verify_token(token, "other-secret") is None
+        assert auth.verify_token(auth.issue_token("alice", SECRET, ttl=-1), SECRET) is None
+        assert auth.verify_token("alice", SECRET) is None
+        assert auth.verify_token(token, "") is None
+
+    def test_issue_needs_a_secret(self):
+        with pytest.raises(ValueError):
+            auth.issue_token("alice", "")
+
+
+class TestCurrentUser:
+    @pytest.fixture
+    def client(self, monkeypatch):
+        from fastapi.testclient import TestClient
+        import main
+
+        monkeypatch.setattr(auth, "FINANCE_AUTH_SECRET", SECRET)
+        monkeypatch.setattr(main, "FINANCE_TRUST_USER_HEADER", False)
+        monkeypatch.setattr(main, "FINANCE_ALLOW_ANONYMOUS", False)
+        main.database.update_pigeon_user_settings(quiet_hours_start=4, user_id="test_auth_alice")
+        return TestClient(main.app)
+
+    def quiet_hours(self, client, headers):
+        response = client.get("/api/pigeon/settings", headers=headers)
+        return response.status_code, response.json().get("quiet_hours_start")
+
+    def test_bearer_token_identifies_the_user(self, client):
+        token = auth.issue_token("test_auth_alice", SECRET, ttl=60)
+        assert self.quiet_hours(client, {"Authorization": f"Bearer {token}"}) == (200, 4)
+
+    def test_bad_tokens_are_rejected(self, client):
+        expired = auth.issue_token("test_auth_alice", SECRET, ttl=-1)
+        assert self.quiet_hours(client, {"Authorization": f"Bearer {expired}"})[0] == 401
+        assert self.quiet_hours(client, {"Authorization": "Bearer test_auth_alice"})[0] == 401
+
+    def test_user_header_needs_the_dev_flag(self, client, monkeypatch):
+        import main
+
+        assert self.quiet_hours(client, {"X-User-Id": "test_auth_alice"})[0] == 401
+        monkeypatch.setattr(main, "FINANCE_TRUST_USER_HEADER", True)
+        assert self.quiet_hours(client, {"X-User-Id": "test_auth_alice"}) == (200, 4)
+
+    def test_anonymous_requests_need_the_dev_flag(self, client, monkeypatch):
+        import main
+
+        assert self.quiet_hours(client, {})[0] == 401
+        monkeypatch.setattr(main, "FINANCE_ALLOW_ANONYMOUS", True)
+        assert self.quiet_hours(client, {})[0] == 200
+
+
+class TestTokenEndpoint:
+    @pytest.fixture
+    def client(self, monkeypatch):
+        from fastapi.testclient import TestClient
+        import main
+
+        monkeypatch.setattr(auth, "FINANCE_AUTH_SECRET", SECRET)
+        monkeypatch.setattr(auth, "FINANCE_AUTH_ISSUER_KEY", "issuer-key")
+        return TestClient(main.app)
+
+    def test_issues_tokens_to_the_issuer(self, client):
+        response = client.post("/api/auth/token", json={"user_id": "alice"}, headers={"X-Issuer-Key": "issuer-key"})
+        assert response.status_code == 200
+        data = response.json()
+        assert auth.verify_token(data["token"], SECRET) == "alice"
+        assert data["expires_at"] > time.time()
+
+    def test_rejects_everyone_else(self, client, monkeypatch):
+        assert client.post("/api/auth/token", json={"user_id": "alice"}).status_code == 401
+        assert client.post(
+            "/api/auth/token", json={"user_id": "alice"}, headers={"X-Issuer-Key": "guess"},
+        ).status_code == 401
+        monkeypatch.setattr(auth, "FINANCE_AUTH_ISSUER_KEY", "")
+        assert client.post("/api/auth/token", json={"user_id": "alice"}, headers={"X-Issuer-Key": ""}).status_code == 401
+
+    def test_needs_a_user(self, client):
+        headers = {"X-Issuer-Key": "issuer-key"}
+        assert client.post("/api/auth/token", json={}, headers=headers).status_code == 400
+        assert client.post("/api/auth/token", json={"user_id": "a", "ttl_seconds": "soon"}, headers=headers).status_code == 400
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,230 @@
+"""
+Test suite for cash-flow projection
+"""
+
+import httpx
+import numpy as np
+import pytest
+import sys
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+# Add server_py to path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from adaptive_limiter import AdaptiveLimiter
+from cashflow import account_cash_flow, assess_risk, daily_spend, project_cash_flow
+from demo_fixtures import DemoFixtures
+from nessie_client import NessieClient
+from nessie_standin import NessieStandIn, create_app
+
+TODAY = date(2026, 3, 31)
+
+
+def series(merchant, amount, next_date, period="monthly", low=None, high=None, active=True):
+    return {
+        "merchant": merchant, "amount": amount, "period": period, "next_date": next_date.isoformat(),
+        "amount_low": amount if low is None else low, "amount_high": amount if high is None else high,
+        "active": active,
+    }
+
+
+def balances(projection):
+    return [day["balance"] for day in projection["timeline"]]
+
+
+class TestProjectCashFlow:
+    def test_timeline(self):
+        projection = project_cash_flow(
+            1000.0, purchase=100.0, today=TODAY, horizon_days=10,
+            bills=[{"status": "pending", "payee": "Electric", "payment_amount": 120.0, "payment_date": "2026-04-03"}],
+            recurring_charges=[series("Rent", 1500.0, TODAY + timedelta(days=4))],
+            recurring_income=[series("Payroll", 1200.0, TODAY + timedelta(days=6), period="biweekly")],
+            daily_spend=np.array([10.0, 30.0]),
+        )
+        # The purchase comes out today, everyday spending from tomorrow
+        assert balances(projection)[:8] == [900.0, 880.0, 860.0, 720.0, -800.0, -820.0, 360.0, 340.0]
+        assert len(projection["timeline"]) == 10 and projection["timeline"][0]["date"] == "2026-03-31"
+        assert projection["min_balance"] == -820.0 and projection["min_balance_date"] == "2026-04-05"
+        assert projection["first_overdraft_date"] == "2026-04-04"
+        assert (projection["scheduled_outflows"], projection["scheduled_income"]) == (1620.0, 1200.0)
+        assert projection["expected_spend"] == 180.0
+        assert [e["description"] for e in projection["events"]] == ["Electric", "Rent", "Payroll"]
+        assert projection["monte_carlo"] is None
+
+    def test_recurring_schedules(self):
+        projection = project_cash_flow(
+            0.0, today=TODAY, horizon_days=90,
+            bills=[
+                {"status": "recurring", "payee": "Insurance", "payment_amount": 80.0, "recurring_date": 15},
+                # Overdue and still owed
+                {"status": "pending", "payee": "Water", "payment_amount": 40.0, "payment_date": "2026-03-20"},
+                {"status": "completed", "payee": "Gas", "payment_amount": 55.0, "payment_date": "2026-03-25"},
+            ],
+            recurring_charges=[
+                series("Gym", 25.0, date(2026, 4, 10)),
+                series("Meal Kit", 60.0, date(2026, 4, 2), period="weekly"),
+                # Due yesterday and not seen yet
+                series("Netflix", 15.49, date(2026, 3, 30)),
+                series("Hulu", 7.99, date(2026, 4, 5), active=False),
+            ],
+        )
+        dates = {}
+        for event in projection["events"]:
+            dates.setdefault(event["description"], []).append(event["date"])
+        assert dates["Insurance"] == ["2026-04-15", "2026-05-15", "2026-06-15"]
+        assert dates["Water"] == ["2026-03-31"]
+        assert dates["Gym"] == ["2026-04-10", "2026-05-10", "2026-06-10"]
+        assert len(dates["Meal Kit"]) == 13
+        assert dates["Netflix"][0] == "2026-03-31"
+        assert "Gas" not in dates and "Hulu" not in dates
+
+    def test_billed_charges_are_not_counted_twice(self):
+        projection = project_cash_flow(
+            0.0, today=TODAY, horizon_days=60,
+            bills=[{"status": "pending", "payee": "Rent Payment", "payment_amount": 1500.0, "payment_date": "2026-04-01"}],
+            recurring_charges=[series("Rent Payment", 1500.0, date(2026, 4, 1))],
+        )
+        rent = [e["date"] for e in projection["events"] if e["description"] == "Rent Payment"]
+        # The bill covers April; the detected series carries on from May
+        assert rent == ["2026-04-01", "2026-05-01"]
+
+    def test_horizon_is_capped(self):
+        assert project_cash_flow(100.0, today=TODAY, horizon_days=365)["horizon_days"] == 90
+        assert project_cash_flow(100.0, today=TODAY, horizon_days=0)["horizon_days"] == 1
+
+
+class TestMonteCarlo:
+    def inputs(self):
+        return dict(
+            today=TODAY, horizon_days=90,
+            recurring_charges=[series("Electric", 100.0, date(2026, 4, 20), low=60.0, high=140.0)],
+            recurring_income=[series("Payroll", 1400.0, date(2026, 4, 3), period="biweekly", low=1300.0, high=1500.0)],
+            daily_spend=np.random.default_rng(0).gamma(2.0, 45.0, size=90),
+        )
+
+    def test_spread_and_probability(self):
+        inputs = self.inputs()
+        projection = project_cash_flow(300.0, simulations=2000, seed=1, **inputs)
+        mc = projection["monte_carlo"]
+        assert mc["simulations"] == 2000
+        assert 0 < mc["overdraft_probability"] < 1
+        assert mc["min_balance_p5"] < mc["min_balance_p50"] <= mc["end_balance_p50"]
+        assert mc["min_balance_p50"] == pytest.approx(projection["min_balance"], abs=250)
+
+        # More money up front only lowers the odds
+        assert project_cash_flow(3000.0, simulations=2000, seed=1, **inputs)["monte_carlo"]["overdraft_probability"] < mc["overdraft_probability"]
+        assert project_cash_flow(300.0, simulations=2000, seed=1, **inputs)["monte_carlo"] == mc
+
+    def test_fixed_amounts_match_the_timeline(self):
+        projection = project_cash_flow(
+            600.0, today=TODAY, horizon_days=30, recurring_charges=[series("Rent", 400.0, date(2026, 4, 1))],
+            daily_spend=np.full(30, 5.0), simulations=100, seed=1,
+        )
+        mc = projection["monte_carlo"]
+        assert mc["min_balance_p5"] == mc["min_balance_p50"] == projection["min_balance"]
+        assert mc["overdraft_probability"] == 0.0
+
+    def test_fast(self):
+        start = time.perf_counter()
+        project_cash_flow(300.0, simulations=1000, seed=1, **self.inputs())
+        assert time.perf_counter() - start < 0.5
+
+
+class TestAccountCashFlow:
+    def test_daily_spend_leaves_out_recurring_charges(self):
+        purchases = [
+            {"name": "Netflix", "amount": 15.49, "date": "2026-03-15"},
+            {"name": "Coffee", "amount": 4.5, "date": "2026-03-30"},
+            {"name": "Coffee", "amount": 5.5, "date": "2026-03-30"},
+            {"description": "Groceries", "amount": 60.0, "purchase_date": "2026-01-01"},
+            {"name": "Refund", "amount": -20.0, "date": "2026-03-29"},
+            {"name": "Too old", "amount": 99.0, "date": "2025-10-01"},
+        ]
+        spend = daily_spend(purchases, [series("Netflix", 15.49, date(2026, 4, 15))], TODAY)
+        assert len(spend) == 90 and spend.sum() == 70.0 and spend[-1] == 10.0
+
+    def test_demo_checking(self):
+        fixtures = DemoFixtures(seed=7, days=180, end_date=TODAY)
+        history = [t for t in fixtures.iter_transactions("alice") if t["account_id"] == "demo_checking_0000"]
+        projection = account_cash_flow(
+            2000.0, [t for t in history if t["amount"] > 0], [{**t, "amount": -t["amount"]} for t in history if t["amount"] < 0],
+            today=TODAY, horizon_days=60,
+        )
+        assert {e["description"] for e in projection["events"]} == {"Payroll Deposit", "Rent Payment"}
+        assert sum(e["description"] == "Rent Payment" for e in projection["events"]) == 2
+
+
+class TestAssessRisk:
+    def projection(self, min_balance, overdraft_probability=None):
+        return {
+            "horizon_days": 30, "min_balance": min_balance,
+            "first_overdraft_date": "2026-04-02" if min_balance < 0 else None,
+            "monte_carlo": None if overdraft_probability is None else {"overdraft_probability": overdraft_probability},
+        }
+
+    def test_levels(self):
+        assert assess_risk(self.projection(500.0)) == ("SAFE", [])
+        assert assess_risk(self.projection(150.0)) == ("WARNING", ["Low buffer remaining after bills."])
+        assert assess_risk(self.projection(-10.0))[0] == "CRITICAL"
+        assert assess_risk(self.projection(500.0, 0.2)) == ("WARNING", ["20% chance of overdraft in the next 30 days."])
+        assert assess_risk(self.projection(500.0, 0.6))[0] == "CRITICAL"
+
+
+class TestSimulatePurchaseEndpoint:
+    @pytest.fixture
+    def client(self):
+        from fastapi.testclient import TestClient
+        import main
+
+        self.main = main
+        return TestClient(main.app)
+
+    def simulate(self, client, account_id, amount, **body):
+        return client.post(
+            "/api/finance/simulate-purchase", headers={"X-User-Id": "alice"},
+            json={"account_id": account_id, "amount": amount, "intent": "shoes", "desire_score": 8, **body},
+        ).json()
+
+    def test_demo_account(self, client):
+        fixtures = self.main.demo_fixtures
+        self.main.demo_fixtures = DemoFixtures(seed=7, days=365, end_date=TODAY)
+        try:
+            checking = self.main.demo_fixtures.accounts("alice")[0]
+            result = self.simulate(client, "demo_checking_0000", 50.0, horizon_days=45, simulations=200)
+            broke = self.simulate(client, "demo_checking_0000", 100000.0, simulations=0)
+        finally:
+            self.main.demo_fixtures = fixtures
+
+        assert result["current_balance"] == checking["balances"]["current"]
+        projection = result["projection"]
+        assert projection["horizon_days"] == 45 and projection["start_date"] == TODAY.isoformat()
+        assert result["projected_balance"] == projection["min_balance"]
+        assert result["pending_bills"] == projection["scheduled_outflows"] > 0
+        assert result["overdraft_probability"] == projection["monte_carlo"]["overdraft_probability"]
+        assert (broke["risk_level"], broke["recommendation"]) == ("CRITICAL", "DENIED")
+        assert broke["overdraft_probability"] is None
+
+    def test_nessie_account(self, client):
+        standin = NessieStandIn(profile="instant")
+        checking = standin.customer_accounts(next(iter(standin.customers)))[0]
+        nessie = self.main.nessie_client
+        self.main.nessie_client = NessieClient(
+            base_url="http://nessie.local", transport=httpx.ASGITransport(app=create_app(standin)),
+            cache_enabled=False, retries=0, limiter=AdaptiveLimiter(16), host_limiter=AdaptiveLimiter(16),
+        )
+        try:
+            result = self.simulate(client, checking["_id"], 200.0, horizon_days=60)
+        finally:
+            self.main.nessie_client = nessie
+
+        assert "degraded" not in result
+        assert result["current_balance"] == checking["balance"]
+        descriptions = {e["description"] for e in result["projection"]["events"]}
+        assert {"Payroll Deposit", "Rent Payment"} <= descriptions
+        assert result["projection"]["monte_carlo"]["simulations"] > 0
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
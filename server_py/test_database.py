@@ -0,0 +1,253 @@
+"""
+Test suite for database helpers
+"""
+
+import pytest
+import sqlite3
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+# Add server_py to path
+sys.path.insert(0, str(Path(__file__).parent))
+
+import database
+
+
+class TestTransactionMetadata:
+    def test_small_id_list(self):
+        """Test lookup through the IN-list path"""
+        database.save_transaction_regret("test_meta_small", 42, "Small list")
+        metadata = database.get_transaction_metadata(["test_meta_small", "test_meta_missing"])
+        assert metadata == {"test_meta_small": {"regret_score": 42, "regret_reason": "Small list"}}
+    
+    def test_large_id_list(self):
+        """Test lookup past SQLite's bound-variable limit uses the json_each join"""
+        database.save_transaction_regret("test_meta_large", 77, "Large list")
+        ids = [f"test_meta_unknown_{i}" for i in range(40000)] + ["test_meta_large"]
+        assert len(ids) > database.METADATA_IN_LIST_LIMIT
+        
+        metadata = database.get_transaction_metadata(ids)
+        assert metadata == {"test_meta_large": {"regret_score": 77, "regret_reason": "Large list"}}
+    
+    def test_bulk_save_upserts(self):
+        """Test save_transaction_regrets inserts new rows and overwrites existing ones"""
+        database.save_transaction_regret("test_meta_bulk_1", 10, "Before")
+        saved = database.save_transaction_regrets([
+            ("test_meta_bulk_1", 60, "After"),
+            ("test_meta_bulk_2", 30, "New"),
+        ])
+        assert saved == 2
+        
+        metadata = database.get_transaction_metadata(["test_meta_bulk_1", "test_meta_bulk_2"])
+        assert metadata["test_meta_bulk_1"] == {"regret_score": 60, "regret_reason": "After"}
+        assert metadata["test_meta_bulk_2"] == {"regret_score": 30, "regret_reason": "New"}
+    
+    def test_bulk_save_keeps_last_duplicate(self):
+        saved = database.save_transaction_regrets([
+            ("test_meta_dup", 10, "First"),
+            ("test_meta_dup", 20, "Last"),
+        ])
+        assert saved == 1
+        assert database.get_transaction_metadata(["test_meta_dup"]) == {
+            "test_meta_dup": {"regret_score": 20, "regret_reason": "Last"},
+        }
+    
+    def test_empty_id_list(self):
+        assert database.get_transaction_metadata([]) == {}
+
+
+class TestUserPartitioning:
+    def test_metadata_is_scoped_per_user(self):
+        database.save_transaction_regret("test_shared_txn", 10, "Alice", user_id="test_alice")
+        database.save_transaction_regret("test_shared_txn", 90, "Bob", user_id="test_bob")
+        
+        alice = database.for_user("test_alice").get_transaction_metadata(["test_shared_txn"])
+        bob = database.for_user("test_bob").get_transaction_metadata(["test_shared_txn"])
+        assert alice["test_shared_txn"]["regret_score"] == 10
+        assert bob["test_shared_txn"]["regret_score"] == 90
+    
+    def test_store_binds_user(self):
+        store = database.for_user("test_alice")
+        with pytest.raises(TypeError):
+            store.get_user_profile(user_id="test_bob")
+        with pytest.raises(AttributeError):
+            store.configure
+    
+    def test_plaid_items_live_in_store(self):
+        store = database.for_user("test_plaid_user")
+        store.delete_plaid_items()
+        store.save_plaid_item("test_item_1", "access-sandbox-1", "ins_1")
+        
+        items = store.get_plaid_items()
+        assert items == [{
+            "item_id": "test_item_1", "access_token": "access-sandbox-1",
+            "institution_id": "ins_1", "sync_cursor": None,
+        }]
+        assert database.get_plaid_items(user_id="test_other_user") == []
+        
+        store.delete_plaid_items()
+        assert store.get_plaid_items() == []
+    
+    def test_single_user_schema_migrates_to_default_user(self, tmp_path):
+        """Tables created before per-user partitioning move to DEFAULT_USER_ID"""
+        path = tmp_path / "legacy.db"
+        conn = sqlite3.connect(path)
+        conn.executescript('''
+            CREATE TABLE user_profile (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, spending_regret TEXT, user_goals TEXT,
+                top_categories TEXT, updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+            CREATE TABLE transaction_metadata (
+                transaction_id TEXT PRIMARY KEY, regret_score INTEGER, regret_reason TEXT,
+                analyzed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+            CREATE TABLE pigeon_user_settings (
+                id INTEGER PRIMARY KEY CHECK (id = 1), monitoring_enabled INTEGER DEFAULT 0,
+                notification_threshold REAL DEFAULT 0.70, proximity_radius_meters REAL DEFAULT 50.0,
+                quiet_hours_start INTEGER DEFAULT 23, quiet_hours_end INTEGER DEFAULT 7,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+            INSERT INTO user_profile (id, spending_regret, user_goals, top_categories)
+                VALUES (1, 'Late-night food', 'Save', '["Food"]');
+            INSERT INTO transaction_metadata (transaction_id, regret_score, regret_reason)
+                VALUES ('legacy_txn', 55, 'Legacy');
+            INSERT INTO pigeon_user_settings (id, monitoring_enabled) VALUES (1, 1);
+        ''')
+        conn.commit()
+        conn.close()
+        
+        try:
+            database.configure(f"sqlite:///{path}")
+            assert database.get_user_profile()["spending_regret"] == "Late-night food"
+            assert database.get_transaction_metadata(["legacy_txn"])["legacy_txn"]["regret_score"] == 55
+            assert database.get_pigeon_user_settings()["monitoring_enabled"] is True
+            assert database.get_user_profile(user_id="someone_else") is None
+        finally:
+            database.configure(database.FINANCE_DATABASE_URL)
+    
+    def test_migrations_run_once(self, tmp_path):
+        path = tmp_path / "versioned.db"
+        try:
+            # Workers starting together all configure the same database
+            with ThreadPoolExecutor(4) as pool:
+                list(pool.map(lambda _: database.configure(f"sqlite:///{path}"), range(4)))
+            conn = sqlite3.connect(path)
+            versions = conn.execute("SELECT version FROM schema_version").fetchall()
+            conn.close()
+            assert versions == [(database.SCHEMA_VERSION,)]
+        finally:
+            database.configure(database.FINANCE_DATABASE_URL)
+
+
+def make_transaction(transaction_id, day, amount=10.0, name="Coffee"):
+    return {
+        "transaction_id": transaction_id, "account_id": "test_acc", "name": name,
+        "amount": amount, "date": f"2026-01-{day:02d}", "category": ["Food and Drink"],
+        "pending": False, "merchant_name": name, "payment_channel": "in store",
+        "iso_currency_code": "USD",
+    }
+
+
+class TestTransactionStore:
+    def setup_method(self):
+        self.store = database.for_user("test_sync_user")
+        self.store.delete_plaid_items()
+        self.store.save_plaid_item("test_sync_item", "access-sandbox-sync")
+    
+    def teardown_method(self):
+        self.store.delete_plaid_items()
+    
+    def test_sync_delta_applies_and_advances_cursor(self):
+        self.store.apply_transaction_sync(
+            "test_sync_item",
+            [make_transaction("t1", 1), make_transaction("t2", 2), make_transaction("t3", 3)],
+            [], [], "cursor-1",
+        )
+        self.store.apply_transaction_sync(
+            "test_sync_item",
+            [], [make_transaction("t2", 2, amount=99.0)], ["t1"], "cursor-2",
+        )
+        
+        transactions = self.store.get_transactions()
+        assert [t["transaction_id"] for t in transactions] == ["t3", "t2"]
+        assert transactions[1]["amount"] == 99.0
+        assert transactions[1]["category"] == ["Food and Drink"]
+        assert self.store.get_plaid_items()[0]["sync_cursor"] == "cursor-2"
+    
+    def test_pages_newest_first_with_regret_scores(self):
+        self.store.apply_transaction_sync(
+            "test_sync_item", [make_transaction(f"p{day}", day) for day in range(1, 6)], [], [], "c"
+        )
+        self.store.save_transaction_regret("p4", 80, "Impulse")
+        
+        first = self.store.get_transactions(limit=2)
+        last = first[-1]
+        second = self.store.get_transactions(limit=2, before=(last["date"], last["transaction_id"]))
+        assert [t["transaction_id"] for t in first + second] == ["p5", "p4", "p3", "p2"]
+        assert first[1]["regretScore"] == 80
+        assert first[0]["regretScore"] is None
+        assert database.get_transactions(user_id="test_other_user") == []
+    
+    def test_keyset_breaks_ties_on_transaction_id(self):
+        self.store.apply_transaction_sync(
+            "test_sync_item", [make_transaction(f"k{i}", 7) for i in range(5)], [], [], "c"
+        )
+        seen = []
+        before = None
+        while True:
+            page = self.store.get_transactions(limit=2, before=before)
+            if not page:
+                break
+            seen += [t["transaction_id"] for t in page]
+            before = (page[-1]["date"], page[-1]["transaction_id"])
+        assert seen == ["k4", "k3", "k2", "k1", "k0"]
+    
+    def test_filters(self):
+        self.store.apply_transaction_sync("test_sync_item", [
+            make_transaction("f1", 1),
+            make_transaction("f2", 2),
+            {**make_transaction("f3", 3), "category": ["Travel", "Airlines and Aviation Services"]},
+            make_transaction("f4", 4),
+        ], [], [], "c")
+        self.store.save_transaction_regret("f2", 90, "Regret")
+        self.store.save_transaction_regret("f4", 20, "Fine")
+        
+        def ids(**filters):
+            return [t["transaction_id"] for t in self.store.get_transactions(**filters)]
+        
+        assert ids(start_date="2026-01-02", end_date="2026-01-03") == ["f3", "f2"]
+        assert ids(category="Airlines and Aviation Services") == ["f3"]
+        assert ids(category="Food and Drink") == ["f4", "f2", "f1"]
+        assert ids(min_regret=50) == ["f2"]
+        assert ids(category="Food and Drink", min_regret=10, end_date="2026-01-03") == ["f2"]
+    
+    def test_lookup_by_id_past_the_in_list_limit(self, monkeypatch):
+        self.store.apply_transaction_sync(
+            "test_sync_item", [make_transaction("b1", 1), make_transaction("b2", 2)], [], [], "c"
+        )
+        self.store.save_transaction_regret("b2", 70, "Regret")
+        
+        # Hold SQLite to its historical default of 999 bound variables
+        connect = database.get_db_connection
+        def limited_connection():
+            conn = connect()
+            conn.setlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER, 999)
+            return conn
+        monkeypatch.setattr(database, "get_db_connection", limited_connection)
+        ids = [f"test_missing_{i}" for i in range(2000)] + ["b1", "b2"]
+        assert len(ids) > database.METADATA_IN_LIST_LIMIT
+        
+        transactions = self.store.get_transactions_by_id(ids)
+        assert sorted(transactions) == ["b1", "b2"]
+        assert transactions["b2"]["regretScore"] == 70
+        assert self.store.get_transactions_by_id(["b1"]).keys() == {"b1"}
+    
+    def test_unlinking_drops_transactions(self):
+        self.store.apply_transaction_sync("test_sync_item", [make_transaction("u1", 1)], [], [], "c")
+        self.store.delete_plaid_items()
+        assert self.store.get_transactions() == []
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,130 @@
+"""
+Test suite for the Postgres storage backend
+
+The backend tests run against FINANCE_TEST_DATABASE_URL (a postgres:// URL)
+and are skipped when it is not set.
+"""
+
+import os
+import pytest
+import sys
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# Add server_py to path
+sys.path.insert(0, str(Path(__file__).parent))
+
+pytest.importorskip("psycopg_pool")
+
+import database
+from database_postgres import translate_sql
+
+TEST_DATABASE_URL = os.environ.get("FINANCE_TEST_DATABASE_URL", "")
+
+
+class TestTranslateSql:
+    def test_placeholders(self):
+        assert translate_sql("SELECT * FROM t WHERE a = ? AND b IN (?, ?)") == (
+            "SELECT * FROM t WHERE a = %s AND b IN (%s, %s)"
+        )
+
+    def test_percent_is_escaped_everywhere(self):
+        assert translate_sql("SELECT a % 2 FROM t WHERE b LIKE '10%' AND c = ?") == (
+            "SELECT a %% 2 FROM t WHERE b LIKE '10%%' AND c = %s"
+        )
+
+    def test_quoted_text_is_not_rewritten(self):
+        sql = '''SELECT 'why?', 'it''s ?', E'\\'?', "col?", $$ ? $$, $q$ ?REAL $q$ FROM t WHERE a = ?'''
+        assert translate_sql(sql) == (
+            '''SELECT 'why?', 'it''s ?', E'\\'?', "col?", $$ ? $$, $q$ ?REAL $q$ FROM t WHERE a = %s'''
+        )
+
+    def test_comments_are_not_rewritten(self):
+        sql = "SELECT a -- is it ? REAL\nFROM t /* ? */ WHERE b = ?"
+        assert translate_sql(sql) == "SELECT a -- is it ? REAL\nFROM t /* ? */ WHERE b = %s"
+
+    def test_ddl(self):
+        ddl = "CREATE TABLE t (id INTEGER PRIMARY KEY AUTOINCREMENT, score REAL, note TEXT DEFAULT 'REAL') -- REAL"
+        assert translate_sql(ddl) == (
+            "CREATE TABLE t (id BIGSERIAL PRIMARY KEY, score DOUBLE PRECISION, note TEXT DEFAULT 'REAL') -- REAL"
+        )
+
+    def test_cached(self):
+        sql = "SELECT ? -- cached"
+        assert translate_sql(sql) is translate_sql(sql)
+
+
+@pytest.mark.skipif(not TEST_DATABASE_URL, reason="FINANCE_TEST_DATABASE_URL is not set")
+class TestPostgresBackend:
+    @pytest.fixture(autouse=True)
+    def postgres(self):
+        database.configure(TEST_DATABASE_URL)
+        self.user_id = f"test_pg_{uuid.uuid4().hex[:8]}"
+        try:
+            yield
+        finally:
+            conn = database.get_db_connection()
+            conn.execute("DELETE FROM transaction_metadata WHERE user_id = ?", (self.user_id,))
+            conn.execute("DELETE FROM pigeon_interventions WHERE user_id = ?", (self.user_id,))
+            conn.commit()
+            conn.close()
+            database.configure(database.FINANCE_DATABASE_URL)
+
+    def test_literals_and_params(self):
+        conn = database.get_db_connection()
+        try:
+            row = conn.execute("SELECT 'why?' AS literal, '100%' AS percent, ? AS param", ("a?b%",)).fetchone()
+        finally:
+            conn.close()
+        assert dict(row) == {"literal": "why?", "percent": "100%", "param": "a?b%"}
+
+    def test_round_trip(self):
+        database.save_transaction_regret("txn_pg", 64, "Is it 50% worth it?", user_id=self.user_id)
+        assert database.get_transaction_metadata(["txn_pg"], user_id=self.user_id) == {
+            "txn_pg": {"regret_score": 64, "regret_reason": "Is it 50% worth it?"},
+        }
+
+    def test_large_id_list(self):
+        database.save_transaction_regret("txn_pg_large", 77, "Large list", user_id=self.user_id)
+        ids = [f"txn_pg_unknown_{i}" for i in range(database.METADATA_IN_LIST_LIMIT)] + ["txn_pg_large"]
+        assert database.get_transaction_metadata(ids, user_id=self.user_id) == {
+            "txn_pg_large": {"regret_score": 77, "regret_reason": "Large list"},
+        }
+        assert database.get_transactions_by_id(ids, user_id=self.user_id) == {}
+
+    def test_bulk_save_with_duplicate_ids(self):
+        saved = database.save_transaction_regrets(
+            [("txn_pg_dup", 10, "First"), ("txn_pg_other", 30, "Other"), ("txn_pg_dup", 20, "Last")],
+            user_id=self.user_id,
+        )
+        assert saved == 2
+        assert database.get_transaction_metadata(["txn_pg_dup"], user_id=self.user_id) == {
+            "txn_pg_dup": {"regret_score": 20, "regret_reason": "Last"},
+        }
+
+    def test_timestamps_are_utc_whatever_the_session_zone(self, monkeypatch):
+        # Compaction compares intervention_at with cutoffs built from utcnow()
+        monkeypatch.setenv("PGTZ", "Pacific/Kiritimati")
+        database.configure(TEST_DATABASE_URL)
+        intervention_id = database.save_pigeon_intervention(
+            user_id=self.user_id,
+            danger_zone_id="test_pg_zone",
+            latitude=40.444,
+            longitude=-79.943,
+            predicted_probability=0.5,
+            predicted_score=50,
+            risk_level="medium",
+        )
+        conn = database.get_db_connection()
+        try:
+            row = conn.execute(
+                "SELECT intervention_at FROM pigeon_interventions WHERE id = ?", (intervention_id,)
+            ).fetchone()
+        finally:
+            conn.close()
+        assert abs(row["intervention_at"] - datetime.utcnow()) < timedelta(minutes=1)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,118 @@
+"""
+Test suite for the deterministic demo data provider
+"""
+
+import pytest
+import sys
+from collections import Counter
+from datetime import date
+from pathlib import Path
+
+# Add server_py to path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from demo_fixtures import DemoFixtures
+
+END = date(2026, 3, 31)
+
+
+def make_fixtures(**kwargs):
+    return DemoFixtures(**{"seed": 7, "days": 365, "end_date": END, **kwargs})
+
+
+class TestDemoFixtures:
+    def test_same_seed_same_data(self):
+        first = make_fixtures().transactions("alice", limit=200)
+        assert first == make_fixtures().transactions("alice", limit=200)
+        assert make_fixtures().accounts("alice") == make_fixtures().accounts("alice")
+
+        assert first != make_fixtures(seed=8).transactions("alice", limit=200)
+        assert first != make_fixtures().transactions("bob", limit=200)
+
+    def test_ordered_newest_first_and_covers_history(self):
+        fixtures = make_fixtures(days=730)
+        transactions = list(fixtures.iter_transactions("alice"))
+        keys = [(t["date"], t["transaction_id"]) for t in transactions]
+        assert keys == sorted(keys, reverse=True)
+        assert len(set(keys)) == len(keys)
+        assert transactions[0]["date"] <= "2026-03-31"
+        assert transactions[-1]["date"] >= "2024-04-01"
+        # Around the configured three a day
+        assert 1500 < len(transactions) < 2900
+        assert all(t["regretScore"] is not None and t["regretReason"] for t in transactions)
+
+    def test_keyset_pages_match_full_listing(self):
+        fixtures = make_fixtures(days=60)
+        everything = fixtures.transactions("alice", limit=10_000)
+        pages, before = [], None
+        while True:
+            page = fixtures.transactions("alice", limit=25, before=before)
+            if not page:
+                break
+            pages.extend(page)
+            before = (page[-1]["date"], page[-1]["transaction_id"])
+        assert pages == everything
+
+    def test_filters(self):
+        fixtures = make_fixtures()
+        window = fixtures.transactions("alice", limit=10_000, start_date="2026-02-01", end_date="2026-02-28")
+        assert window and all("2026-02-01" <= t["date"] <= "2026-02-28" for t in window)
+
+        regrets = fixtures.transactions("alice", limit=50, min_regret=70)
+        assert regrets and all(t["regretScore"] >= 70 for t in regrets)
+
+        groceries = fixtures.transactions("alice", limit=50, category="Groceries")
+        assert groceries and all("Groceries" in t["category"] for t in groceries)
+
+    def test_recurring_charges_repeat_monthly(self):
+        transactions = make_fixtures().transactions("alice", limit=100_000)
+        rent = [t for t in transactions if t["name"] == "Rent Payment"]
+        assert len(rent) == 12
+        assert all(t["date"].endswith("-01") for t in rent)
+        assert len({t["amount"] for t in rent}) == 1
+
+        paydays = Counter(t["date"][:7] for t in transactions if t["name"] == "Payroll Deposit")
+        assert set(paydays.values()) <= {2, 3}
+
+    def test_accounts_are_configurable(self):
+        accounts = make_fixtures(accounts=4).accounts("alice")
+        assert [a["subtype"] for a in accounts] == ["checking", "credit card", "savings", "credit card"]
+        assert len({a["account_id"] for a in accounts}) == 4
+        ids = {a["account_id"] for a in accounts}
+        assert {t["account_id"] for t in make_fixtures(accounts=4).transactions("alice", limit=500)} <= ids
+
+        assert make_fixtures(users=3).user_ids() == ["demo_user_0", "demo_user_1", "demo_user_2"]
+
+
+class TestDemoEndpoints:
+    def setup_method(self):
+        from fastapi.testclient import TestClient
+        import main
+
+        self.main = main
+        self.client = TestClient(main.app)
+        self._demo = (main.DEMO_MODE, main.demo_fixtures)
+        main.DEMO_MODE = True
+        main.demo_fixtures = make_fixtures(days=120)
+
+    def teardown_method(self):
+        self.main.DEMO_MODE, self.main.demo_fixtures = self._demo
+
+    def test_pages_through_generated_history(self):
+        headers = {"X-User-Id": "demo_user_0"}
+        seen, cursor = [], None
+        while True:
+            params = {"limit": 100, **({"cursor": cursor} if cursor else {})}
+            data = self.client.get("/api/plaid/transactions", params=params, headers=headers).json()
+            seen.extend(data["transactions"])
+            cursor = data["next_cursor"]
+            if not cursor:
+                break
+        assert seen == self.main.demo_fixtures.transactions("demo_user_0", limit=100_000)
+
+        accounts = self.client.get("/api/plaid/accounts", headers=headers).json()["accounts"]
+        assert accounts == self.main.demo_fixtures.accounts("demo_user_0")
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,565 @@
+"""
+Test suite for the pooled Nessie API client
+"""
+
+import asyncio
+import httpx
+import json
+import pytest
+import sys
+import time
+from datetime import date
+from pathlib import Path
+
+# Add server_py to path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from adaptive_limiter import AdaptiveLimiter
+from nessie_client import NessieClient, QueueTimeout
+from resilience import CircuitBreaker, CircuitOpenError
+from response_cache import ResponseCache
+
+
+class RecordingTransport(httpx.AsyncBaseTransport):
+    def __init__(self):
+        self.requests = []
+        self.closed = False
+
+    async def handle_async_request(self, request):
+        self.requests.append(request)
+        if request.url.path.endswith("/missing"):
+            return httpx.Response(404, json={"message": "not found"})
+        return httpx.Response(200, json={"path": request.url.path, "key": request.url.params.get("key")})
+
+    async def aclose(self):
+        self.closed = True
+
+
+class TestNessieClient:
+    def test_requests_share_one_pooled_client(self):
+        transport = RecordingTransport()
+        client = NessieClient(base_url="https://nessie.test/", api_key="k", transport=transport)
+
+        async def scenario():
+            await client.start()
+            pool = client._client
+            results = await asyncio.gather(client.get_account("a1"), client.get_account_bills("a1"))
+            assert client._client is pool
+            await client.aclose()
+            return results
+
+        assert asyncio.run(scenario()) == [
+            {"path": "/accounts/a1", "key": "k"},
+            {"path": "/accounts/a1/bills", "key": "k"},
+        ]
+        assert str(transport.requests[0].url) == "https://nessie.test/accounts/a1?key=k"
+        assert transport.closed
+
+    def test_opens_on_first_use_and_after_close(self):
+        client = NessieClient(
+            base_url="https://nessie.test", api_key="", transport=RecordingTransport(), cache_enabled=False,
+        )
+
+        async def scenario():
+            first = await client.get_customers()
+            await client.aclose()
+            await client.aclose()
+            second = await client.get_customers()
+            await client.aclose()
+            return first, second
+
+        assert asyncio.run(scenario()) == ({"path": "/customers", "key": None},) * 2
+
+    def test_http_errors_raise(self):
+        client = NessieClient(base_url="https://nessie.test", transport=RecordingTransport())
+
+        async def scenario():
+            try:
+                await client._get("/missing")
+            finally:
+                await client.aclose()
+
+        with pytest.raises(httpx.HTTPStatusError):
+            asyncio.run(scenario())
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestNessieCache:
+    def make_client(self):
+        self.clock = FakeClock()
+        self.transport = RecordingTransport()
+        return NessieClient(
+            base_url="https://nessie.test",
+            transport=self.transport,
+            cache_ttls={"account": 30, "bills": 120},
+            cache_stale_seconds=600,
+            cache=ResponseCache(ttl=0, clock=self.clock),
+        )
+
+    def paths(self):
+        return [r.url.path for r in self.transport.requests]
+
+    def test_repeat_reads_hit_cache_with_per_kind_ttl(self):
+        client = self.make_client()
+
+        async def scenario():
+            for _ in range(3):
+                await client.get_account("a1")
+                await client.get_account_bills("a1")
+            self.clock.now += 60
+            # The account is now stale: served at once and refreshed behind it
+            await client.get_account("a1")
+            await client.get_account_bills("a1")
+            await asyncio.sleep(0.01)
+            await client.aclose()
+
+        asyncio.run(scenario())
+        assert self.paths() == ["/accounts/a1", "/accounts/a1/bills", "/accounts/a1"]
+        assert client.cache.stats["stale_hits"] == 1
+
+    def test_invalidate_account(self):
+        client = self.make_client()
+
+        async def scenario():
+            await client.get_account("a1")
+            await client.get_account("a2")
+            await client.get_customer_accounts("c1")
+            client.invalidate_account("a1")
+            await client.get_account("a1")
+            await client.get_account("a2")
+            await client.get_customer_accounts("c1")
+            await client.aclose()
+
+        asyncio.run(scenario())
+        assert self.paths() == [
+            "/accounts/a1", "/accounts/a2", "/customers/c1/accounts", "/accounts/a1", "/customers/c1/accounts",
+        ]
+
+    def test_errors_are_not_cached(self):
+        client = self.make_client()
+
+        async def scenario():
+            for _ in range(2):
+                with pytest.raises(httpx.HTTPStatusError):
+                    await client._get("/missing", kind="account")
+            await client.aclose()
+
+        asyncio.run(scenario())
+        assert self.paths() == ["/missing", "/missing"]
+
+
+class SlowTransport(httpx.AsyncBaseTransport):
+    """Answers after a delay, tracking how many requests overlap"""
+
+    def __init__(self, delay=0.02, status=200):
+        self.delay = delay
+        self.status = status
+        self.paths = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def handle_async_request(self, request):
+        self.paths.append(request.url.path)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.in_flight -= 1
+        return httpx.Response(self.status, json={"path": request.url.path})
+
+
+class TestNessieFanOut:
+    def make_client(self, transport, host_limit=4, global_limit=16):
+        return NessieClient(
+            base_url="https://nessie.test",
+            transport=transport,
+            cache_enabled=False,
+            limiter=AdaptiveLimiter(global_limit),
+            host_limiter=AdaptiveLimiter(host_limit),
+            retries=0,
+        )
+
+    def test_identical_concurrent_gets_share_one_request(self):
+        transport = SlowTransport()
+        client = self.make_client(transport)
+
+        async def scenario():
+            results = await asyncio.gather(*(client.get_customer("c1") for _ in range(5)), client.get_account("a1"))
+            await client.aclose()
+            return results
+
+        results = asyncio.run(scenario())
+        assert results[0] == results[4] == {"path": "/customers/c1"}
+        assert sorted(transport.paths) == ["/accounts/a1", "/customers/c1"]
+        assert client.stats["coalesced"] == 4
+
+    def test_fan_out_is_bounded(self):
+        transport = SlowTransport()
+        client = self.make_client(transport, host_limit=3)
+
+        async def scenario():
+            await asyncio.gather(*(client.get_account(f"a{i}") for i in range(20)))
+            await client.aclose()
+
+        asyncio.run(scenario())
+        assert len(transport.paths) == 20
+        assert transport.max_in_flight == 3
+
+    def test_rate_limited_burst_halves_limit_once(self):
+        transport = SlowTransport(status=429)
+        client = self.make_client(transport, host_limit=8)
+
+        async def scenario():
+            await asyncio.gather(*(client.get_account(f"a{i}") for i in range(8)), return_exceptions=True)
+            await client.aclose()
+
+        asyncio.run(scenario())
+        assert client.host_limiter.limit == 4
+        assert client.limiter.limit == 8
+
+
+class TestAdaptiveLimiter:
+    def test_grows_back_after_successes(self):
+        limiter = AdaptiveLimiter(4)
+
+        async def scenario():
+            token = await limiter.acquire()
+            limiter.release(token, overloaded=True)
+            assert limiter.limit == 2
+            for _ in range(2 + 3):
+                limiter.release(await limiter.acquire())
+            return limiter.limit
+
+        assert asyncio.run(scenario()) == 4
+
+    def test_cancelled_waiter_gives_up_its_place(self):
+        limiter = AdaptiveLimiter(1)
+
+        async def scenario():
+            token = await limiter.acquire()
+            waiter = asyncio.create_task(limiter.acquire())
+            await asyncio.sleep(0)
+            waiter.cancel()
+            await asyncio.gather(waiter, return_exceptions=True)
+            limiter.release(token)
+            limiter.release(await asyncio.wait_for(limiter.acquire(), 1))
+            return limiter.in_flight
+
+        assert asyncio.run(scenario()) == 0
+
+    def test_belongs_to_one_loop_at_a_time(self):
+        limiter = AdaptiveLimiter(1)
+
+        async def hold():
+            return await limiter.acquire()
+
+        token = asyncio.run(hold())
+        with pytest.raises(RuntimeError):
+            asyncio.run(hold())
+        limiter.release(token)
+        # Idle again, so another loop may take it over
+        limiter.release(asyncio.run(hold()))
+        assert limiter.in_flight == 0
+
+    def test_clients_do_not_share_limiters(self):
+        first, second = NessieClient(), NessieClient()
+        assert first.limiter is not second.limiter
+        assert first.host_limiter is not second.host_limiter
+
+
+class ScriptedTransport(httpx.AsyncBaseTransport):
+    """Replies to each request in turn with (status, delay) from the script, then 200s"""
+
+    def __init__(self, script=(), delay=0.0):
+        self.script = list(script)
+        self.delay = delay
+        self.paths = []
+
+    async def handle_async_request(self, request):
+        self.paths.append(request.url.path)
+        status, delay = self.script.pop(0) if self.script else (200, self.delay)
+        await asyncio.sleep(delay)
+        return httpx.Response(status, json={"path": request.url.path})
+
+
+class TestNessieResilience:
+    def make_client(self, transport, **kwargs):
+        options = {
+            "cache_enabled": False, "retry_base_seconds": 0.01, "hedge_percentile": 0,
+            "limiter": AdaptiveLimiter(16), "host_limiter": AdaptiveLimiter(16), **kwargs,
+        }
+        return NessieClient(base_url="https://nessie.test", transport=transport, **options)
+
+    def run(self, client, calls):
+        async def scenario():
+            try:
+                return await asyncio.gather(*calls(), return_exceptions=True)
+            finally:
+                await client.aclose()
+
+        return asyncio.run(scenario())
+
+    def test_retries_transient_failures(self):
+        transport = ScriptedTransport([(503, 0), (500, 0)])
+        client = self.make_client(transport)
+        assert self.run(client, lambda: [client.get_account("a1")]) == [{"path": "/accounts/a1"}]
+        assert len(transport.paths) == 3
+        assert client.stats["retries"] == 2
+
+    def test_client_errors_are_not_retried(self):
+        transport = ScriptedTransport([(404, 0)])
+        client = self.make_client(transport)
+        [error] = self.run(client, lambda: [client.get_account("a1")])
+        assert isinstance(error, httpx.HTTPStatusError)
+        assert len(transport.paths) == 1
+        assert client.health()["breakers"]["account"]["state"] == "closed"
+
+    def test_breaker_fails_fast_once_open(self):
+        transport = ScriptedTransport([(503, 0)] * 10)
+        client = self.make_client(transport, retries=0, breaker_failures=2)
+
+        async def calls():
+            results = []
+            for _ in range(4):
+                try:
+                    results.append(await client.get_account("a1"))
+                except Exception as e:
+                    results.append(e)
+            return results
+
+        [results] = self.run(client, lambda: [calls()])
+        assert [type(r) for r in results] == [httpx.HTTPStatusError] * 2 + [CircuitOpenError] * 2
+        assert len(transport.paths) == 2
+        breaker = client.health()["breakers"]["account"]
+        assert breaker["state"] == "open" and breaker["rejected"] == 2
+
+    def test_slow_request_is_hedged(self):
+        # 20 quick requests teach the client what normal looks like
+        transport = ScriptedTransport([(200, 0.01)] * 20 + [(200, 2.0)], delay=0.01)
+        client = self.make_client(transport, hedge_percentile=95)
+
+        async def calls():
+            for i in range(20):
+                await client.get_account(f"warm{i}")
+            start = time.perf_counter()
+            result = await client.get_account("slow")
+            return result, time.perf_counter() - start
+
+        [(result, elapsed)] = self.run(client, lambda: [calls()])
+        assert result == {"path": "/accounts/slow"}
+        assert elapsed < 0.5
+        assert client.stats["hedges"] == 1 and client.stats["hedge_wins"] == 1
+
+    def test_deadline_bounds_a_hung_upstream(self):
+        transport = ScriptedTransport(delay=10)
+        client = self.make_client(transport, retries=10, attempt_timeout=0.1, deadline=0.35)
+
+        async def calls():
+            start = time.perf_counter()
+            try:
+                await client.get_account("a1")
+            except asyncio.TimeoutError:
+                return time.perf_counter() - start
+
+        [elapsed] = self.run(client, lambda: [calls()])
+        assert elapsed is not None and elapsed < 0.6
+        assert 2 <= len(transport.paths) <= 4
+
+    def test_queueing_for_a_slot_is_not_an_upstream_failure(self):
+        # Far more requests than slots; each is quick upstream but queues here
+        # for longer than the attempt timeout
+        transport = ScriptedTransport(delay=0.05)
+        client = self.make_client(
+            transport, attempt_timeout=0.1, deadline=0.5, breaker_failures=2,
+            limiter=AdaptiveLimiter(2), host_limiter=AdaptiveLimiter(2),
+        )
+        results = self.run(client, lambda: [client.get_account(f"a{i}") for i in range(20)])
+
+        assert results == [{"path": f"/accounts/a{i}"} for i in range(20)]
+        assert len(transport.paths) == 20 and client.stats["retries"] == 0
+        assert client.health()["breakers"]["account"]["state"] == "closed"
+        assert client.health()["breakers"]["account"]["failures"] == 0
+
+    def test_queue_timeout_does_not_trip_the_breaker(self):
+        transport = ScriptedTransport()
+        limiter = AdaptiveLimiter(1)
+        client = self.make_client(transport, queue_timeout=0.1, breaker_failures=1, limiter=limiter)
+
+        async def calls():
+            # Another caller holds the only slot past the queue timeout
+            token = await limiter.acquire()
+            try:
+                await client.get_account("a1")
+            except QueueTimeout as e:
+                return e
+            finally:
+                limiter.release(token)
+
+        [error] = self.run(client, lambda: [calls()])
+        assert isinstance(error, QueueTimeout)
+        assert transport.paths == [] and client.stats["retries"] == 0
+        assert client.health()["breakers"]["account"]["state"] == "closed"
+
+
+class TestCircuitBreaker:
+    def test_half_open_probe(self):
+        clock = FakeClock()
+        breaker = CircuitBreaker("test", failure_threshold=1, reset_seconds=30, clock=clock)
+        breaker.before_call()
+        breaker.record_failure()
+        with pytest.raises(CircuitOpenError):
+            breaker.before_call()
+
+        clock.now += 31
+        breaker.before_call()
+        # Only one probe at a time while half-open
+        with pytest.raises(CircuitOpenError):
+            breaker.before_call()
+        breaker.record_failure()
+        assert breaker.state == "open"
+
+        clock.now += 31
+        breaker.before_call()
+        breaker.record_success()
+        assert breaker.snapshot()["state"] == "closed"
+        assert breaker.stats["opened"] == 2
+
+
+class FakeNessieBank(httpx.AsyncBaseTransport):
+    """A customer with three accounts; the first one's data is slow to load"""
+
+    def __init__(self):
+        self.paths: list[str] = []
+
+    async def handle_async_request(self, request):
+        path = request.url.path
+        self.paths.append(path)
+        if path == "/customers/c1/accounts":
+            return httpx.Response(200, json=[{"_id": f"a{i}"} for i in range(3)])
+        if path == "/customers/c1":
+            return httpx.Response(200, json={"_id": "c1", "first_name": "Ada"})
+        if path.startswith("/accounts/a0"):
+            await asyncio.sleep(0.3)
+        if path.endswith("/loans"):
+            return httpx.Response(500, json={"message": "down"})
+        if path.count("/") == 2:
+            return httpx.Response(200, json={"_id": path.split("/")[2], "balance": 100})
+        return httpx.Response(200, json=[])
+
+
+class TestNessieHistory:
+    def setup_method(self):
+        from nessie_standin import NessieStandIn, create_app
+
+        self.standin = NessieStandIn(profile="instant", customers=1, end_date=date(2026, 3, 31))
+        self.account_id = next(a["_id"] for a in self.standin.accounts.values() if a["type"] == "Credit Card")
+        self.client = NessieClient(
+            base_url="http://nessie.local", transport=httpx.ASGITransport(app=create_app(self.standin)),
+            limiter=AdaptiveLimiter(16), host_limiter=AdaptiveLimiter(16),
+        )
+
+    def window(self, *args):
+        async def collect():
+            try:
+                return list(await self.client.filter_account_history(self.account_id, "purchases", *args))
+            finally:
+                await self.client.aclose()
+
+        return asyncio.run(collect())
+
+    def test_window_filters_by_date(self):
+        purchases = self.window("2026-03-01", date(2026, 3, 31))
+        expected = [p for p in self.standin.history(self.account_id)["purchases"] if "2026-03-01" <= p["purchase_date"]]
+        assert [p["_id"] for p in purchases] == [p["_id"] for p in expected]
+        # Nessie cannot filter, so the window comes from one request
+        assert self.standin.stats["requests"] == 1
+
+    def test_windows_share_one_request(self):
+        async def scenario():
+            try:
+                windows = await asyncio.gather(*(
+                    self.client.filter_account_history(self.account_id, "purchases", since)
+                    for since in ["2026-01-01", "2026-02-01", "2026-03-01"]
+                ))
+                return [len(list(w)) for w in windows]
+            finally:
+                await self.client.aclose()
+
+        sizes = asyncio.run(scenario())
+        assert sizes[0] >= sizes[1] >= sizes[2] > 0
+        assert self.standin.stats["requests"] == 1
+
+    def test_open_window_returns_everything(self):
+        assert len(self.window()) == len(self.standin.history(self.account_id)["purchases"])
+
+    def test_empty_window(self):
+        assert self.window("2030-01-01") == []
+
+
+class TestSnapshotStream:
+    @pytest.fixture(autouse=True)
+    def fake_bank(self, tmp_path):
+        from fastapi.testclient import TestClient
+        import database
+        import main
+        from nessie_snapshots import SnapshotRefresher
+
+        self.main = main
+        self.client = TestClient(main.app)
+        nessie, refresher = main.nessie_client, main.snapshot_refresher
+        database.configure(f"sqlite:///{tmp_path / 'snapshots.db'}")
+        self.bank = FakeNessieBank()
+        main.nessie_client = NessieClient(
+            base_url="https://nessie.test", transport=self.bank, cache_enabled=False, retries=0,
+            limiter=AdaptiveLimiter(16), host_limiter=AdaptiveLimiter(16),
+        )
+        main.snapshot_refresher = SnapshotRefresher(main.nessie_client)
+        try:
+            yield
+        finally:
+            main.nessie_client, main.snapshot_refresher = nessie, refresher
+            database.configure(database.FINANCE_DATABASE_URL)
+
+    def test_streams_accounts_as_they_finish(self):
+        with self.client.stream("GET", "/api/capitalone/customer/c1/snapshot/stream") as response:
+            assert response.headers["content-type"] == "application/x-ndjson"
+            events = [json.loads(line) for line in response.iter_lines() if line]
+
+        assert events[0] == {
+            "type": "customer", "customer_id": "c1", "customer": {"_id": "c1", "first_name": "Ada"}, "account_count": 3,
+        }
+        accounts = events[1:-1]
+        # The slow account arrives last even though it was asked for first
+        assert [e["account_id"] for e in accounts][-1] == "a0"
+        assert sorted(e["index"] for e in accounts) == [0, 1, 2]
+        assert accounts[0]["data"]["account"]["balance"] == 100
+        assert "error" in accounts[0]["data"]["loans"]
+        assert events[-1] == {"type": "done", "accounts": 3}
+
+        full = self.client.get("/api/capitalone/customer/c1/snapshot").json()
+        for account in full["accounts"]:
+            account.pop("fetched_at")
+        by_index = {e["index"]: e["data"] for e in accounts}
+        assert full["accounts"] == [by_index[i] for i in range(3)]
+
+    def test_refreshed_account_is_refetched(self):
+        self.client.get("/api/capitalone/customer/c1/snapshot")
+        self.bank.paths.clear()
+        assert self.client.post("/api/capitalone/accounts/a1/refresh").json() == {"success": True}
+
+        snapshot = self.client.get("/api/capitalone/customer/c1/snapshot", params={"max_age": 3600}).json()
+        assert {"/accounts/a1", "/accounts/a1/bills", "/accounts/a1/purchases"} <= set(self.bank.paths)
+        assert "/accounts/a2" not in self.bank.paths
+        assert snapshot["accounts"][1]["fetched_at"]["account"] is not None
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,149 @@
+"""
+Test suite for materialized Nessie customer snapshots
+"""
+
+import asyncio
+import httpx
+import pytest
+import sys
+import time
+from pathlib import Path
+
+# Add server_py to path
+sys.path.insert(0, str(Path(__file__).parent))
+
+import database
+from adaptive_limiter import AdaptiveLimiter
+from nessie_client import NessieClient
+from nessie_snapshots import assemble_snapshot, refresh_snapshot
+
+
+@pytest.fixture(autouse=True)
+def scratch_db(tmp_path):
+    database.configure(f"sqlite:///{tmp_path / 'snapshots.db'}")
+    try:
+        yield
+    finally:
+        database.configure(database.FINANCE_DATABASE_URL)
+
+
+class Bank(httpx.AsyncBaseTransport):
+    """A customer whose accounts, balances and failures the test controls"""
+
+    def __init__(self):
+        self.accounts = ["a0", "a1"]
+        self.balance = 100
+        self.failing: set[str] = set()
+        self.paths: list[str] = []
+
+    async def handle_async_request(self, request):
+        path = request.url.path
+        self.paths.append(path)
+        if path in self.failing:
+            return httpx.Response(500, json={"message": "down"})
+        if path == "/customers/c1/accounts":
+            return httpx.Response(200, json=[{"_id": aid} for aid in self.accounts])
+        if path == "/customers/c1":
+            return httpx.Response(200, json={"_id": "c1", "first_name": "Ada"})
+        if path.count("/") == 2:
+            return httpx.Response(200, json={"_id": path.split("/")[2], "balance": self.balance})
+        return httpx.Response(200, json=[])
+
+
+class TestSnapshotRefresh:
+    def setup_method(self):
+        self.bank = Bank()
+        self.client = NessieClient(
+            base_url="https://nessie.test", transport=self.bank, cache_enabled=False, retries=0,
+            limiter=AdaptiveLimiter(16), host_limiter=AdaptiveLimiter(16),
+        )
+
+    def refresh(self, max_age=None):
+        self.bank.paths.clear()
+        return asyncio.run(refresh_snapshot(self.client, "c1", max_age))
+
+    def snapshot(self):
+        return assemble_snapshot("c1", database.get_snapshot_sections("c1"))
+
+    def expire(self, section):
+        """Make a stored section due, as if its TTL had run out"""
+        rows = [s for s in database.get_snapshot_sections("c1") if s["section"] == section]
+        database.save_snapshot_sections("c1", [{**s, "stale_at": time.time() - 1} for s in rows])
+
+    def test_first_refresh_materializes_everything(self):
+        assert self.snapshot() is None
+        # customer + account list + 7 sections for each of 2 accounts
+        assert self.refresh() == 16
+
+        snapshot = self.snapshot()
+        assert [a["account"]["_id"] for a in snapshot["accounts"]] == ["a0", "a1"]
+        assert snapshot["accounts"][0]["customer"]["first_name"] == "Ada"
+        assert snapshot["accounts"][0]["bills"] == []
+        assert set(snapshot["accounts"][0]["fetched_at"]) == {
+            "account", "bills", "deposits", "loans", "purchases", "transfers", "withdrawals",
+        }
+        assert snapshot["stale"] is False
+
+    def test_fresh_sections_are_not_refetched(self):
+        self.refresh()
+        assert self.refresh() == 0
+        assert self.bank.paths == []
+
+    def test_only_stale_sections_are_refetched(self):
+        self.refresh()
+        self.bank.balance = 250
+        self.expire("account")
+        assert self.snapshot()["stale"] is True
+
+        assert self.refresh() == 2
+        assert sorted(self.bank.paths) == ["/accounts/a0", "/accounts/a1"]
+        assert self.snapshot()["accounts"][1]["account"]["balance"] == 250
+
+    def test_max_age_forces_a_refresh(self):
+        self.refresh()
+        assert self.refresh(max_age=0) == 16
+
+    def test_closed_accounts_are_dropped(self):
+        self.refresh()
+        self.bank.accounts = ["a1"]
+        self.expire("accounts")
+        self.refresh()
+
+        assert {s["account_id"] for s in database.get_snapshot_sections("c1")} == {"", "a1"}
+        assert [a["account"]["_id"] for a in self.snapshot()["accounts"]] == ["a1"]
+
+    def test_failed_fetch_keeps_previous_data(self):
+        self.refresh()
+        self.bank.balance = 250
+        self.bank.failing = {"/accounts/a0"}
+        self.refresh(max_age=0)
+
+        snapshot = self.snapshot()
+        assert snapshot["accounts"][0]["account"]["balance"] == 100
+        assert snapshot["accounts"][1]["account"]["balance"] == 250
+        row = next(s for s in database.get_snapshot_sections("c1") if s["account_id"] == "a0" and s["section"] == "account")
+        assert row["error"]
+        # Retried soon rather than after the section's full TTL
+        assert row["stale_at"] <= time.time() + 30
+
+    def test_marked_account_is_refetched(self):
+        self.refresh()
+        self.bank.balance = 250
+        assert database.mark_snapshot_account_stale("a1") == ["c1"]
+        assert self.snapshot()["stale"] is True
+
+        assert self.refresh() == 7
+        assert all(path.startswith("/accounts/a1") for path in self.bank.paths)
+        assert self.snapshot()["accounts"][1]["account"]["balance"] == 250
+        assert self.snapshot()["accounts"][0]["account"]["balance"] == 100
+
+    def test_failed_account_list_keeps_accounts(self):
+        self.refresh()
+        self.bank.failing = {"/customers/c1/accounts"}
+        self.refresh(max_age=0)
+
+        assert [a["account"]["_id"] for a in self.snapshot()["accounts"]] == ["a0", "a1"]
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,116 @@
+"""
+Test suite for the local Nessie stand-in
+"""
+
+import asyncio
+import httpx
+import pytest
+import sys
+import time
+from datetime import date
+from pathlib import Path
+
+# Add server_py to path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from adaptive_limiter import AdaptiveLimiter
+from nessie_client import NessieClient
+from nessie_standin import NessieStandIn, create_app
+
+END = date(2026, 3, 31)
+
+
+def make_standin(**overrides):
+    return NessieStandIn(**{"profile": "instant", "end_date": END, **overrides})
+
+
+def make_client(standin, **kwargs):
+    return NessieClient(
+        base_url="http://nessie.local", transport=httpx.ASGITransport(app=create_app(standin)),
+        cache_enabled=False, limiter=AdaptiveLimiter(16), host_limiter=AdaptiveLimiter(16),
+        **{"retries": 0, **kwargs},
+    )
+
+
+class TestNessieStandIn:
+    def test_same_seed_same_data(self):
+        first, second = make_standin(), make_standin()
+        assert first.customers == second.customers
+        account_id = next(iter(first.accounts))
+        assert first.history(account_id) == second.history(account_id)
+        assert make_standin(seed=7).customers != first.customers
+
+    def test_nessie_shapes(self):
+        standin = make_standin(customers=2, accounts=2)
+        assert len(standin.customers) == 2
+        customer_id = next(iter(standin.customers))
+        checking, card = standin.customer_accounts(customer_id)
+        assert (checking["type"], card["type"]) == ("Checking", "Credit Card")
+
+        purchases = standin.history(card["_id"])["purchases"]
+        assert purchases and all(p["payer_id"] == card["_id"] and p["amount"] > 0 for p in purchases)
+        dates = [p["purchase_date"] for p in purchases]
+        assert dates == sorted(dates, reverse=True) and dates[0] <= "2026-03-31"
+
+        deposits = standin.history(checking["_id"])["deposits"]
+        assert deposits and {d["description"] for d in deposits} == {"Payroll Deposit"}
+        bills = standin.history(checking["_id"])["bills"]
+        assert {(b["payee"], b["status"]) for b in bills} >= {("Rent Payment", "pending"), ("Rent Payment", "completed")}
+
+    def test_routes_through_client(self):
+        standin = make_standin()
+        client = make_client(standin)
+
+        async def fetch():
+            try:
+                customers = await client.get_customers()
+                accounts = await client.get_customer_accounts(customers[0]["_id"])
+                purchases = await client.get_account_purchases(accounts[0]["_id"])
+                owner = await client.get_account_customer(accounts[0]["_id"])
+                with pytest.raises(httpx.HTTPStatusError) as missing:
+                    await client.get_account("000000000000000000000000")
+                return customers, purchases, owner, missing.value.response.status_code
+            finally:
+                await client.aclose()
+
+        customers, purchases, owner, missing = asyncio.run(fetch())
+        assert owner == customers[0]
+        assert purchases == standin.history(standin.customer_accounts(customers[0]["_id"])[0]["_id"])["purchases"]
+        assert missing == 404
+
+    def test_error_rate_faults_requests(self):
+        standin = make_standin(error_rate=1.0)
+        client = make_client(standin, retries=2, retry_base_seconds=0.001)
+
+        async def fetch():
+            try:
+                await client.get_customers()
+            finally:
+                await client.aclose()
+
+        with pytest.raises(httpx.HTTPStatusError) as error:
+            asyncio.run(fetch())
+        assert error.value.response.status_code in (429, 500, 503)
+        assert standin.stats["requests"] == standin.stats["errors"] == 3
+
+    def test_latency_profile(self):
+        standin = make_standin(latency_ms=60)
+        client = make_client(standin)
+
+        async def fetch():
+            try:
+                start = time.perf_counter()
+                await client.get_customers()
+                return time.perf_counter() - start
+            finally:
+                await client.aclose()
+
+        assert asyncio.run(fetch()) >= 0.03
+
+    def test_unknown_profile(self):
+        with pytest.raises(ValueError):
+            NessieStandIn(profile="nope")
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
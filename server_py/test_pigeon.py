@@ -2,7 +2,10 @@
 Test suite for Pigeon geo-behavioral risk detection endpoints
 """
 
+import json
+import time
 import pytest
+from datetime import datetime, timedelta
 from fastapi.testclient import TestClient
 import sys
 from pathlib import Path
@@ -52,6 +55,47 @@ class TestPigeonSettings:
         assert data["settings"]["notification_threshold"] == 0.80
 
 
+class TestPigeonMultiUser:
+    def test_settings_are_per_user(self):
+        """Settings written with one X-User-Id are invisible to another"""
+        client.post(
+            "/api/pigeon/settings",
+            json={"quiet_hours_start": 21},
+            headers={"X-User-Id": "test_user_a"}
+        )
+        client.post(
+            "/api/pigeon/settings",
+            json={"quiet_hours_start": 1},
+            headers={"X-User-Id": "test_user_b"}
+        )
+        a = client.get("/api/pigeon/settings", headers={"X-User-Id": "test_user_a"}).json()
+        b = client.get("/api/pigeon/settings", headers={"X-User-Id": "test_user_b"}).json()
+        assert a["quiet_hours_start"] == 21
+        assert b["quiet_hours_start"] == 1
+    
+    def test_feedback_cannot_touch_other_users_interventions(self):
+        response = client.post(
+            "/api/pigeon/log-intervention",
+            json={
+                "danger_zone_id": "test_owned_zone",
+                "latitude": 40.444,
+                "longitude": -79.943,
+                "predicted_probability": 0.75,
+                "predicted_score": 75,
+                "risk_level": "high"
+            },
+            headers={"X-User-Id": "test_user_a"}
+        )
+        intervention_id = response.json()["intervention_id"]
+        
+        feedback = client.post(
+            "/api/pigeon/intervention-feedback",
+            json={"intervention_id": intervention_id, "user_response": "helpful"},
+            headers={"X-User-Id": "test_user_b"}
+        )
+        assert feedback.status_code == 404
+
+
 class TestPigeonLocationCheck:
     def test_check_location_without_monitoring(self):
         """Test that check-location returns disabled when monitoring is off"""
@@ -143,6 +187,213 @@ class TestPigeonInterventions:
         assert feedback_response.json()["success"] is True
 
 
+class TestPigeonBulkInterventions:
+    def test_log_interventions_array(self):
+        """Test POST /api/pigeon/log-interventions with a JSON array"""
+        rows = [
+            {
+                "danger_zone_id": "test_bulk_zone",
+                "latitude": 40.444,
+                "longitude": -79.943,
+                "predicted_probability": 0.7,
+                "predicted_score": 70,
+                "risk_level": "medium"
+            },
+            {"danger_zone_id": "test_bulk_zone", "latitude": 40.444},
+            {
+                "danger_zone_id": "test_bulk_zone",
+                "latitude": 40.444,
+                "longitude": -79.943,
+                "predicted_probability": 0.9,
+                "predicted_score": 90,
+                "risk_level": "high",
+                "notification_sent": False
+            },
+        ]
+        response = client.post("/api/pigeon/log-interventions", json=rows)
+        assert response.status_code == 200
+        data = response.json()
+        assert data["inserted"] == 2
+        assert data["failed"] == 1
+        assert [r["success"] for r in data["results"]] == [True, False, True]
+        assert data["results"][1]["error"] == "longitude is required"
+        assert data["results"][2]["intervention_id"] > data["results"][0]["intervention_id"]
+    
+    def test_log_interventions_ndjson(self):
+        """Test POST /api/pigeon/log-interventions with an NDJSON stream"""
+        row = {
+            "danger_zone_id": "test_bulk_zone",
+            "latitude": 40.444,
+            "longitude": -79.943,
+            "predicted_probability": 0.6,
+            "predicted_score": 60,
+            "risk_level": "medium"
+        }
+        body = "\n".join([json.dumps(row), "{not json", json.dumps({**row, "predicted_score": "high"})])
+        response = client.post(
+            "/api/pigeon/log-interventions",
+            content=body,
+            headers={"Content-Type": "application/x-ndjson"}
+        )
+        assert response.status_code == 200
+        results = response.json()["results"]
+        assert results[0]["success"] is True
+        assert results[1]["error"] == "invalid JSON"
+        assert results[2]["error"] == "predicted_score has invalid type"
+    
+    def test_log_interventions_rejects_invalid_utf8(self):
+        """Bytes that are not UTF-8 are reported like any other bad JSON"""
+        row = json.dumps({
+            "danger_zone_id": "test_bulk_zone",
+            "latitude": 40.444,
+            "longitude": -79.943,
+            "predicted_probability": 0.6,
+            "predicted_score": 60,
+            "risk_level": "medium"
+        }).encode()
+        response = client.post(
+            "/api/pigeon/log-interventions",
+            content=row + b"\n\xff\xfe{\n",
+            headers={"Content-Type": "application/x-ndjson"}
+        )
+        assert response.status_code == 200
+        results = response.json()["results"]
+        assert results[0]["success"] is True
+        assert results[1]["error"] == "invalid JSON"
+        
+        response = client.post(
+            "/api/pigeon/log-interventions",
+            content=b"[\xff]",
+            headers={"Content-Type": "application/json"}
+        )
+        assert response.status_code == 400
+    
+    def test_replayed_batch_is_not_inserted_twice(self):
+        """Resending a batch with the same event ids returns the original ids"""
+        event = f"test-replay-{time.time_ns()}"
+        rows = [
+            {
+                "danger_zone_id": "test_replay_zone",
+                "latitude": 40.444,
+                "longitude": -79.943,
+                "predicted_probability": 0.7,
+                "predicted_score": 70,
+                "risk_level": "medium",
+                "event_id": f"{event}-{i}"
+            }
+            for i in range(2)
+        ]
+        
+        def zone_rows():
+            conn = database.get_db_connection()
+            try:
+                return conn.execute(
+                    "SELECT COUNT(*) AS n FROM pigeon_interventions WHERE event_id LIKE ?", (f"{event}-%",)
+                ).fetchone()["n"]
+            finally:
+                conn.close()
+        
+        first = client.post("/api/pigeon/log-interventions", json=rows).json()
+        # The resend repeats the whole batch, one row of it twice
+        replay = client.post("/api/pigeon/log-interventions", json=[*rows, rows[0]]).json()
+        
+        first_ids = [r["intervention_id"] for r in first["results"]]
+        assert [r["intervention_id"] for r in replay["results"]] == [*first_ids, first_ids[0]]
+        assert zone_rows() == 2
+        
+    def test_log_intervention_rejects_unknown_fields(self):
+        response = client.post("/api/pigeon/log-intervention", json={"danger_zone_id": "x", "bogus": 1})
+        assert response.status_code == 400
+
+
+class TestPigeonInterventionRollups:
+    def test_compaction_moves_old_rows_into_rollups(self):
+        """Old raw interventions are rolled up, deleted, and still counted in stats"""
+        zone = "test_rollup_zone"
+        intervention_id = database.save_pigeon_intervention(
+            danger_zone_id=zone,
+            latitude=40.444,
+            longitude=-79.943,
+            predicted_probability=0.9,
+            predicted_score=90,
+            risk_level="high",
+            merchant_category="Food",
+            budget_utilization=0.8
+        )
+        database.update_pigeon_intervention_response(intervention_id, "helpful")
+        
+        # Age the row past the retention window
+        conn = database.get_db_connection()
+        aged = (datetime.utcnow() - timedelta(days=45)).strftime("%Y-%m-%d %H:%M:%S")
+        conn.execute(
+            "UPDATE pigeon_interventions SET intervention_at = ? WHERE id = ?",
+            (aged, intervention_id)
+        )
+        conn.commit()
+        conn.close()
+        
+        before = {
+            (s["danger_zone_id"], s["user_response"]): s["intervention_count"]
+            for s in database.get_pigeon_intervention_stats()
+        }.get((zone, "helpful"), 0)
+        
+        compacted = database.compact_pigeon_interventions(retention_days=30, granularity="day")
+        assert compacted >= 1
+        
+        conn = database.get_db_connection()
+        raw = conn.execute("SELECT id FROM pigeon_interventions WHERE id = ?", (intervention_id,)).fetchone()
+        conn.close()
+        assert raw is None
+        
+        response = client.get("/api/pigeon/intervention-stats")
+        assert response.status_code == 200
+        after = {
+            (s["danger_zone_id"], s["user_response"]): s
+            for s in response.json()["stats"]
+        }[(zone, "helpful")]
+        assert after["intervention_count"] == before
+        assert after["avg_predicted_score"] == 90
+    
+    def test_compaction_waits_for_feedback(self):
+        """Notifications without feedback outlive retention by the grace window; feedback after compaction is a 404"""
+        intervention_id = database.save_pigeon_intervention(
+            danger_zone_id="test_feedback_zone",
+            latitude=40.444,
+            longitude=-79.943,
+            predicted_probability=0.7,
+            predicted_score=70,
+            risk_level="high"
+        )
+
+        def age(days):
+            conn = database.get_db_connection()
+            aged = (datetime.utcnow() - timedelta(days=days)).strftime("%Y-%m-%d %H:%M:%S")
+            conn.execute("UPDATE pigeon_interventions SET intervention_at = ? WHERE id = ?", (aged, intervention_id))
+            conn.commit()
+            conn.close()
+
+        age(33)
+        database.compact_pigeon_interventions(retention_days=30, feedback_grace_days=7)
+        response = client.post(
+            "/api/pigeon/intervention-feedback",
+            json={"intervention_id": intervention_id, "user_response": "ignored"}
+        )
+        assert response.status_code == 200
+
+        database.update_pigeon_intervention_response(intervention_id, None)
+        age(40)
+        database.compact_pigeon_interventions(retention_days=30, feedback_grace_days=7)
+        response = client.post(
+            "/api/pigeon/intervention-feedback",
+            json={"intervention_id": intervention_id, "user_response": "helpful"}
+        )
+        assert response.status_code == 404
+
+    def test_compaction_rejects_unknown_granularity(self):
+        with pytest.raises(ValueError):
+            database.compact_pigeon_interventions(granularity="week")
+
+
 class TestPredictorService:
     def test_predictor_integration(self):
         """Test that predictor service is loaded and working"""
@@ -0,0 +1,490 @@
+"""
+Test suite for the Plaid integration
+"""
+
+import asyncio
+import hashlib
+import json
+import time
+from types import SimpleNamespace
+import pytest
+import sys
+from pathlib import Path
+
+# Add server_py to path
+sys.path.insert(0, str(Path(__file__).parent))
+
+import plaid
+
+import database
+import plaid_sync
+from plaid_async import AsyncPlaidClient
+from plaid_webhooks import WebhookVerifier
+
+WEBHOOK_SECRET = "test-webhook-secret"
+
+
+class SlowPlaidApi:
+    """Stands in for plaid_api.PlaidApi: every call blocks its thread"""
+
+    def __init__(self, delay):
+        self.delay = delay
+
+    def accounts_get(self, request):
+        time.sleep(self.delay)
+        return {"request": request}
+
+
+class TestAsyncPlaidClient:
+    def test_calls_do_not_block_event_loop(self):
+        """Blocking Plaid calls run on worker threads while the loop keeps ticking"""
+        client = AsyncPlaidClient(SlowPlaidApi(0.2), max_workers=4)
+
+        async def scenario():
+            ticks = 0
+
+            async def heartbeat():
+                nonlocal ticks
+                while True:
+                    ticks += 1
+                    await asyncio.sleep(0.01)
+
+            beat = asyncio.create_task(heartbeat())
+            start = time.perf_counter()
+            results = await asyncio.gather(*(client.accounts_get(i) for i in range(4)))
+            elapsed = time.perf_counter() - start
+            beat.cancel()
+            return results, elapsed, ticks
+
+        results, elapsed, ticks = asyncio.run(scenario())
+        client.shutdown()
+
+        assert [r["request"] for r in results] == [0, 1, 2, 3]
+        # Four 200 ms calls overlap instead of queueing behind each other
+        assert elapsed < 0.6
+        assert ticks >= 10
+
+    def test_concurrency_is_bounded(self):
+        client = AsyncPlaidClient(SlowPlaidApi(0.1), max_workers=2)
+
+        async def scenario():
+            start = time.perf_counter()
+            await asyncio.gather(*(client.accounts_get(i) for i in range(4)))
+            return time.perf_counter() - start
+
+        elapsed = asyncio.run(scenario())
+        client.shutdown()
+        # Two workers -> two rounds of 100 ms
+        assert elapsed >= 0.2
+
+    def test_gather_items_limits_each_institution(self):
+        client = AsyncPlaidClient(SlowPlaidApi(0.1), max_workers=8, per_institution=1)
+        items = [{"item_id": f"item_{i}", "institution_id": f"ins_{i % 2}"} for i in range(4)]
+
+        async def fetch(item):
+            if item["item_id"] == "item_3":
+                raise RuntimeError("bank down")
+            return await client.accounts_get(item["item_id"])
+
+        async def scenario():
+            start = time.perf_counter()
+            results = await client.gather_items(items, fetch)
+            return results, time.perf_counter() - start
+
+        results, elapsed = asyncio.run(scenario())
+        client.shutdown()
+        assert [r["request"] for r in results[:3]] == ["item_0", "item_1", "item_2"]
+        assert isinstance(results[3], RuntimeError)
+        # Two banks in parallel, two Items each one after the other: about the
+        # slowest bank's time rather than the sum
+        assert 0.2 <= elapsed < 0.35
+
+
+def plaid_txn(transaction_id, day):
+    return SimpleNamespace(
+        transaction_id=transaction_id, account_id="test_acc", name="Coffee", amount=4.5,
+        date=f"2026-02-{day:02d}", category=["Food and Drink"], pending=False,
+        merchant_name="Coffee", payment_channel="in store", iso_currency_code="USD",
+    )
+
+
+class FakeSyncApi:
+    """Serves /transactions/sync pages keyed by the request cursor"""
+
+    def __init__(self, pages, fail_once_on=None, delay=0):
+        self.pages = pages
+        self.fail_once_on = fail_once_on
+        self.delay = delay
+        self.cursors = []
+
+    def transactions_sync(self, request):
+        time.sleep(self.delay)
+        cursor = request.get("cursor")
+        self.cursors.append(cursor)
+        if cursor is not None and cursor == self.fail_once_on:
+            self.fail_once_on = None
+            error = plaid.ApiException(status=400)
+            error.body = json.dumps({"error_code": "TRANSACTIONS_SYNC_MUTATION_DURING_PAGINATION"})
+            raise error
+        added, removed, next_cursor, has_more = self.pages[cursor]
+        return SimpleNamespace(
+            added=added, modified=[], removed=[SimpleNamespace(transaction_id=r) for r in removed],
+            next_cursor=next_cursor, has_more=has_more,
+        )
+
+
+class TestTransactionSync:
+    def setup_method(self):
+        self.user_id = "test_sync_plaid_user"
+        database.delete_plaid_items(user_id=self.user_id)
+        database.save_plaid_item("test_sync_plaid_item", "access-sandbox", user_id=self.user_id)
+
+    def teardown_method(self):
+        database.delete_plaid_items(user_id=self.user_id)
+
+    def test_pages_until_has_more_is_false(self):
+        api = FakeSyncApi({
+            None: ([plaid_txn("s1", 1)], [], "c1", True),
+            "c1": ([plaid_txn("s2", 2)], [], "c2", False),
+            "c2": ([], ["s1"], "c3", False),
+        })
+        client = AsyncPlaidClient(api, max_workers=1)
+
+        counts = asyncio.run(plaid_sync.sync_user(client, self.user_id))
+        assert counts == {"added": 2, "modified": 0, "removed": 0, "errors": []}
+        assert database.get_plaid_items(user_id=self.user_id)[0]["sync_cursor"] == "c2"
+
+        # The next sync starts from the stored cursor and only sees the delta
+        counts = asyncio.run(plaid_sync.sync_user(client, self.user_id))
+        client.shutdown()
+        assert counts == {"added": 0, "modified": 0, "removed": 1, "errors": []}
+        assert api.cursors == [None, "c1", "c2"]
+        transactions = database.get_transactions(user_id=self.user_id)
+        assert [t["transaction_id"] for t in transactions] == ["s2"]
+
+    def test_restarts_from_original_cursor_on_mutation(self):
+        api = FakeSyncApi({
+            None: ([plaid_txn("m1", 1)], [], "c1", True),
+            "c1": ([plaid_txn("m2", 2)], [], "c2", False),
+        }, fail_once_on="c1")
+        client = AsyncPlaidClient(api, max_workers=1)
+
+        counts = asyncio.run(plaid_sync.sync_user(client, self.user_id))
+        client.shutdown()
+        assert api.cursors == [None, "c1", None, "c1"]
+        # The aborted first pass is discarded rather than stored twice
+        assert counts == {"added": 2, "modified": 0, "removed": 0, "errors": []}
+
+
+class TestSyncScheduler:
+    def setup_method(self):
+        self.user_id = "test_sched_user"
+        database.delete_plaid_items(user_id=self.user_id)
+        database.save_plaid_item("test_sched_item", "access-sandbox", user_id=self.user_id)
+
+    def teardown_method(self):
+        database.delete_plaid_items(user_id=self.user_id)
+
+    def run_scheduler(self, api, schedule_calls):
+        client = AsyncPlaidClient(api, max_workers=1)
+        synced = []
+
+        async def on_synced(user_id, counts):
+            synced.append(counts["added"])
+
+        async def scenario():
+            scheduler = plaid_sync.SyncScheduler(client, on_synced=on_synced)
+            await schedule_calls(scheduler)
+            await scheduler.drain()
+
+        asyncio.run(scenario())
+        client.shutdown()
+        return synced
+
+    def test_webhooks_before_a_sync_starts_share_it(self):
+        api = FakeSyncApi({None: ([plaid_txn("w1", 1)], [], "c1", False)})
+
+        async def burst(scheduler):
+            for _ in range(5):
+                scheduler.schedule("test_sched_item", self.user_id)
+
+        assert self.run_scheduler(api, burst) == [1]
+        assert api.cursors == [None]
+
+    def test_webhooks_during_a_sync_trigger_one_catch_up(self):
+        api = FakeSyncApi({None: ([plaid_txn("w1", 1)], [], "c1", False), "c1": ([], [], "c1", False)}, delay=0.1)
+
+        async def during(scheduler):
+            scheduler.schedule("test_sched_item", self.user_id)
+            await asyncio.sleep(0.03)
+            for _ in range(4):
+                scheduler.schedule("test_sched_item", self.user_id)
+
+        assert self.run_scheduler(api, during) == [1, 0]
+        assert api.cursors == [None, "c1"]
+
+
+class TestPlaidWebhook:
+    def setup_method(self):
+        from fastapi.testclient import TestClient
+        import main
+
+        self.main = main
+        self.client = TestClient(main.app)
+        self.scheduled = []
+        self._schedule = main.sync_scheduler.schedule
+        main.sync_scheduler.schedule = lambda item_id, user_id: self.scheduled.append((item_id, user_id))
+        self._secret, main.plaid_webhook_verifier.secret = main.plaid_webhook_verifier.secret, WEBHOOK_SECRET
+        database.delete_plaid_items(user_id="test_hook_user")
+        database.save_plaid_item("test_hook_item", "access-sandbox", user_id="test_hook_user")
+
+    def teardown_method(self):
+        self.main.sync_scheduler.schedule = self._schedule
+        self.main.plaid_webhook_verifier.secret = self._secret
+        database.delete_plaid_items(user_id="test_hook_user")
+
+    def post(self, payload, secret=WEBHOOK_SECRET, **kwargs):
+        params = {"secret": secret} if secret else {}
+        return self.client.post("/api/plaid/webhook", json=payload, params=params, **kwargs)
+
+    def test_sync_updates_queue_the_owning_user(self):
+        response = self.post({
+            "webhook_type": "TRANSACTIONS", "webhook_code": "SYNC_UPDATES_AVAILABLE", "item_id": "test_hook_item",
+        })
+        assert response.status_code == 200
+        assert response.json() == {"received": True, "queued": True}
+        assert self.scheduled == [("test_hook_item", "test_hook_user")]
+
+    def test_other_webhooks_are_acknowledged(self):
+        assert self.post({"webhook_type": "ITEM", "webhook_code": "ERROR", "item_id": "test_hook_item"}).json()["queued"] is False
+        assert self.post({
+            "webhook_type": "TRANSACTIONS", "webhook_code": "SYNC_UPDATES_AVAILABLE", "item_id": "test_unknown_item",
+        }).json()["queued"] is False
+        assert self.scheduled == []
+
+    def test_rejects_malformed_body(self):
+        params = {"secret": WEBHOOK_SECRET}
+        assert self.client.post("/api/plaid/webhook", content="not json", params=params).status_code == 400
+        assert self.client.post("/api/plaid/webhook", content=b"\xff\xfe", params=params).status_code == 400
+
+    def test_unverified_webhooks_are_rejected(self):
+        payload = {"webhook_type": "TRANSACTIONS", "webhook_code": "SYNC_UPDATES_AVAILABLE", "item_id": "test_hook_item"}
+        assert self.post(payload, secret=None).status_code == 401
+        assert self.post(payload, secret="guess").status_code == 401
+        assert self.post(payload, secret=None, headers={"Plaid-Verification": "not-a-jwt"}).status_code == 401
+        assert self.scheduled == []
+
+
+class TestWebhookVerifier:
+    def sign(self, key, body, iat, kid="k1"):
+        import jwt
+
+        claims = {"iat": iat, "request_body_sha256": hashlib.sha256(body).hexdigest()}
+        return jwt.encode(claims, key, algorithm="ES256", headers={"kid": kid})
+
+    def test_plaid_signature(self):
+        jwt = pytest.importorskip("jwt")
+        ec = pytest.importorskip("cryptography.hazmat.primitives.asymmetric.ec")
+
+        key = ec.generate_private_key(ec.SECP256R1())
+        public = json.loads(jwt.algorithms.ECAlgorithm.to_jwk(key.public_key()))
+        fetched = []
+
+        async def fetch_key(kid):
+            fetched.append(kid)
+            return {**public, "kid": kid, "alg": "ES256", "expired_at": None}
+
+        now = time.time()
+        verifier = WebhookVerifier(fetch_key, secret="", clock=lambda: now)
+        body = b'{"webhook_type": "TRANSACTIONS"}'
+
+        async def scenario():
+            return [
+                await verifier.verify(body, self.sign(key, body, int(now))),
+                await verifier.verify(body, self.sign(key, body, int(now) - 10)),
+                # Too old, a different body, and a key Plaid never issued
+                await verifier.verify(body, self.sign(key, body, int(now) - 600)),
+                await verifier.verify(b"{}", self.sign(key, body, int(now))),
+                await verifier.verify(body, self.sign(ec.generate_private_key(ec.SECP256R1()), body, int(now))),
+            ]
+
+        assert asyncio.run(scenario()) == [True, True, False, False, False]
+        assert fetched == ["k1"]
+
+    def test_shared_secret(self):
+        async def fetch_key(kid):
+            raise AssertionError("no key lookup without a signature")
+
+        verifier = WebhookVerifier(fetch_key, secret=WEBHOOK_SECRET)
+        assert asyncio.run(verifier.verify(b"{}", None, WEBHOOK_SECRET))
+        assert not asyncio.run(verifier.verify(b"{}", None, "wrong"))
+        assert not asyncio.run(WebhookVerifier(fetch_key, secret="").verify(b"{}", None, ""))
+
+
+class FakeBankApi:
+    """Accounts, balances and token exchange for any number of Items"""
+
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.calls = 0
+
+    def _accounts(self, request):
+        self.calls += 1
+        token = request.access_token
+        if token in self.failing:
+            error = plaid.ApiException(status=400)
+            error.body = json.dumps({"error_code": "ITEM_LOGIN_REQUIRED"})
+            raise error
+        balances = SimpleNamespace(available=100.0 * self.calls, current=120.0, limit=None, iso_currency_code="USD")
+        return SimpleNamespace(accounts=[
+            SimpleNamespace(
+                account_id=f"{token}-{kind}", name=kind.title(), official_name=None, type=kind,
+                subtype=None, mask="0000", balances=balances,
+            )
+            for kind in ("depository", "credit")
+        ])
+
+    accounts_get = _accounts
+    accounts_balance_get = _accounts
+
+    def item_public_token_exchange(self, request):
+        return SimpleNamespace(item_id=f"item-{request.public_token}", access_token=f"access-{request.public_token}")
+
+    def item_get(self, request):
+        return SimpleNamespace(item=SimpleNamespace(institution_id="ins_from_plaid"))
+
+
+class TestAccountEndpoints:
+    def setup_method(self):
+        from fastapi.testclient import TestClient
+        import main
+
+        self.main = main
+        self.client = TestClient(main.app)
+        self.api = FakeBankApi(failing={"access-broken"})
+        self._plaid_client = main.plaid_client
+        main.plaid_client = AsyncPlaidClient(self.api, max_workers=4)
+        main.plaid_cache.clear()
+        self._schedule = main.sync_scheduler.schedule
+        main.sync_scheduler.schedule = lambda item_id, user_id: None
+        self._secret, main.plaid_webhook_verifier.secret = main.plaid_webhook_verifier.secret, WEBHOOK_SECRET
+        self.user_id = "test_cache_user"
+        database.delete_plaid_items(user_id=self.user_id)
+        database.save_plaid_item("test_cache_item", "access-a", "ins_b", user_id=self.user_id)
+
+    def teardown_method(self):
+        self.main.plaid_client.shutdown()
+        self.main.plaid_client = self._plaid_client
+        self.main.sync_scheduler.schedule = self._schedule
+        self.main.plaid_webhook_verifier.secret = self._secret
+        database.delete_plaid_items(user_id=self.user_id)
+
+    def get(self, path):
+        return self.client.get(path, headers={"X-User-Id": self.user_id})
+
+    def get_balance(self):
+        response = self.get("/api/plaid/balance")
+        assert response.status_code == 200
+        return response.json()["accounts"][0]["balances"]["available"]
+
+    def test_repeat_reads_are_served_from_cache_until_invalidated(self):
+        assert self.get_balance() == 100.0
+        assert self.get_balance() == 100.0
+        assert self.api.calls == 1
+
+        self.client.post("/api/plaid/webhook", params={"secret": WEBHOOK_SECRET}, json={
+            "webhook_type": "TRANSACTIONS", "webhook_code": "SYNC_UPDATES_AVAILABLE", "item_id": "test_cache_item",
+        })
+        assert self.get_balance() == 200.0
+        assert self.api.calls == 2
+
+    def test_merges_items_and_reports_failures(self):
+        database.save_plaid_item("test_cache_item_2", "access-b", "ins_a", user_id=self.user_id)
+        database.save_plaid_item("test_cache_item_3", "access-broken", "ins_c", user_id=self.user_id)
+
+        data = self.get("/api/plaid/accounts").json()
+        assert [a["account_id"] for a in data["accounts"]] == [
+            "access-b-credit", "access-b-depository", "access-a-credit", "access-a-depository",
+        ]
+        assert data["accounts"][0]["item_id"] == "test_cache_item_2"
+        assert data["errors"] == [
+            {"item_id": "test_cache_item_3", "institution_id": "ins_c", "error": "ITEM_LOGIN_REQUIRED"},
+        ]
+
+    def test_fails_only_when_every_item_fails(self):
+        database.delete_plaid_items(user_id=self.user_id)
+        database.save_plaid_item("test_cache_item_3", "access-broken", "ins_c", user_id=self.user_id)
+        response = self.get("/api/plaid/balance")
+        assert response.status_code == 500
+        assert response.json()["errors"][0]["error"] == "ITEM_LOGIN_REQUIRED"
+
+    def test_linking_adds_items_and_replaces_same_bank(self):
+        def link(public_token, **extra):
+            return self.client.post(
+                "/api/plaid/exchange-token", json={"public_token": public_token, **extra},
+                headers={"X-User-Id": self.user_id},
+            )
+
+        assert link("one").status_code == 200
+        assert link("two", institution_id="ins_b").status_code == 200
+        items = {i["item_id"]: i["institution_id"] for i in database.get_plaid_items(user_id=self.user_id)}
+        # "two" is at the same bank as the original Item, so it replaced it
+        assert items == {"item-one": "ins_from_plaid", "item-two": "ins_b"}
+
+        self.client.post("/api/plaid/disconnect", json={"item_id": "item-one"}, headers={"X-User-Id": self.user_id})
+        status = self.get("/api/plaid/status").json()
+        assert status == {"connected": True, "items": [{"item_id": "item-two", "institution_id": "ins_b"}]}
+
+
+class TestTransactionsEndpoint:
+    def setup_method(self):
+        from fastapi.testclient import TestClient
+        import main
+
+        self.main = main
+        self.client = TestClient(main.app)
+        self.user_id = "test_list_user"
+        database.delete_plaid_items(user_id=self.user_id)
+        database.save_plaid_item("test_list_item", "access-sandbox", user_id=self.user_id)
+        # Every sync finds the first page of the Item's history
+        self.api = FakeSyncApi({
+            None: ([plaid_txn(f"l{day}", day) for day in range(1, 8)], [], "c1", False),
+            "c1": ([], [], "c1", False),
+        })
+        self._plaid_client = main.plaid_client
+        main.plaid_client = AsyncPlaidClient(self.api, max_workers=1)
+
+    def teardown_method(self):
+        self.main.plaid_client.shutdown()
+        self.main.plaid_client = self._plaid_client
+        database.delete_plaid_items(user_id=self.user_id)
+
+    def get(self, **params):
+        return self.client.get("/api/plaid/transactions", params=params, headers={"X-User-Id": self.user_id})
+
+    def test_cursor_pages_with_projection(self):
+        seen = []
+        params = {"limit": 3, "fields": "transaction_id,amount"}
+        while True:
+            data = self.get(**params).json()
+            assert all(set(t) == {"transaction_id", "amount"} for t in data["transactions"])
+            seen += [t["transaction_id"] for t in data["transactions"]]
+            if data["next_cursor"] is None:
+                break
+            params["cursor"] = data["next_cursor"]
+        assert seen == [f"l{day}" for day in range(7, 0, -1)]
+        # Only the first page syncs
+        assert self.api.cursors == [None]
+
+    def test_filters_reach_the_store(self):
+        data = self.get(start_date="2026-02-03", end_date="2026-02-05", fields="transaction_id").json()
+        assert data["transactions"] == [{"transaction_id": f"l{day}"} for day in (5, 4, 3)]
+
+    def test_rejects_bad_parameters(self):
+        assert self.get(fields="transaction_id,secret").status_code == 400
+        assert self.get(cursor="not-a-cursor").status_code == 400
+        assert self.get(start_date="yesterday").status_code == 422
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,232 @@
+"""
+Test suite for recurring payment detection
+"""
+
+import asyncio
+import pytest
+import random
+import sys
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+# Add server_py to path
+sys.path.insert(0, str(Path(__file__).parent))
+
+import database
+from demo_fixtures import DemoFixtures
+from recurring import detect_recurring, monthly_total, seed_series, tracked_subscriptions
+
+TODAY = date(2026, 3, 31)
+
+
+def charges(merchant, amounts, start, step_days, key="date", name_key="name"):
+    return [
+        {name_key: merchant, "amount": amount, key: (start + timedelta(days=i * step_days)).isoformat()}
+        for i, amount in enumerate(amounts)
+    ]
+
+
+def by_merchant(subscriptions):
+    return {s["merchant"]: s for s in subscriptions}
+
+
+@pytest.fixture
+def store(tmp_path):
+    database.configure(f"sqlite:///{tmp_path / 'recurring.db'}")
+    try:
+        yield database.for_user("test_recurring_user")
+    finally:
+        database.configure(database.FINANCE_DATABASE_URL)
+
+
+class TestDetectRecurring:
+    def test_periods(self):
+        transactions = (
+            charges("Netflix", [15.49] * 12, date(2025, 4, 15), 30)
+            + charges("Meal Kit", [60.0] * 20, date(2025, 11, 10), 7)
+            + charges("Domain Renewal", [12.0] * 3, date(2023, 4, 2), 365)
+        )
+        found = by_merchant(detect_recurring(transactions, TODAY))
+        assert {m: s["period"] for m, s in found.items()} == {
+            "Netflix": "monthly", "Meal Kit": "weekly", "Domain Renewal": "annual",
+        }
+        assert found["Netflix"]["confidence"] == "high"
+        assert found["Netflix"]["frequency_count"] == 12
+        assert found["Meal Kit"]["monthly_cost"] == pytest.approx(60.0 * 30.44 / 7, abs=0.01)
+        assert found["Domain Renewal"]["monthly_cost"] == 1.0
+
+    def test_one_offs_and_irregular_spending_are_ignored(self):
+        rng = random.Random(3)
+        day = date(2025, 1, 1)
+        transactions = []
+        for _ in range(150):
+            day += timedelta(days=rng.choice([1, 2, 3, 5, 9, 13]))
+            transactions.append({"name": "Amazon", "amount": round(rng.uniform(8, 180), 2), "date": day.isoformat()})
+        transactions += charges("Apple Store", [1299.0], date(2025, 9, 1), 0)
+        transactions += charges("Concert", [80.0, 80.0], date(2025, 2, 1), 45)
+        assert detect_recurring(transactions, TODAY) == []
+
+    def test_amount_drift_stays_one_series(self):
+        # A price rise and a varying utility bill
+        transactions = charges("Spotify", [9.99] * 6 + [11.99] * 6, date(2025, 4, 3), 30)
+        rng = random.Random(1)
+        transactions += charges("Electric Company", [round(rng.uniform(60, 140), 2) for _ in range(12)], date(2025, 4, 21), 30)
+        # A one-off purchase at a subscription's merchant is not part of it
+        transactions.append({"name": "Spotify", "amount": 120.0, "date": "2025-12-24"})
+
+        found = by_merchant(detect_recurring(transactions, TODAY))
+        assert found["Spotify"]["frequency_count"] == 12
+        assert found["Spotify"]["amount"] == 11.99
+        assert found["Electric Company"]["frequency_count"] == 12
+
+    def test_nessie_purchases(self):
+        purchases = charges("Gym", [24.99] * 5, date(2025, 11, 8), 30, key="purchase_date", name_key="description")
+        assert detect_recurring(purchases, TODAY)[0]["merchant"] == "Gym"
+
+    def test_cancelled_subscriptions_are_not_in_the_monthly_total(self):
+        transactions = (
+            charges("Netflix", [15.49] * 6, date(2025, 10, 15), 30)
+            + charges("Hulu", [7.99] * 6, date(2024, 1, 10), 30)
+        )
+        found = by_merchant(detect_recurring(transactions, TODAY))
+        assert found["Netflix"]["active"] and not found["Hulu"]["active"]
+        assert monthly_total(found.values()) == 15.49
+
+    def test_demo_history(self):
+        fixtures = DemoFixtures(seed=7, days=730, end_date=TODAY)
+        transactions = list(fixtures.iter_transactions("alice"))
+        start = time.perf_counter()
+        found = by_merchant(detect_recurring(transactions, TODAY))
+        assert time.perf_counter() - start < 1
+        assert set(found) <= {"Rent Payment", "Netflix", "Spotify", "Planet Fitness", "Electric Company"}
+        assert "Rent Payment" in found
+        assert all(s["period"] == "monthly" and s["confidence"] == "high" for s in found.values())
+
+    def test_too_little_data(self):
+        assert detect_recurring([], TODAY) == []
+        assert detect_recurring(charges("Netflix", [15.49], date(2026, 3, 15), 30), TODAY) == []
+
+
+class Purchases:
+    """A purchase history the test appends to, served like the endpoint's loaders"""
+
+    def __init__(self, transactions):
+        self.transactions = list(transactions)
+        self.calls = []
+
+    async def __call__(self, since):
+        self.calls.append(since)
+        return [t for t in self.transactions if since is None or t["date"] >= since]
+
+
+class TestTrackedSubscriptions:
+    def track(self, store, purchases, today, max_age=0):
+        return by_merchant(asyncio.run(tracked_subscriptions(store, "acc", purchases, today, max_age=max_age)))
+
+    def history(self):
+        return Purchases(
+            charges("Netflix", [15.49] * 6, date(2025, 10, 15), 30)
+            + charges("Gym", [24.99] * 6, date(2025, 10, 8), 30)
+        )
+
+    def test_first_call_seeds_from_full_history(self, store):
+        purchases = self.history()
+        found = self.track(store, purchases, date(2026, 3, 20))
+        assert purchases.calls == [None]
+        detected = by_merchant(detect_recurring(purchases.transactions, date(2026, 3, 20)))
+        assert set(found) == set(detected) == {"Netflix", "Gym"}
+        for merchant, s in found.items():
+            for field in ["amount", "frequency_count", "period", "last_date", "next_date", "monthly_cost", "confidence"]:
+                assert s[field] == detected[merchant][field]
+        assert found["Netflix"]["status"] == "active"
+
+    def test_recent_state_is_served_without_loading(self, store):
+        purchases = self.history()
+        self.track(store, purchases, date(2026, 3, 20))
+        self.track(store, purchases, date(2026, 3, 20), max_age=60)
+        assert purchases.calls == [None]
+
+    def test_new_charges_are_folded_in(self, store):
+        purchases = self.history()
+        self.track(store, purchases, date(2026, 3, 20))
+        purchases.transactions += charges("Netflix", [15.49], date(2026, 4, 11), 0)
+        # A brand new subscription, from charges that all arrive after seeding
+        purchases.transactions += charges("Hulu", [7.99] * 3, date(2026, 4, 1), 30)
+
+        found = self.track(store, purchases, date(2026, 6, 5))
+        assert purchases.calls[-1] == "2026-03-14"
+        assert found["Netflix"]["frequency_count"] == 7
+        assert found["Netflix"]["last_date"] == "2026-04-11"
+        assert found["Hulu"]["frequency_count"] == 3 and found["Hulu"]["period"] == "monthly"
+
+    def test_history_of_merchants_not_yet_recurring_is_kept(self, store):
+        purchases = self.history()
+        # One charge so far: not recurring when the state is seeded
+        purchases.transactions += charges("Spotify", [10.99], date(2026, 3, 1), 0)
+        assert "Spotify" not in self.track(store, purchases, date(2026, 3, 20))
+
+        purchases.transactions += charges("Spotify", [10.99], date(2026, 3, 31), 0)
+        found = self.track(store, purchases, date(2026, 4, 5))
+        assert found["Spotify"]["frequency_count"] == 2 and found["Spotify"]["period"] == "monthly"
+
+    def test_candidate_history_is_bounded(self):
+        transactions = (
+            charges("Netflix", [15.49] * 6, date(2025, 10, 15), 30)
+            + charges("Coffee", [4.0, 4.5, 5.0, 4.25], date(2026, 3, 1), 3)
+            + charges("Old Shop", [30.0], date(2024, 1, 1), 0)
+        )
+        today = date(2026, 3, 20)
+        series = seed_series(detect_recurring(transactions, today), transactions, today, candidate_charges=2)
+
+        by_name = {s["merchant"]: s for s in series.values()}
+        assert by_name["Netflix"]["charge_count"] == 6
+        # Only the last two coffees, and nothing from beyond the window
+        assert by_name["Coffee"]["charge_count"] == 2 and by_name["Coffee"]["last_date"] == "2026-03-10"
+        assert "Old Shop" not in by_name
+
+    def test_same_day_charges_are_not_counted_twice(self, store):
+        purchases = self.history()
+        self.track(store, purchases, date(2026, 3, 20))
+        self.track(store, purchases, date(2026, 3, 20))
+        assert self.track(store, purchases, date(2026, 3, 20))["Netflix"]["frequency_count"] == 6
+
+    def test_missed_and_changed_charges(self, store):
+        purchases = self.history()
+        self.track(store, purchases, date(2026, 3, 20))
+        purchases.transactions += charges("Gym", [29.99], date(2026, 4, 7), 0)
+
+        found = self.track(store, purchases, date(2026, 5, 1))
+        # Netflix was due around April 12 and never came
+        assert found["Netflix"]["status"] == "missed" and found["Netflix"]["missed"]
+        assert found["Gym"]["status"] == "changed"
+        assert (found["Gym"]["previous_amount"], found["Gym"]["amount"]) == (24.99, 29.99)
+        assert monthly_total(found.values()) == found["Gym"]["monthly_cost"]
+
+
+class TestRecurringPaymentsEndpoint:
+    def test_demo_account(self, store):
+        from fastapi.testclient import TestClient
+        import main
+
+        fixtures = main.demo_fixtures
+        main.demo_fixtures = DemoFixtures(seed=7, days=365, end_date=TODAY)
+        try:
+            response = TestClient(main.app).get(
+                "/api/finance/recurring-payments", params={"account_id": "demo_credit_1111"},
+                headers={"X-User-Id": "alice"},
+            )
+        finally:
+            main.demo_fixtures = fixtures
+
+        data = response.json()
+        merchants = {s["merchant"] for s in data["suspected_subscriptions"]}
+        # Subscriptions are charged to the card; rent comes out of checking
+        assert merchants and "Rent Payment" not in merchants
+        assert data["total_monthly_cost"] == pytest.approx(
+            sum(s["monthly_cost"] for s in data["suspected_subscriptions"]), abs=0.01,
+        )
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
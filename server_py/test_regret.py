@@ -52,8 +52,8 @@ async def test_regret_flow():
         print("\n--- Test Phase 3: DB Persistence for Transactions ---")
         conn = sqlite3.connect(DB_PATH)
         c = conn.cursor()
-        c.execute("INSERT OR REPLACE INTO transaction_metadata (transaction_id, regret_score, regret_reason) VALUES (?, ?, ?)", 
-                  ("test_txn_123", 85, "Test Reason"))
+        c.execute("INSERT OR REPLACE INTO transaction_metadata (user_id, transaction_id, regret_score, regret_reason) VALUES (?, ?, ?, ?)", 
+                  ("default", "test_txn_123", 85, "Test Reason"))
         conn.commit()
         
         c.execute("SELECT * FROM transaction_metadata WHERE transaction_id='test_txn_123'")
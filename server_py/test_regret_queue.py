@@ -0,0 +1,273 @@
+"""
+Test suite for the background regret-scoring queue
+"""
+
+import asyncio
+import json
+import pytest
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+# Add server_py to path
+sys.path.insert(0, str(Path(__file__).parent))
+
+import chat
+import database
+from regret_queue import RegretQueue
+
+USER_ID = "test_regret_user"
+
+
+@pytest.fixture(autouse=True)
+def scratch_db(tmp_path):
+    """Jobs are claimed across all users, so give each test its own database"""
+    database.configure(f"sqlite:///{tmp_path / 'regret.db'}")
+    store = database.for_user(USER_ID)
+    store.save_plaid_item("test_regret_item", "access-sandbox")
+    store.save_user_profile("Impulse buys", "Save more", ["Food"])
+    try:
+        yield store
+    finally:
+        database.configure(database.FINANCE_DATABASE_URL)
+
+
+def add_transactions(store, count):
+    store.apply_transaction_sync("test_regret_item", [
+        {
+            "transaction_id": f"rq{i}", "account_id": "acc", "name": "Shop", "amount": 20.0 + i,
+            "date": f"2026-03-{i + 1:02d}", "category": ["Shops"], "pending": False,
+        }
+        for i in range(count)
+    ], [], [], "cursor")
+
+
+class FakeAnalyzer:
+    def __init__(self, failures=0, delay=0, skip=()):
+        self.failures = failures
+        self.delay = delay
+        self.skip = set(skip)
+        self.calls = []
+        self.batches = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def __call__(self, transactions, user_profile):
+        self.batches.append([t["transaction_id"] for t in transactions])
+        self.calls.extend(t["transaction_id"] for t in transactions)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+            if self.failures:
+                self.failures -= 1
+                raise RuntimeError("model unavailable")
+            return {
+                t["transaction_id"]: {"score": 60, "reason": f"Scored {t['name']}"}
+                for t in transactions if t["transaction_id"] not in self.skip
+            }
+        finally:
+            self.in_flight -= 1
+
+
+class TestRegretJobs:
+    def test_enqueue_skips_scored_and_already_queued(self, scratch_db):
+        add_transactions(scratch_db, 3)
+        scratch_db.save_transaction_regret("rq0", 10, "Already scored")
+
+        assert scratch_db.enqueue_unscored_regret_jobs() == 2
+        assert scratch_db.enqueue_unscored_regret_jobs() == 0
+        assert scratch_db.get_regret_job_counts() == {"pending": 2, "running": 0, "failed": 0}
+
+    def test_expired_lease_is_reclaimed(self, scratch_db):
+        add_transactions(scratch_db, 1)
+        scratch_db.enqueue_unscored_regret_jobs()
+
+        first = database.claim_regret_jobs(1, lease_seconds=-1)
+        again = database.claim_regret_jobs(1, lease_seconds=60)
+        assert [j["transaction_id"] for j in first] == ["rq0"]
+        assert again == [{"user_id": USER_ID, "transaction_id": "rq0", "attempts": 2}]
+        assert database.claim_regret_jobs(1) == []
+
+
+class TestRegretQueue:
+    def test_drain_scores_every_unscored_transaction(self, scratch_db):
+        add_transactions(scratch_db, 3)
+        analyzer = FakeAnalyzer()
+        queue = RegretQueue(analyzer)
+
+        async def scenario():
+            await queue.enqueue_unscored(USER_ID)
+            await queue.enqueue_unscored(USER_ID)
+            await queue.drain()
+
+        asyncio.run(scenario())
+        assert sorted(analyzer.calls) == ["rq0", "rq1", "rq2"]
+        transactions = scratch_db.get_transactions()
+        assert all(t["regretScore"] == 60 for t in transactions)
+        assert scratch_db.get_regret_job_counts() == {"pending": 0, "running": 0, "failed": 0}
+
+    def test_failures_retry_then_park(self, scratch_db):
+        add_transactions(scratch_db, 2)
+        queue = RegretQueue(FakeAnalyzer(failures=1), max_attempts=2, retry_base_seconds=0)
+
+        async def scenario():
+            await queue.enqueue_unscored(USER_ID)
+            await queue.drain()
+
+        asyncio.run(scenario())
+        # The first failure was retried and succeeded
+        assert scratch_db.get_regret_job_counts()["failed"] == 0
+        assert all(t["regretScore"] == 60 for t in scratch_db.get_transactions())
+
+        add_transactions(scratch_db, 3)
+        queue = RegretQueue(FakeAnalyzer(failures=10), max_attempts=2, retry_base_seconds=0)
+        asyncio.run(scenario())
+        assert scratch_db.get_regret_job_counts() == {"pending": 0, "running": 0, "failed": 1}
+        assert scratch_db.get_transaction("rq2")["regretScore"] is None
+
+    def test_batches_and_retries_missing_scores(self, scratch_db):
+        add_transactions(scratch_db, 5)
+        analyzer = FakeAnalyzer(skip={"rq4"})
+        queue = RegretQueue(analyzer, batch_size=3, max_attempts=2, retry_base_seconds=0)
+
+        async def scenario():
+            await queue.enqueue_unscored(USER_ID)
+            await queue.drain()
+
+        asyncio.run(scenario())
+        assert [len(batch) for batch in analyzer.batches[:2]] == [3, 2]
+        # rq4 came back unscored from its batch, was retried alone, then parked
+        assert analyzer.batches[2:] == [["rq4"]]
+        assert scratch_db.get_regret_job_counts() == {"pending": 0, "running": 0, "failed": 1}
+
+    def park(self, scratch_db, count):
+        add_transactions(scratch_db, count)
+        queue = RegretQueue(FakeAnalyzer(failures=10), max_attempts=1, retry_base_seconds=0)
+
+        async def scenario():
+            await queue.enqueue_unscored(USER_ID)
+            await queue.drain()
+
+        asyncio.run(scenario())
+        assert scratch_db.get_regret_job_counts()["failed"] == count
+
+    def test_failed_jobs_requeue_when_the_transaction_syncs_again(self, scratch_db):
+        self.park(scratch_db, 2)
+        assert scratch_db.get_failed_regret_jobs()[0] == {
+            "transaction_id": "rq0", "attempts": 1, "last_error": "model unavailable",
+        }
+
+        # Plaid sends rq1 again (say, it posted); rq0 stays parked
+        scratch_db.apply_transaction_sync("test_regret_item", [], [{
+            "transaction_id": "rq1", "account_id": "acc", "name": "Shop", "amount": 21.0,
+            "date": "2026-03-02", "category": ["Shops"], "pending": False,
+        }], [], "cursor-2")
+        assert scratch_db.get_regret_job_counts() == {"pending": 1, "running": 0, "failed": 1}
+
+        analyzer = FakeAnalyzer()
+        asyncio.run(RegretQueue(analyzer).drain())
+        assert analyzer.calls == ["rq1"]
+        assert scratch_db.get_transaction("rq1")["regretScore"] == 60
+
+    def test_retry_failed(self, scratch_db):
+        self.park(scratch_db, 3)
+        queue = RegretQueue(FakeAnalyzer())
+
+        async def scenario():
+            assert await queue.retry_failed(USER_ID, ["rq2"]) == 1
+            assert await queue.retry_failed(USER_ID) == 2
+            assert await queue.retry_failed(USER_ID) == 0
+            await queue.drain()
+
+        asyncio.run(scenario())
+        assert scratch_db.get_regret_job_counts() == {"pending": 0, "running": 0, "failed": 0}
+        assert all(t["regretScore"] == 60 for t in scratch_db.get_transactions())
+
+    def test_endpoints(self, scratch_db):
+        from fastapi.testclient import TestClient
+        import main
+
+        self.park(scratch_db, 2)
+        client = TestClient(main.app)
+        headers = {"X-User-Id": USER_ID}
+        jobs = client.get("/api/plaid/regret-jobs", headers=headers).json()
+        assert jobs["counts"]["failed"] == 2
+        assert [j["transaction_id"] for j in jobs["failed"]] == ["rq0", "rq1"]
+
+        response = client.post("/api/plaid/regret-jobs/retry", json={"transaction_ids": ["rq1"]}, headers=headers)
+        assert response.json() == {"retried": 1}
+        assert client.post("/api/plaid/regret-jobs/retry", headers=headers).json() == {"retried": 1}
+        assert client.post("/api/plaid/regret-jobs/retry", json={"transaction_ids": "rq0"}, headers=headers).status_code == 400
+        assert client.get("/api/plaid/regret-jobs", headers=headers).json()["counts"]["pending"] == 2
+
+    def test_workers_bound_concurrency(self, scratch_db):
+        add_transactions(scratch_db, 6)
+        analyzer = FakeAnalyzer(delay=0.05)
+        queue = RegretQueue(analyzer, workers=2)
+
+        async def scenario():
+            queue.start()
+            await queue.enqueue_unscored(USER_ID)
+            for _ in range(100):
+                if scratch_db.get_regret_job_counts() == {"pending": 0, "running": 0, "failed": 0}:
+                    break
+                await asyncio.sleep(0.05)
+            await queue.close()
+
+        asyncio.run(scenario())
+        assert sorted(analyzer.calls) == [f"rq{i}" for i in range(6)]
+        assert analyzer.max_in_flight == 2
+
+
+class FakeDedalusClient:
+    """Answers regret prompts; batches larger than max_batch get a truncated reply"""
+
+    def __init__(self, max_batch):
+        self.max_batch = max_batch
+        self.batch_sizes = []
+
+    async def chat_completion(self, model, messages, stream=False):
+        prompt = messages[-1]["content"]
+        transactions = json.loads(prompt[prompt.index("["):prompt.index("]") + 1])
+        self.batch_sizes.append(len(transactions))
+        scores = [{"transaction_id": t["transaction_id"], "score": 150, "reason": "Big spend"} for t in transactions]
+        content = "```json\n" + json.dumps({"scores": scores}) + "\n```"
+        if len(transactions) > self.max_batch:
+            content = content[:len(content) // 2]
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+class TestBatchedRegretAnalysis:
+    def make_service(self, max_batch):
+        service = chat.ChatService.__new__(chat.ChatService)
+        service.dedalus_client = FakeDedalusClient(max_batch)
+        return service
+
+    def transactions(self, count):
+        return [
+            {"transaction_id": f"b{i}", "name": "Shop", "amount": 5.0, "date": "2026-03-01", "category": ["Shops"]}
+            for i in range(count)
+        ]
+
+    def test_scores_batch_in_one_call(self):
+        service = self.make_service(max_batch=10)
+        results = asyncio.run(service.analyze_transaction_regrets(self.transactions(4), {"user_goals": "Save"}))
+        assert service.dedalus_client.batch_sizes == [4]
+        assert results["b2"] == {"score": 100, "reason": "Big spend"}
+        assert len(results) == 4
+
+    def test_unparseable_reply_splits_batch(self):
+        service = self.make_service(max_batch=2)
+        results = asyncio.run(service.analyze_transaction_regrets(self.transactions(8), {}))
+        assert sorted(results) == [f"b{i}" for i in range(8)]
+        assert service.dedalus_client.batch_sizes == [8, 4, 2, 2, 4, 2, 2]
+
+    def test_single_analysis_raises_without_score(self):
+        service = self.make_service(max_batch=0)
+        with pytest.raises(ValueError):
+            asyncio.run(service.analyze_transaction_regret(self.transactions(1)[0], {}))
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
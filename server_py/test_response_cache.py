@@ -0,0 +1,127 @@
+"""
+Test suite for the single-flight response cache
+"""
+
+import asyncio
+import pytest
+import sys
+from pathlib import Path
+
+# Add server_py to path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from response_cache import ResponseCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class CountingLoader:
+    def __init__(self, delay=0.0, fail=False):
+        self.delay = delay
+        self.fail = fail
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("upstream down")
+        return f"value-{self.calls}"
+
+
+class TestResponseCache:
+    def test_concurrent_misses_share_one_load(self):
+        cache = ResponseCache(ttl=30)
+        load = CountingLoader(delay=0.05)
+
+        async def scenario():
+            return await asyncio.gather(*(cache.get("accounts", load) for _ in range(10)))
+
+        assert asyncio.run(scenario()) == ["value-1"] * 10
+        assert load.calls == 1
+        assert cache.stats["misses"] == 1
+        assert cache.stats["coalesced"] == 9
+
+    def test_fresh_then_stale_then_expired(self):
+        clock = FakeClock()
+        cache = ResponseCache(ttl=30, stale_ttl=300, clock=clock)
+        load = CountingLoader()
+
+        async def scenario():
+            first = await cache.get("k", load)
+            clock.now += 10
+            fresh = await cache.get("k", load)
+            clock.now += 30
+            # Past the TTL: served stale at once while a refresh runs behind it
+            stale = await cache.get("k", load)
+            await asyncio.sleep(0)
+            await asyncio.sleep(0)
+            refreshed = await cache.get("k", load)
+            clock.now += 1000
+            expired = await cache.get("k", load)
+            return first, fresh, stale, refreshed, expired
+
+        assert asyncio.run(scenario()) == ("value-1", "value-1", "value-1", "value-2", "value-3")
+        assert cache.stats["stale_hits"] == 1
+
+    def test_failures_are_not_cached_and_keep_stale_value(self):
+        clock = FakeClock()
+        cache = ResponseCache(ttl=30, stale_ttl=300, clock=clock)
+
+        async def scenario():
+            with pytest.raises(RuntimeError):
+                await cache.get("k", CountingLoader(fail=True))
+            value = await cache.get("k", CountingLoader())
+            clock.now += 60
+            stale = await cache.get("k", CountingLoader(fail=True))
+            await asyncio.sleep(0)
+            await asyncio.sleep(0)
+            still_stale = await cache.get("k", CountingLoader())
+            return value, stale, still_stale
+
+        assert asyncio.run(scenario()) == ("value-1", "value-1", "value-1")
+        assert cache.stats["refresh_errors"] == 1
+
+    def test_invalidate_drops_entry_and_in_flight_load(self):
+        cache = ResponseCache(ttl=30)
+
+        async def scenario():
+            await cache.get(("balance", "item_a"), CountingLoader())
+            await cache.get(("balance", "item_b"), CountingLoader())
+            slow = CountingLoader(delay=0.05)
+            in_flight = asyncio.create_task(cache.get(("accounts", "item_a"), slow))
+            await asyncio.sleep(0)
+            cache.invalidate_where(lambda key: key[1] == "item_a")
+            assert await in_flight == "value-1"
+
+            reload = CountingLoader()
+            a = await cache.get(("accounts", "item_a"), reload)
+            b = await cache.get(("balance", "item_a"), reload)
+            kept = await cache.get(("balance", "item_b"), CountingLoader())
+            return a, b, kept, reload.calls
+
+        # The load that straddled the invalidation was not cached
+        assert asyncio.run(scenario()) == ("value-1", "value-2", "value-1", 2)
+
+    def test_evicts_least_recently_used(self):
+        cache = ResponseCache(ttl=30, max_entries=2)
+        load = CountingLoader()
+
+        async def scenario():
+            await cache.get("a", load)
+            await cache.get("b", load)
+            await cache.get("a", load)
+            await cache.get("c", load)
+            return await cache.get("a", load), await cache.get("b", load)
+
+        assert asyncio.run(scenario()) == ("value-1", "value-4")
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])